@@ -0,0 +1,19 @@
+"""
+ASGI config for backend project.
+
+Serves the push endpoints (projects.push) and hands other requests to the WSGI application
+in a thread pool, so one process can serve both, e.g. uvicorn backend.asgi:application
+"""
+
+import os
+
+import django
+from asgiref.wsgi import WsgiToAsgi
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+django.setup()
+
+from backend.wsgi import application as wsgi_application  # noqa: E402
+from projects.push import PushApplication  # noqa: E402
+
+application = PushApplication(fallback=WsgiToAsgi(wsgi_application))
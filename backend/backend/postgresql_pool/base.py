@@ -0,0 +1,149 @@
+"""
+PostgreSQL backend which takes connections from a bounded pool of the process instead of opening them.
+Django closes the connection of a thread at the end of each request (CONN_MAX_AGE = 0),
+which returns it to the pool rolled back, so threads share POOL['MAX_SIZE'] connections.
+Connections of different databases never share a pool, the test database and DATABASES overridden in tests
+get their own pools, and idle connections are closed before test databases are dropped or cloned.
+Pools are dropped in forked processes, a preloaded master never shares its connections with workers
+"""
+import os
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from django.core.signals import setting_changed
+from django.db.backends.postgresql import base
+from django.dispatch import receiver
+from psycopg2 import extensions
+
+from backend.postgresql_pool.creation import DatabaseCreation
+from backend.postgresql_pool.pool import ConnectionPool, PoolTimeout
+
+Database = base.Database
+
+_pools = OrderedDict()
+_lock = threading.Lock()
+
+
+def check(connection):
+    """health check of an idle connection"""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        return True
+    except Database.Error:
+        return False
+
+
+def reset(connection):
+    """ends the transaction of a released connection, False if the connection is broken"""
+    if connection.closed:
+        return False
+    status = connection.get_transaction_status()
+    if status == extensions.TRANSACTION_STATUS_IDLE:
+        return True
+    if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+        return False
+    try:
+        connection.rollback()
+        return True
+    except Database.Error:
+        return False
+
+
+def pool_key(settings_dict):
+    """the database which the connections of a pool are opened to, aliases of one database share the pool"""
+    return tuple(str(settings_dict.get(name) or '') for name in ('USER', 'HOST', 'PORT', 'NAME'))
+
+
+def close_held_cursors(connection):
+    """
+    ends the transaction and closes cursors WITH HOLD, which outlive it, e.g. of an .iterator() whose
+    response stream was aborted. Closes connections which can't be reset
+    """
+    if reset(connection):
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('CLOSE ALL')
+            return
+        except Database.Error:
+            pass
+    connection.close()
+
+
+def get_pool(settings_dict):
+    key = pool_key(settings_dict)
+    with _lock:
+        pool = _pools.get(key)
+        if pool is None:
+            options = settings_dict.get('POOL', {})
+            pool = _pools[key] = ConnectionPool(
+                options.get('MAX_SIZE', 4), timeout=options.get('TIMEOUT', 10.0),
+                check_after=options.get('CHECK_AFTER', 30.0), max_lifetime=options.get('MAX_LIFETIME', 1800.0),
+                check=check, reset=reset)
+        return pool
+
+
+def pool_stats():
+    """utilization and wait times of the pools of this process by user@host:port/database"""
+    with _lock:
+        pools = list(_pools.items())
+    return OrderedDict(('{}@{}:{}/{}'.format(*key), pool.stats()) for key, pool in pools)
+
+
+def close_idle():
+    with _lock:
+        pools = list(_pools.values())
+    for pool in pools:
+        pool.close_idle()
+
+
+def forget_pools():
+    for pool in _pools.values():
+        pool.forget()
+    _pools.clear()
+
+
+@receiver(setting_changed)
+def databases_changed(setting, **kwargs):
+    """connections of the databases configured before an override are not used again"""
+    if setting == 'DATABASES':
+        close_idle()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=close_idle, after_in_child=forget_pools)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    creation_class = DatabaseCreation
+
+    @property
+    def pool(self):
+        # NAME changes when the test database is created and destroyed
+        return get_pool(self.settings_dict)
+
+    # a named cursor was opened WITH HOLD on the connection, it must be closed before the connection is reused
+    held_cursors = False
+
+    def get_new_connection(self, conn_params):
+        try:
+            connection = self.pool.acquire(partial(super().get_new_connection, conn_params))
+        except PoolTimeout as e:
+            raise Database.OperationalError(str(e)) from e
+        self.isolation_level = self.settings_dict['OPTIONS'].get('isolation_level', connection.isolation_level)
+        self.held_cursors = False
+        return connection
+
+    def create_cursor(self, name=None):
+        # named cursors (.iterator()) are opened WITH HOLD outside transactions
+        if name is not None and self.connection.autocommit:
+            self.held_cursors = True
+        return super().create_cursor(name)
+
+    def _close(self):
+        if self.connection is not None:
+            if self.held_cursors:
+                close_held_cursors(self.connection)
+                self.held_cursors = False
+            self.pool.release(self.connection)
@@ -0,0 +1,26 @@
+from django.db.backends.postgresql import creation
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    """
+    Closes idle pooled connections before test databases are dropped or used as a template,
+    PostgreSQL refuses both while other sessions are connected to the database
+    """
+
+    def close_idle(self):
+        from backend.postgresql_pool.base import close_idle
+
+        close_idle()
+
+    def _create_test_db(self, verbosity, autoclobber, keepdb=False):
+        # an old test database is dropped when it exists
+        self.close_idle()
+        return super()._create_test_db(verbosity, autoclobber, keepdb)
+
+    def _clone_test_db(self, suffix, verbosity, keepdb=False):
+        self.close_idle()
+        super()._clone_test_db(suffix, verbosity, keepdb)
+
+    def _destroy_test_db(self, test_database_name, verbosity):
+        self.close_idle()
+        super()._destroy_test_db(test_database_name, verbosity)
@@ -0,0 +1,163 @@
+"""
+Bounded pool of database connections shared by the threads of a process.
+Connections idle for longer than check_after seconds are checked before reuse,
+connections older than max_lifetime are replaced, and callers wait up to timeout seconds
+for a connection when max_size connections are open
+"""
+import threading
+import time
+from collections import deque, OrderedDict
+
+COUNTERS = ('acquired', 'waits', 'timeouts', 'created', 'closed', 'checks', 'failed_checks', 'peak_in_use')
+
+
+class PoolTimeout(Exception):
+    pass
+
+
+def close(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+
+class ConnectionPool:
+    def __init__(self, max_size, timeout=10.0, check_after=30.0, max_lifetime=1800.0, check=None, reset=None,
+                 clock=time.monotonic):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.check_after = check_after
+        self.max_lifetime = max_lifetime
+        # check(connection) and reset(connection) return False for connections which can't be used again
+        self.check = check or (lambda connection: True)
+        self.reset = reset or (lambda connection: True)
+        self.clock = clock
+        self.condition = threading.Condition()
+        self.idle = deque()
+        self.created_at = {}
+        self.creating = 0
+        self.in_use = 0
+        self.waiting = 0
+        self.counters = OrderedDict((name, 0) for name in COUNTERS)
+        self.wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    @property
+    def size(self):
+        """open connections and connections being opened"""
+        return len(self.created_at) + self.creating
+
+    def acquire(self, connect):
+        """an idle connection of the pool, or a new one made by connect() while the pool is not full"""
+        start = self.clock()
+        with self.condition:
+            while not self.idle and self.size >= self.max_size:
+                remaining = self.timeout - (self.clock() - start)
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f'No database connection was released in {self.timeout} s, '
+                                      f'all {self.max_size} connections are in use')
+                self.waiting += 1
+                try:
+                    self.condition.wait(remaining)
+                finally:
+                    self.waiting -= 1
+            self.record_wait(self.clock() - start)
+            # the most recently used connection is the least likely to be broken
+            if self.idle:
+                connection, released_at = self.idle.pop()
+            else:
+                connection = None
+                self.creating += 1
+        if connection is not None and not self.usable(connection, released_at):
+            with self.condition:
+                self.drop(connection)
+                self.creating += 1
+            close(connection)
+            connection = None
+        if connection is None:
+            try:
+                connection = connect()
+            except BaseException:
+                with self.condition:
+                    self.creating -= 1
+                    self.condition.notify()
+                raise
+            with self.condition:
+                self.creating -= 1
+                self.created_at[connection] = self.clock()
+                self.counters['created'] += 1
+        with self.condition:
+            self.in_use += 1
+            self.counters['acquired'] += 1
+            self.counters['peak_in_use'] = max(self.counters['peak_in_use'], self.in_use)
+        return connection
+
+    def usable(self, connection, released_at):
+        now = self.clock()
+        if now - self.created_at[connection] >= self.max_lifetime:
+            return False
+        if now - released_at < self.check_after:
+            return True
+        self.counters['checks'] += 1
+        if self.check(connection):
+            return True
+        self.counters['failed_checks'] += 1
+        return False
+
+    def release(self, connection):
+        """returns the connection to the pool, or closes it if it can't be reset"""
+        usable = self.reset(connection)
+        with self.condition:
+            self.in_use -= 1
+            keep = usable and connection in self.created_at and \
+                self.clock() - self.created_at[connection] < self.max_lifetime
+            if keep:
+                self.idle.append((connection, self.clock()))
+            else:
+                self.drop(connection)
+            self.condition.notify()
+        if not keep:
+            close(connection)
+
+    def drop(self, connection):
+        self.created_at.pop(connection, None)
+        self.counters['closed'] += 1
+
+    def close_idle(self):
+        with self.condition:
+            idle = [connection for connection, released_at in self.idle]
+            self.idle.clear()
+            for connection in idle:
+                self.drop(connection)
+        for connection in idle:
+            close(connection)
+
+    def forget(self):
+        """drops all connections without closing them, they belong to the parent of a forked process"""
+        with self.condition:
+            self.idle.clear()
+            self.created_at.clear()
+            self.creating = self.in_use = self.waiting = 0
+
+    def record_wait(self, seconds):
+        if seconds > 0.001:
+            self.counters['waits'] += 1
+        self.wait_time += seconds
+        self.max_wait_time = max(self.max_wait_time, seconds)
+
+    def stats(self):
+        with self.condition:
+            acquired = self.counters['acquired']
+            return OrderedDict([
+                ('max_size', self.max_size),
+                ('size', self.size),
+                ('in_use', self.in_use),
+                ('idle', len(self.idle)),
+                ('waiting', self.waiting),
+                ('utilization', round(self.in_use / self.max_size, 3)),
+                *self.counters.items(),
+                ('avg_wait_ms', round(self.wait_time / acquired * 1000, 3) if acquired else 0),
+                ('max_wait_ms', round(self.max_wait_time * 1000, 3)),
+            ])
@@ -0,0 +1,110 @@
+import threading
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.test import TestCase
+from psycopg2 import extensions
+from rest_framework.test import APIClient
+
+from backend.postgresql_pool.base import DatabaseWrapper, get_pool, pool_stats, forget_pools
+from backend.postgresql_pool.pool import ConnectionPool, PoolTimeout
+from profiles.models import User
+
+
+class FakeConnection:
+    def __init__(self):
+        self.closed = False
+        self.executed = []
+
+    def close(self):
+        self.closed = True
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+    def execute(self, sql):
+        self.executed.append(sql)
+
+
+class ConnectionPoolTestCase(TestCase):
+    def setUp(self):
+        self.now = 0.0
+        self.healthy = True
+        self.pool = ConnectionPool(2, timeout=0, check_after=30, max_lifetime=100, check=lambda c: self.healthy,
+                                   clock=lambda: self.now)
+
+    def test_bounded_reuse(self):
+        first, _ = self.pool.acquire(FakeConnection), self.pool.acquire(FakeConnection)
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire(FakeConnection)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(FakeConnection), first)
+        stats = self.pool.stats()
+        self.assertEqual((stats['size'], stats['in_use'], stats['created'], stats['timeouts'], stats['utilization']),
+                         (2, 2, 2, 1, 1))
+
+    def test_checks_and_lifetime(self):
+        connection = self.pool.acquire(FakeConnection)
+        self.pool.release(connection)
+        self.now = 40
+        self.healthy = False
+        replaced = self.pool.acquire(FakeConnection)
+        self.assertIsNot(replaced, connection)
+        self.assertTrue(connection.closed)
+        self.pool.release(replaced)
+        self.now = 150
+        self.assertTrue(self.pool.acquire(FakeConnection) is not replaced and replaced.closed)
+        stats = self.pool.stats()
+        self.assertEqual((stats['checks'], stats['failed_checks'], stats['closed'], stats['size']), (1, 1, 2, 1))
+
+    def test_waits_for_release(self):
+        pool = ConnectionPool(1, timeout=5)
+        connection = pool.acquire(FakeConnection)
+        timer = threading.Timer(0.05, pool.release, [connection])
+        timer.start()
+        self.assertIs(pool.acquire(FakeConnection), connection)
+        timer.join()
+        stats = pool.stats()
+        self.assertEqual((stats['waits'], stats['created']), (1, 1))
+        self.assertGreater(stats['max_wait_ms'], 0)
+
+    def test_pools_of_databases(self):
+        self.addCleanup(forget_pools)
+        database = {'NAME': 'backlog', 'USER': 'backlog', 'HOST': 'localhost', 'PORT': 5432}
+        pool = get_pool(database)
+        self.assertIs(get_pool(dict(database, POOL={'MAX_SIZE': 8})), pool)
+        self.assertIsNot(get_pool(dict(database, NAME='test_backlog')), pool)
+        self.assertEqual(list(pool_stats()), ['backlog@localhost:5432/backlog', 'backlog@localhost:5432/test_backlog'])
+        connection = pool.acquire(FakeConnection)
+        pool.release(connection)
+        setting_changed.send(sender=self.__class__, setting='DATABASES', value=settings.DATABASES, enter=False)
+        self.assertTrue(connection.closed)
+        self.assertEqual(pool.stats()['size'], 0)
+
+    def test_held_cursors_are_closed(self):
+        self.addCleanup(forget_pools)
+        wrapper = DatabaseWrapper({**settings.DATABASES['default'], 'NAME': 'backlog', 'USER': 'backlog',
+                                   'HOST': 'localhost', 'PORT': 5432}, 'pooled')
+        for held_cursors in (True, False):
+            wrapper.connection = wrapper.pool.acquire(FakeConnection)
+            wrapper.held_cursors = held_cursors
+            wrapper._close()
+        connection, = [connection for connection, released_at in wrapper.pool.idle]
+        self.assertEqual(connection.executed, ['CLOSE ALL'])
+        self.assertEqual(wrapper.pool.stats()['idle'], 1)
+
+    def test_stats_view(self):
+        user = User.objects.create_user(username='admin', is_staff=True)
+        client = APIClient()
+        self.assertEqual(client.get('/db-pools/').status_code, 401)
+        client.force_authenticate(user)
+        self.assertEqual(client.get('/db-pools/').data['pools'], {})
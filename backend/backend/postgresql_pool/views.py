@@ -0,0 +1,18 @@
+import os
+
+from rest_framework import permissions
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from backend.postgresql_pool.base import pool_stats
+
+
+class PoolStatsView(APIView):
+    """
+    Utilization and wait times of the database connection pools of the worker process
+    which serves the request, empty when pooling is disabled
+    """
+    permission_classes = [permissions.IsAdminUser]
+
+    def get(self, request):
+        return Response({'pid': os.getpid(), 'pools': pool_stats()})
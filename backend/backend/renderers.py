@@ -0,0 +1,96 @@
+"""
+Renderers and parsers selected by Accept and Content-Type.
+JSON is encoded with orjson when it is installed and falls back to the DRF implementation otherwise,
+values orjson can't encode (datetimes, decimals, lazy strings) are converted by the DRF encoder,
+so the output is the same as the output of the DRF JSONRenderer
+"""
+from django.conf import settings
+from rest_framework import renderers, parsers
+from rest_framework.exceptions import ParseError
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+LINE_SEPARATORS = ((b'\xe2\x80\xa8', b'\\u2028'), (b'\xe2\x80\xa9', b'\\u2029'))
+
+
+def encode_default(obj):
+    """values which are not JSON or MessagePack types, converted as the DRF JSON encoder does"""
+    return JSONEncoder().default(obj)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """
+    JSON renderer which uses orjson for compact output
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or not self.compact or self.ensure_ascii or \
+                self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+        if data is None:
+            return b''
+        ret = orjson.dumps(data, default=encode_default,
+                           option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+        # the DRF renderer escapes line separators to output a strict javascript subset
+        for separator, escaped in LINE_SEPARATORS:
+            if separator in ret:
+                ret = ret.replace(separator, escaped)
+        return ret
+
+
+class JSONParser(parsers.JSONParser):
+    """
+    JSON parser which uses orjson for UTF-8 requests
+    """
+    renderer_class = JSONRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get('encoding', settings.DEFAULT_CHARSET)
+        if orjson is None or encoding.lower().replace('-', '') != 'utf8':
+            return super().parse(stream, media_type, parser_context)
+        try:
+            return orjson.loads(stream.read())
+        except ValueError as exc:
+            raise ParseError('JSON parse error - %s' % str(exc))
+
+
+class MessagePackRenderer(renderers.BaseRenderer):
+    """
+    MessagePack renderer, datetimes and decimals are encoded as in JSON
+    """
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return msgpack.packb(data, default=encode_default, use_bin_type=True)
+
+
+def reject_ext_type(code, data):
+    raise ValueError(f'Unsupported extension type {code}')
+
+
+class MessagePackParser(parsers.BaseParser):
+    """
+    MessagePack parser, extension types are not accepted
+    """
+    media_type = 'application/msgpack'
+    renderer_class = MessagePackRenderer
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return msgpack.unpackb(stream.read(), raw=False, ext_hook=reject_ext_type)
+        except (TypeError, ValueError) as exc:
+            raise ParseError('MessagePack parse error - %s' % str(exc))
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/2.2/ref/settings/
 """
 
 import os
+from importlib.util import find_spec
 
 import dj_database_url
 from decouple import config
@@ -34,6 +35,18 @@ REST_FRAMEWORK = {
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
     'PAGE_SIZE': 10,
+    # MessagePack is negotiated with Accept / Content-Type: application/msgpack when msgpack is installed
+    'DEFAULT_RENDERER_CLASSES': [
+        'backend.renderers.JSONRenderer',
+        *(['backend.renderers.MessagePackRenderer'] if find_spec('msgpack') else []),
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+    'DEFAULT_PARSER_CLASSES': [
+        'backend.renderers.JSONParser',
+        *(['backend.renderers.MessagePackParser'] if find_spec('msgpack') else []),
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
 }
 ACCOUNT_LOGOUT_ON_GET = False
 ACCOUNT_EMAIL_REQUIRED = True
@@ -117,9 +130,63 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 
 DATABASES = {
     'default': dj_database_url.config(
-        default=config('DATABASE_URL')
+        default=config('DATABASE_URL'),
+        conn_max_age=config('DATABASE_CONN_MAX_AGE', default=600, cast=int),
     )
 }
+# PostgreSQL connections are taken from a bounded pool of each process (backend/postgresql_pool) of
+# DATABASE_POOL_SIZE connections, idle connections are checked with SELECT 1 before reuse.
+# The pool is opt-in, 0 keeps a persistent connection per thread for DATABASE_CONN_MAX_AGE seconds
+DATABASE_POOL_SIZE = config('DATABASE_POOL_SIZE', default=0, cast=int)
+if DATABASE_POOL_SIZE and DATABASES['default']['ENGINE'] in ('django.db.backends.postgresql',
+                                                             'django.db.backends.postgresql_psycopg2'):
+    DATABASES['default'].update(ENGINE='backend.postgresql_pool', CONN_MAX_AGE=0, POOL={
+        'MAX_SIZE': DATABASE_POOL_SIZE,
+        'TIMEOUT': config('DATABASE_POOL_TIMEOUT', default=10.0, cast=float),
+        'CHECK_AFTER': config('DATABASE_POOL_CHECK_AFTER', default=30.0, cast=float),
+        'MAX_LIFETIME': config('DATABASE_POOL_MAX_LIFETIME', default=1800.0, cast=float),
+    })
+# Behind PgBouncer in transaction pooling mode consecutive transactions may run on different server
+# connections, so cursors of .iterator() must not outlive their transaction. Session settings are lost too,
+# the database role should have TimeZone set to UTC so connections don't need SET TIME ZONE
+DATABASES['default']['DISABLE_SERVER_SIDE_CURSORS'] = config('DATABASE_PGBOUNCER_TRANSACTION_MODE', default=False,
+                                                             cast=bool)
+
+# Cache
+# Local memory cache is per process, use a file based or a shared cache for several workers
+# https://docs.djangoproject.com/en/2.2/topics/cache/
+
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='collections'),
+    }
+}
+
+# Seconds to keep user roles used by permission checks in the cache, 0 disables the cache
+TEAM_ROLES_CACHE_TIMEOUT = config('TEAM_ROLES_CACHE_TIMEOUT', default=300, cast=int)
+
+# Serialized collection and list trees kept in process, 0 disables the cache
+TREE_CACHE_SIZE = config('TREE_CACHE_SIZE', default=1000, cast=int)
+# Optional alias of CACHES shared by processes and seconds to keep trees there
+TREE_CACHE_ALIAS = config('TREE_CACHE_ALIAS', default='') or None
+TREE_CACHE_TIMEOUT = config('TREE_CACHE_TIMEOUT', default=3600, cast=int)
+
+# Days to keep raw device readings and per-minute and per-hour rollups, per-day rollups are kept forever
+TELEMETRY_RAW_RETENTION_DAYS = config('TELEMETRY_RAW_RETENTION_DAYS', default=7, cast=int)
+TELEMETRY_MINUTE_RETENTION_DAYS = config('TELEMETRY_MINUTE_RETENTION_DAYS', default=30, cast=int)
+TELEMETRY_HOUR_RETENTION_DAYS = config('TELEMETRY_HOUR_RETENTION_DAYS', default=365, cast=int)
+# Devices whose rule engine states are kept in process, states of other devices are read from their checkpoints
+DEVICE_RULES_CACHE_SIZE = config('DEVICE_RULES_CACHE_SIZE', default=10000, cast=int)
+
+# Broker of board change events pushed to WebSocket and event stream connections (backend/asgi.py),
+# the in-process LocalBroker needs a single ASGI worker (gunicorn.conf.py),
+# events queued for a connection before it is told to resync and seconds between event stream pings
+PUSH_BROKER = config('PUSH_BROKER', default='projects.push.LocalBroker')
+PUSH_QUEUE_SIZE = config('PUSH_QUEUE_SIZE', default=256, cast=int)
+PUSH_HEARTBEAT_SECONDS = config('PUSH_HEARTBEAT_SECONDS', default=15, cast=int)
+# Seconds between checks that the user of a push connection is still a member of the teams of its topics
+PUSH_AUTHORIZE_SECONDS = config('PUSH_AUTHORIZE_SECONDS', default=300, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
@@ -0,0 +1,45 @@
+import io
+from collections import OrderedDict
+from decimal import Decimal
+from unittest import skipIf
+
+from django.utils import timezone
+from rest_framework.exceptions import ParseError
+from rest_framework.renderers import JSONRenderer
+
+from backend import renderers
+from projects.tests import ProjectsTestCase
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class RenderersTestCase(ProjectsTestCase):
+    def test_json_matches_drf_renderer(self):
+        data = {'date': timezone.now(), 'decimal': Decimal('1.50'), 'text': 'line\u2028break \u00e9',
+                'items': [OrderedDict(pk=1)], 'included': {1: None}}
+        self.assertEqual(renderers.JSONRenderer().render(data), JSONRenderer().render(data))
+        self.assertEqual(renderers.JSONParser().parse(io.BytesIO(b'{"a": [1, "\\u00e9"]}')), {'a': [1, '\u00e9']})
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_msgpack_is_negotiated(self):
+        self.create_item(list=self.list)
+        response = self.client.get(f'/lists/{self.list.pk}/items/', HTTP_ACCEPT='application/msgpack')
+        self.assertEqual(response['Content-Type'], 'application/msgpack')
+        self.assertEqual(msgpack.unpackb(response.content)['items'][0]['name'], 'task')
+
+        body = msgpack.packb([{'name': 'packed', 'end_date': '2020-01-01T00:00:00Z'}])
+        response = self.client.post(f'/lists/{self.list.pk}/add_items/', body, content_type='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(self.list.items.filter(name='packed').exists())
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_malformed_msgpack_is_rejected(self):
+        for body in (b'\x81\x91\x01\x01', msgpack.packb({'a': msgpack.ExtType(5, b'x')}), b'\xc1', b'\x92\x01'):
+            with self.assertRaises(ParseError):
+                renderers.MessagePackParser().parse(io.BytesIO(body))
+        response = self.client.post(f'/lists/{self.list.pk}/add_items/', b'\x81\x91\x01\x01',
+                                    content_type='application/msgpack')
+        self.assertEqual(response.status_code, 400)
@@ -3,6 +3,7 @@ from django.contrib import admin
 from django.urls import path, re_path
 from rest_framework_swagger.views import get_swagger_view
 
+from backend.postgresql_pool.views import PoolStatsView
 from projects.urls import collections_router, lists_router, items_router
 
 schema_view = get_swagger_view(title='Collections API')
@@ -11,8 +12,10 @@ urlpatterns = [
     url(r'^$', schema_view, name='api'),
     re_path(r'teams/', include('profiles.urls')),
     re_path(r'rest-auth/', include('profiles.auth_urls')),
+    re_path(r'telemetry/', include('profiles.telemetry_urls')),
     re_path(r'collections/', include(collections_router.urls)),
     re_path(r'lists/', include(lists_router.urls)),
     re_path(r'items/', include(items_router.urls)),
+    re_path(r'^db-pools/$', PoolStatsView.as_view(), name='db_pools'),
     path('admin/', admin.site.urls)
 ]
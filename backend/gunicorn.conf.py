@@ -0,0 +1,79 @@
+"""
+Gunicorn config of the production server, settings come from the environment (decouple).
+
+ASGI:  gunicorn -c backend/gunicorn.conf.py -k uvicorn.workers.UvicornWorker backend.asgi:application
+WSGI:  gunicorn -c backend/gunicorn.conf.py backend.wsgi:application
+
+The Procfile runs the ASGI application, which serves the push endpoints and the API in one process,
+so push events of writes reach the subscribers of the same process. A WSGI server has no push endpoints.
+
+The application is loaded once in the master and workers are forked from it, so they start warm
+and share its memory copy-on-write. Workers are replaced after GUNICORN_MAX_REQUESTS requests,
+requests which take longer than GUNICORN_TIMEOUT seconds get their worker restarted, and
+SIGHUP reloads the workers gracefully (a new master with USR2 + QUIT reloads the code too).
+
+Workers share invalidations of cached roles through the default cache, so several workers need
+a cache shared by processes (CACHE_BACKEND, e.g. memcached, redis or the database cache). With the default
+per-process LocMemCache there is one worker and the server refuses to start more.
+Push connections (ASGI workers) only get events of their own process from the in-process PUSH_BROKER,
+so they need a single ASGI worker until a shared broker is configured. Several workers are started by default
+only with a shared cache and a shared PUSH_BROKER, a WSGI server with a shared cache sets GUNICORN_WORKERS
+"""
+import gc
+import multiprocessing
+import os
+
+import decouple
+
+chdir = os.path.dirname(os.path.abspath(__file__))
+bind = decouple.config('GUNICORN_BIND', default=f'0.0.0.0:{decouple.config("PORT", default="8000")}')
+# caches of one process, their invalidations don't reach other workers
+PER_PROCESS_CACHES = ('django.core.cache.backends.locmem.LocMemCache',)
+LOCAL_BROKER = 'projects.push.LocalBroker'
+shared_cache = decouple.config('CACHE_BACKEND', default=PER_PROCESS_CACHES[0]) not in PER_PROCESS_CACHES
+shared_broker = decouple.config('PUSH_BROKER', default=LOCAL_BROKER) != LOCAL_BROKER
+workers = decouple.config('GUNICORN_WORKERS', cast=int,
+                          default=multiprocessing.cpu_count() * 2 + 1 if shared_cache and shared_broker else 1)
+# threads of gthread workers, ASGI workers serve concurrent requests on their event loop
+worker_class = decouple.config('GUNICORN_WORKER_CLASS', default='gthread')
+threads = decouple.config('GUNICORN_THREADS', default=4, cast=int)
+timeout = decouple.config('GUNICORN_TIMEOUT', default=30, cast=int)
+graceful_timeout = decouple.config('GUNICORN_GRACEFUL_TIMEOUT', default=30, cast=int)
+keepalive = decouple.config('GUNICORN_KEEPALIVE', default=5, cast=int)
+max_requests = decouple.config('GUNICORN_MAX_REQUESTS', default=1000, cast=int)
+max_requests_jitter = decouple.config('GUNICORN_MAX_REQUESTS_JITTER', default=100, cast=int)
+preload_app = decouple.config('GUNICORN_PRELOAD', default=True, cast=bool)
+accesslog = decouple.config('GUNICORN_ACCESS_LOG', default='-') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    """refuses to start several workers which wouldn't see changes made by each other"""
+    if server.cfg.workers <= 1:
+        return
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'backend.settings')
+    from django.conf import settings
+
+    if settings.CACHES['default']['BACKEND'] in PER_PROCESS_CACHES:
+        raise RuntimeError(f'{server.cfg.workers} workers need a cache shared by processes, '
+                           f'set CACHE_BACKEND or start one worker (GUNICORN_WORKERS=1)')
+    if 'uvicorn' in server.cfg.worker_class_str and settings.PUSH_BROKER == LOCAL_BROKER:
+        raise RuntimeError(f'Push connections of {server.cfg.workers} ASGI workers need a shared PUSH_BROKER, '
+                           f'start one ASGI worker (GUNICORN_WORKERS=1)')
+
+
+def when_ready(server):
+    """warms up the preloaded application before workers are forked"""
+    if not preload_app:
+        return
+    from django.db import connections
+    from django.urls import get_resolver
+
+    # imports all views and serializers instead of doing it on the first request of each worker
+    get_resolver().url_patterns
+    # connections opened while loading must not be shared by the workers
+    connections.close_all()
+    # objects of the master are not tracked by the collector of the workers,
+    # so collections don't write to the shared pages
+    gc.freeze()
+    server.log.info('Application is preloaded, %d objects frozen', gc.get_freeze_count())
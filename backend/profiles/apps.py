@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class ProfilesConfig(AppConfig):
     name = 'profiles'
+
+    def ready(self):
+        import profiles.roles  # noqa: F401 connects cache invalidation signals
+        import profiles.rules  # noqa: F401 connects the rule engine to new readings
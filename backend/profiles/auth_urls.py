@@ -1,9 +1,10 @@
 from django.conf.urls import url
 from django.urls import include
 
-from profiles.views import confirm_email
+from profiles.views import confirm_email, UserDetailsView
 
 urlpatterns = [
+    url(r'^user/$', UserDetailsView.as_view(), name='rest_user_details'),
     url(r'^', include('rest_auth.urls')),
     url(r'^reset/(?P<uidb64>[0-9A-Za-z]+)-(?P<token>.+)/$', confirm_email, name='password_reset_confirm'),
     # after registration user is sent to this url for email confirming
@@ -1,3 +1,8 @@
 class MemberException(Exception):
     """raised if user can't be a team member"""
     pass
+
+
+class TelemetryException(Exception):
+    """raised if a telemetry series can't be read as requested"""
+    pass
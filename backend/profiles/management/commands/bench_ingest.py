@@ -0,0 +1,55 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from backend.renderers import JSONRenderer, MessagePackRenderer
+from profiles.models import Device, Team
+from projects.benchmarks import rollback, seed_team, timer, report
+
+
+class Command(BaseCommand):
+    help = 'Measures the sustained rate of telemetry ingest against add_device'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--devices', type=int, default=50)
+        parser.add_argument('--readings', type=int, default=20000, help='readings sent to the ingest endpoint')
+        parser.add_argument('--batch', type=int, default=1000, help='readings per request')
+        parser.add_argument('--single', type=int, default=500, help='readings sent one by one to add_device')
+
+    def requests(self, keys, readings, batch):
+        """request bodies of `readings` compact readings spread over the devices"""
+        start = time.time()
+        per_device = max(batch // len(keys), 1)
+        for offset in range(0, readings, batch):
+            yield [{'key': key, 'readings': [[start + offset + i, 20 + i % 10, 40, 0.1] for i in range(per_device)]}
+                   for key in keys[:max(batch // per_device, 1)]]
+
+    def handle(self, *args, **options):
+        with rollback():
+            users, team, collection, lists = seed_team(users=1)
+            teams = [team] + [Team.objects.create(name=f'bench device {i}') for i in range(options['devices'] - 1)]
+            keys = []
+            for device_team in teams:
+                device = Device(team=device_team)
+                keys.append(device.set_key())
+                device.save()
+            client = APIClient()
+            client.force_authenticate(users[0])
+            results = {}
+            with timer(results, 'add_device'):
+                for i in range(options['single']):
+                    client.put(f'/teams/{team.pk}/add_device/', {'temperature': 20 + i % 10, 'humidity': 40,
+                                                                  'dosimeter': 0.1, 'timestamp': timezone.now()})
+            report(self.stdout, results, options['single'], unit='readings')
+
+            client = APIClient()
+            for name, renderer in (('ingest json', JSONRenderer()), ('ingest msgpack', MessagePackRenderer())):
+                results, sent = {}, 0
+                bodies = [renderer.render(body) for body in self.requests(keys, options['readings'], options['batch'])]
+                with timer(results, name):
+                    for body in bodies:
+                        response = client.post('/telemetry/ingest/', body, content_type=renderer.media_type)
+                        sent += response.data['created']
+                report(self.stdout, results, sent, unit='readings')
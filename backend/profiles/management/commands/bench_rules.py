@@ -0,0 +1,76 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from profiles.models import Device, DeviceReading, DeviceRule, Team
+from profiles.rules import RuleEngine
+from projects.benchmarks import rollback, timer, report
+
+DEFAULT_RULES = [
+    dict(metric='temperature', kind=DeviceRule.THRESHOLD, threshold=30, hysteresis=1, result=2, message='hot'),
+    dict(metric='temperature', kind=DeviceRule.AVERAGE, threshold=27, hysteresis=0.5, window=300, result=1,
+         message='warm'),
+    dict(metric='humidity', kind=DeviceRule.RATE, threshold=5, hysteresis=1, window=60, result=1,
+         message='humidity rises'),
+    dict(metric='dosimeter', kind=DeviceRule.THRESHOLD, threshold=0.5, result=3, message='radiation'),
+]
+
+
+class Command(BaseCommand):
+    help = ('Replays recorded readings of a device (or generated readings of --devices devices) '
+            'through the rule engine without writing results')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--device', type=int, help='replay the recorded readings of the device')
+        parser.add_argument('--devices', type=int, default=20)
+        parser.add_argument('--readings', type=int, default=100000, help='generated readings')
+        parser.add_argument('--batch', type=int, default=1000, help='readings per evaluated batch')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def generate(self, device_ids, count, seed):
+        """random walks of the metrics, one reading of each device every 5 seconds"""
+        rng = random.Random(seed)
+        start = timezone.now() - timedelta(seconds=5 * count // len(device_ids))
+        values = {pk: [25.0, 40.0, 0.1] for pk in device_ids}
+        readings = []
+        for i in range(count):
+            device_id = device_ids[i % len(device_ids)]
+            walk = values[device_id]
+            walk[0] += rng.gauss(0, 0.3)
+            walk[1] = max(0.0, walk[1] + rng.gauss(0, 0.5))
+            walk[2] = max(0.0, walk[2] + rng.gauss(0, 0.02))
+            readings.append(DeviceReading(device_id=device_id, timestamp=start + timedelta(seconds=5 * (i // len(
+                device_ids))), temperature=walk[0], humidity=walk[1], dosimeter=walk[2]))
+        return readings
+
+    def replay(self, engine, readings, batch):
+        results, transitions = {}, 0
+        with timer(results, 'rules', clock=time.process_time):
+            for offset in range(0, len(readings), batch):
+                changed, due = engine.evaluate(readings[offset:offset + batch])
+                transitions += len(changed)
+        report(self.stdout, results, len(readings), unit='readings')
+        self.stdout.write(f'{transitions} transitions of {len(engine.devices)} devices')
+
+    def handle(self, *args, **options):
+        engine = RuleEngine()
+        if options['device'] is not None:
+            device = Device.objects.filter(pk=options['device']).first()
+            if device is None:
+                raise CommandError('Device is not found')
+            engine.add_device(device.pk, device.team_id, DeviceRule.objects.filter(team_id=device.team_id,
+                                                                                   is_active=True).order_by('pk'))
+            readings = list(device.readings.order_by('timestamp', 'pk'))
+            self.replay(engine, readings, options['batch'])
+            return
+        with rollback():
+            team = Team.objects.create(name='bench rules')
+            rules = [DeviceRule.objects.create(team=team, **rule) for rule in DEFAULT_RULES]
+            device_ids = [Device.objects.create(team=team if not i else Team.objects.create(name=f'bench {i}')).pk
+                          for i in range(options['devices'])]
+        for device_id in device_ids:
+            engine.add_device(device_id, team.pk, rules)
+        self.replay(engine, self.generate(device_ids, options['readings'], options['seed']), options['batch'])
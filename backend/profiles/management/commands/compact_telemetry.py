@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from profiles.rollups import apply_retention
+
+
+class Command(BaseCommand):
+    help = 'Deletes device readings and rollups which are older than their TELEMETRY_*_RETENTION_DAYS'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000, help='rows deleted per transaction')
+
+    def handle(self, *args, **options):
+        for name, deleted in apply_retention(batch_size=options['batch_size']).items():
+            self.stdout.write(f'{name}: deleted {deleted}')
@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:19
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_team_creator(apps, schema_editor):
+    Team = apps.get_model('profiles', 'Team')
+    Membership = apps.get_model('profiles', 'Membership')
+    for team_id, user_id in Membership.objects.filter(is_creator=True, team__is_group=False).values_list('team',
+                                                                                                          'user'):
+        Team.objects.filter(models.Q(pk=team_id) | models.Q(team_id=team_id)).update(team_creator_id=user_id)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0007_auto_20200109_2341'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='team_creator',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='created_teams', to=settings.AUTH_USER_MODEL, verbose_name='Creator of the main team'),
+        ),
+        migrations.RunPython(fill_team_creator, migrations.RunPython.noop),
+    ]
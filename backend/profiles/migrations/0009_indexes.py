@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0008_team_creator'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(condition=models.Q(is_creator=True), fields=['team'], name='membership_creator_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='membership',
+            index=models.Index(fields=['user', 'team', 'is_manager', 'is_creator'], name='membership_user_roles_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['team', 'is_group'], name='teams_team_is_group_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(condition=models.Q(is_group=False), fields=['-date_created'], name='teams_main_date_idx'),
+        ),
+    ]
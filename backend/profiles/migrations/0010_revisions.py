@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:29
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0009_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='date_modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Date modified'),
+        ),
+        migrations.AddField(
+            model_name='team',
+            name='revision',
+            field=models.PositiveIntegerField(default=0, verbose_name='Revision of the team tree'),
+        ),
+    ]
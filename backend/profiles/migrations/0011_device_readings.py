@@ -0,0 +1,61 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:45
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def parse_reading(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def copy_latest_values(apps, schema_editor):
+    """the current values of each device become its first reading"""
+    Device = apps.get_model('profiles', 'Device')
+    DeviceReading = apps.get_model('profiles', 'DeviceReading')
+    for device in Device.objects.all():
+        reading = DeviceReading.objects.create(
+            device=device, temperature=parse_reading(device.temperature), humidity=parse_reading(device.humidity),
+            dosimeter=parse_reading(device.dosimeter), message=device.message, result=device.result)
+        Device.objects.filter(pk=device.pk).update(latest_reading=reading)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0010_revisions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceReading',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField(default=django.utils.timezone.now)),
+                ('temperature', models.FloatField(blank=True, null=True)),
+                ('humidity', models.FloatField(blank=True, null=True)),
+                ('dosimeter', models.FloatField(blank=True, null=True)),
+                ('message', models.CharField(blank=True, default='', max_length=255)),
+                ('result', models.SmallIntegerField(blank=True, null=True)),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='readings', to='profiles.Device')),
+            ],
+            options={
+                'verbose_name': 'Device reading',
+                'verbose_name_plural': 'Device readings',
+                'db_table': 'device_readings',
+            },
+        ),
+        migrations.AddField(
+            model_name='device',
+            name='latest_reading',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='profiles.DeviceReading'),
+        ),
+        migrations.AddIndex(
+            model_name='devicereading',
+            index=models.Index(fields=['device', 'timestamp'], name='device_readings_time_idx'),
+        ),
+        migrations.RunPython(copy_latest_values, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0011_device_readings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='key_hash',
+            field=models.CharField(blank=True, editable=False, max_length=64, null=True, unique=True),
+        ),
+    ]
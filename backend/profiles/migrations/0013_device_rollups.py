@@ -0,0 +1,42 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0012_device_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DeviceRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.PositiveIntegerField(choices=[(60, 'minute'), (3600, 'hour'), (86400, 'day')], verbose_name='Seconds')),
+                ('bucket', models.DateTimeField(verbose_name='Start of the interval')),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('temperature_min', models.FloatField(null=True)),
+                ('temperature_max', models.FloatField(null=True)),
+                ('temperature_sum', models.FloatField(null=True)),
+                ('temperature_count', models.PositiveIntegerField(default=0)),
+                ('humidity_min', models.FloatField(null=True)),
+                ('humidity_max', models.FloatField(null=True)),
+                ('humidity_sum', models.FloatField(null=True)),
+                ('humidity_count', models.PositiveIntegerField(default=0)),
+                ('dosimeter_min', models.FloatField(null=True)),
+                ('dosimeter_max', models.FloatField(null=True)),
+                ('dosimeter_sum', models.FloatField(null=True)),
+                ('dosimeter_count', models.PositiveIntegerField(default=0)),
+                ('device', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='profiles.Device')),
+            ],
+            options={
+                'verbose_name': 'Device rollup',
+                'verbose_name_plural': 'Device rollups',
+                'db_table': 'device_rollups',
+                'unique_together': {('device', 'resolution', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0013_device_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='device',
+            name='rule_state',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.CreateModel(
+            name='DeviceRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('metric', models.CharField(choices=[('temperature', 'temperature'), ('humidity', 'humidity'), ('dosimeter', 'dosimeter')], max_length=16)),
+                ('kind', models.CharField(choices=[('threshold', 'Threshold'), ('average', 'Average over the window'), ('rate', 'Change per minute')], default='threshold', max_length=16)),
+                ('above', models.BooleanField(default=True, verbose_name='Active above the threshold, below otherwise')),
+                ('threshold', models.FloatField()),
+                ('hysteresis', models.FloatField(default=0)),
+                ('window', models.PositiveIntegerField(default=60, verbose_name='Seconds of the average or the rate of change')),
+                ('result', models.SmallIntegerField(default=1)),
+                ('message', models.CharField(blank=True, default='', max_length=255)),
+                ('is_active', models.BooleanField(default=True)),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='device_rules', to='profiles.Team')),
+            ],
+            options={
+                'verbose_name': 'Device rule',
+                'verbose_name_plural': 'Device rules',
+                'db_table': 'device_rules',
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0014_device_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='team',
+            name='change_seq',
+            field=models.BigIntegerField(default=0, verbose_name='Number of the last change of the team'),
+        ),
+    ]
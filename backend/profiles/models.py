@@ -1,29 +1,51 @@
+import hashlib
+import secrets
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
 from django.contrib.auth.models import AbstractUser
-from django.db import models
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db import models, connections, transaction
+from django.db.models import Q
+from django.db.models.signals import post_save, post_delete, pre_save
+from django.dispatch import receiver, Signal
 from django.utils import timezone
 
 from profiles.exceptions import MemberException
 
 
+class CountersMixin:
+    """
+    Counter fields are only changed by UPDATE queries with F() expressions.
+    Saving an instance doesn't write them, so a stale instance can't set them back
+    """
+    counter_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None, update_fields=None):
+        if not force_insert and not self._state.adding:
+            if update_fields is None:
+                update_fields = [field.name for field in self._meta.concrete_fields if not field.primary_key]
+            update_fields = [name for name in update_fields if name not in self.counter_fields]
+        super().save(force_insert=force_insert, force_update=force_update, using=using, update_fields=update_fields)
+
+
 class User(AbstractUser):
     about = models.CharField('О себе', max_length=1023, null=True, blank=True, default='')
 
     def can_manage_team_member(self, team, user):
-        if self == team.team_creator:
+        from profiles.roles import TeamRoles
+
+        if self.pk == team.team_creator_id:
             return True
-        try:
-            membership = Membership.objects.get(team=team, user=user)
-            self_membership = Membership.objects.get(team=team, user=self)
-            if self == user:
-                return False
-            if self_membership.is_manager and not membership.is_manager:
-                return True
-            if self_membership.is_creator and membership.is_manager:
-                return True
-        except Membership.DoesNotExist:
+        membership = TeamRoles.for_user(user).membership(team.pk)
+        self_membership = TeamRoles.for_user(self).membership(team.pk)
+        if membership is None or self_membership is None:
+            return False
+        if self == user:
             return False
+        if self_membership.is_manager and not membership.is_manager:
+            return True
+        if self_membership.is_creator and membership.is_manager:
+            return True
         return False
 
     class Meta:
@@ -32,7 +54,7 @@ class User(AbstractUser):
         verbose_name_plural = 'Users'
 
 
-class Team(models.Model):
+class Team(CountersMixin, models.Model):
     id = models.AutoField(primary_key=True)
     team = models.ForeignKey("self", on_delete=models.CASCADE, related_name='groups', null=True, blank=True)
     is_group = models.BooleanField('Is team?', default=False)
@@ -41,7 +63,14 @@ class Team(models.Model):
     description = models.CharField('Team description', max_length=1023,
                                    help_text='Team description max_length=1023', null=True, blank=True)
     users = models.ManyToManyField(User, related_name='teams', through='Membership')
+    team_creator = models.ForeignKey(User, on_delete=models.SET_NULL, related_name='created_teams', null=True,
+                                     blank=True, db_index=True, verbose_name='Creator of the main team')
     date_created = models.DateTimeField('Date created', default=timezone.now)
+    revision = models.PositiveIntegerField('Revision of the team tree', default=0)
+    date_modified = models.DateTimeField('Date modified', default=timezone.now)
+    change_seq = models.BigIntegerField('Number of the last change of the team', default=0)
+
+    counter_fields = ('revision', 'date_modified', 'change_seq')
 
     def __str__(self):
         return self.name
@@ -54,24 +83,21 @@ class Team(models.Model):
             raise MemberException("User is not a member of the team( can't be added to the group)")
         if self.is_member(user):
             raise MemberException("User is already a member of the team")
-        if user == self.team_creator:
+        if user.pk == self.team_creator_id:
             return True
         if self.is_group and not self.team.is_member(user):
             raise MemberException("User is not a member of the main team")
         return True
 
-    @property
-    def team_creator(self):
-        """returns creator of the main team"""
-        if self.is_group:
-            return Membership.objects.get(team=self.team, is_creator=True).user
-        return Membership.objects.get(team=self, is_creator=True).user
-
     class Meta:
         db_table = 'teams'
         verbose_name = 'Team'
         verbose_name_plural = 'Teams'
         ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['team', 'is_group'], name='teams_team_is_group_idx'),
+            models.Index(fields=['-date_created'], name='teams_main_date_idx', condition=Q(is_group=False)),
+        ]
 
 
 class Membership(models.Model):
@@ -94,17 +120,288 @@ class Membership(models.Model):
         verbose_name = 'Membership'
         verbose_name_plural = 'Memberships'
         ordering = ['-date_started']
+        indexes = [
+            models.Index(fields=['team'], name='membership_creator_idx', condition=Q(is_creator=True)),
+            models.Index(fields=['user', 'team', 'is_manager', 'is_creator'], name='membership_user_roles_idx'),
+        ]
+
+
+@receiver(pre_save, sender=Team)
+def inherit_team_creator(sender, instance, **kwargs):
+    """groups share the creator of the main team"""
+    if instance.is_group and instance.team_id and instance.team_creator_id is None:
+        instance.team_creator_id = Team.objects.filter(pk=instance.team_id).values_list('team_creator',
+                                                                                        flat=True).first()
+
+
+def change_team_creator(teams, creator_id):
+    """
+    Sets the creator of teams with .update(), which sends no signals,
+    so cached roles of the previous and the new creators are invalidated here
+    """
+    from profiles.roles import TeamRoles
+
+    previous = set(teams.values_list('team_creator', flat=True))
+    if teams.update(team_creator_id=creator_id):
+        for user_id in previous | {creator_id}:
+            TeamRoles.invalidate(user_id)
+
+
+@receiver(post_save, sender=Membership)
+def set_team_creator(sender, instance, **kwargs):
+    if instance.is_creator:
+        change_team_creator(Team.objects.filter(Q(pk=instance.team_id, is_group=False) | Q(
+            team_id=instance.team_id)).exclude(team_creator_id=instance.user_id), instance.user_id)
+
+
+@receiver(post_delete, sender=Membership)
+def unset_team_creator(sender, instance, **kwargs):
+    if instance.is_creator:
+        change_team_creator(Team.objects.filter(Q(pk=instance.team_id, is_group=False) | Q(
+            team_id=instance.team_id), team_creator_id=instance.user_id), None)
+
+
+def format_reading(value):
+    """value of a reading as it is shown in the latest values of the device"""
+    return '' if value is None else f'{value:.15g}'
+
+
+def hash_key(key):
+    return hashlib.sha256(key.encode()).hexdigest()
+
+
+class DeviceManager(models.Manager):
+    def record(self, team_id, readings):
+        """
+        Appends readings to the device of the team, creating the device on its first reading
+        """
+        with transaction.atomic(using=self.db):
+            device_id = self.filter(team_id=team_id).values_list('pk', flat=True).first()
+            if device_id is None:
+                device_id = self.create(team_id=team_id).pk
+            for reading in readings:
+                reading.device_id = device_id
+            self.append(readings)
+        return device_id
+
+    def append(self, readings, batch_size=1000):
+        """
+        Inserts readings of any devices with a multi-row insert per batch and merges them into the rollups.
+        Each device is pointed at its newest reading with one update, which is skipped
+        if the device already points at a newer reading.
+        Databases that can't return ids of inserted rows (SQLite) save readings one by one
+        """
+        if not readings:
+            return readings
+        device_ids = {reading.device_id for reading in readings}
+        with transaction.atomic(using=self.db):
+            # rollups of a device are merged by one transaction at a time
+            list(self.select_for_update().filter(pk__in=device_ids).order_by('pk').values_list('pk', flat=True))
+            # read after the lock, readings committed by other transactions are seen
+            latest = dict(self.filter(pk__in=device_ids).values_list('pk', 'latest_reading__timestamp'))
+            if connections[self.db].features.can_return_ids_from_bulk_insert:
+                DeviceReading.objects.using(self.db).bulk_create(readings, batch_size=batch_size)
+            else:
+                for reading in readings:
+                    reading.save(force_insert=True, using=self.db)
+            # metrics missing from the newest reading keep their latest value of the batch or of the device,
+            # readings older than the latest reading of the device don't change its values
+            newest, values = {}, {}
+            for reading in sorted(readings, key=lambda reading: (reading.timestamp, reading.pk)):
+                if latest.get(reading.device_id) is None or reading.timestamp >= latest[reading.device_id]:
+                    newest[reading.device_id] = reading
+                    values.setdefault(reading.device_id, {}).update(reading.latest_values())
+            for device_id, reading in newest.items():
+                self.filter(pk=device_id).filter(
+                    Q(latest_reading=None) | Q(latest_reading__timestamp__lte=reading.timestamp)
+                ).update(latest_reading=reading, **values[device_id])
+            DeviceRollup.objects.db_manager(self.db).add(readings)
+            readings_added.send(sender=DeviceReading, readings=readings)
+        return readings
+
+
+# sent by DeviceManager.append in the transaction which inserts the readings
+readings_added = Signal(providing_args=['readings'])
 
 
 class Device(models.Model):
+    """
+    Device of a team, its fields are the latest values which are kept with a pointer to the latest reading,
+    result and message are the outcome of the device rules of the team
+    """
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='device', unique=True)
     temperature = models.CharField(max_length=50)
     humidity = models.CharField(max_length=50)
     dosimeter = models.CharField(max_length=50)
     message = models.CharField(max_length=255, blank=True)
     result = models.SmallIntegerField(null=True)
+    latest_reading = models.ForeignKey('DeviceReading', on_delete=models.SET_NULL, related_name='+', null=True,
+                                       blank=True)
+    # sha256 of the key which authenticates telemetry ingest of the device
+    key_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+    # JSON checkpoint of the rule engine state of the device
+    rule_state = models.TextField(blank=True, default='', editable=False)
+
+    objects = DeviceManager()
+
+    def set_key(self):
+        """generates a new ingest key, only its hash is stored"""
+        key = secrets.token_urlsafe(32)
+        self.key_hash = hash_key(key)
+        return key
 
     class Meta:
         db_table = 'device'
         verbose_name = 'Device'
         verbose_name_plural = 'Devices'
+
+
+class DeviceReading(models.Model):
+    """
+    Append-only telemetry of a device
+    """
+    # the (device, timestamp) index serves lookups by device
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='readings', db_index=False)
+    timestamp = models.DateTimeField(default=timezone.now)
+    temperature = models.FloatField(null=True, blank=True)
+    humidity = models.FloatField(null=True, blank=True)
+    dosimeter = models.FloatField(null=True, blank=True)
+    message = models.CharField(max_length=255, blank=True, default='')
+    result = models.SmallIntegerField(null=True, blank=True)
+
+    def latest_values(self):
+        """
+        fields of the device for the metrics of this reading, its result and message are set by the device rules
+        """
+        return {name: format_reading(getattr(self, name)) for name in METRICS if getattr(self, name) is not None}
+
+    class Meta:
+        db_table = 'device_readings'
+        verbose_name = 'Device reading'
+        verbose_name_plural = 'Device readings'
+        indexes = [
+            models.Index(fields=['device', 'timestamp'], name='device_readings_time_idx'),
+        ]
+
+
+METRICS = ('temperature', 'humidity', 'dosimeter')
+
+
+class DeviceRollupManager(models.Manager):
+    def add(self, readings, batch_size=500):
+        """merges readings into the rollups of their minutes, hours and days, creating missing rollups"""
+        rollups = {}
+        for reading in readings:
+            for resolution in DeviceRollup.RESOLUTIONS.values():
+                bucket = DeviceRollup.bucket_of(reading.timestamp, resolution)
+                key = (reading.device_id, resolution, bucket)
+                rollup = rollups.get(key)
+                if rollup is None:
+                    rollup = rollups[key] = DeviceRollup(device_id=reading.device_id, resolution=resolution,
+                                                         bucket=bucket)
+                rollup.add(reading)
+        if not rollups:
+            return
+        existing = self.filter(device_id__in={key[0] for key in rollups},
+                               bucket__in={key[2] for key in rollups}).select_for_update()
+        updated = []
+        for rollup in existing:
+            new = rollups.pop((rollup.device_id, rollup.resolution, rollup.bucket), None)
+            if new is not None:
+                rollup.merge(new)
+                updated.append(rollup)
+        self.bulk_update(updated, DeviceRollup.VALUE_FIELDS, batch_size=batch_size)
+        self.bulk_create(rollups.values(), batch_size=batch_size)
+
+
+class DeviceRollup(models.Model):
+    """
+    Minimum, maximum, sum and count of the readings of a device in a minute, hour or day
+    """
+    RESOLUTIONS = OrderedDict([('minute', 60), ('hour', 3600), ('day', 86400)])
+    VALUE_FIELDS = ['count'] + [f'{metric}_{value}' for metric in METRICS for value in ('min', 'max', 'sum', 'count')]
+
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, related_name='rollups', db_index=False)
+    resolution = models.PositiveIntegerField('Seconds', choices=[(seconds, name)
+                                                                 for name, seconds in RESOLUTIONS.items()])
+    bucket = models.DateTimeField('Start of the interval')
+    count = models.PositiveIntegerField(default=0)
+    temperature_min = models.FloatField(null=True)
+    temperature_max = models.FloatField(null=True)
+    temperature_sum = models.FloatField(null=True)
+    temperature_count = models.PositiveIntegerField(default=0)
+    humidity_min = models.FloatField(null=True)
+    humidity_max = models.FloatField(null=True)
+    humidity_sum = models.FloatField(null=True)
+    humidity_count = models.PositiveIntegerField(default=0)
+    dosimeter_min = models.FloatField(null=True)
+    dosimeter_max = models.FloatField(null=True)
+    dosimeter_sum = models.FloatField(null=True)
+    dosimeter_count = models.PositiveIntegerField(default=0)
+
+    objects = DeviceRollupManager()
+
+    @staticmethod
+    def bucket_of(timestamp, resolution):
+        """start of the interval of the timestamp, intervals are aligned to UTC"""
+        seconds = timestamp.timestamp()
+        return datetime.fromtimestamp(seconds - seconds % resolution, tz=dt_timezone.utc)
+
+    def merge_values(self, metric, minimum, maximum, total, count):
+        if not count:
+            return
+        if getattr(self, f'{metric}_count'):
+            minimum = min(minimum, getattr(self, f'{metric}_min'))
+            maximum = max(maximum, getattr(self, f'{metric}_max'))
+            total += getattr(self, f'{metric}_sum')
+            count += getattr(self, f'{metric}_count')
+        setattr(self, f'{metric}_min', minimum)
+        setattr(self, f'{metric}_max', maximum)
+        setattr(self, f'{metric}_sum', total)
+        setattr(self, f'{metric}_count', count)
+
+    def add(self, reading):
+        self.count += 1
+        for metric in METRICS:
+            value = getattr(reading, metric)
+            if value is not None:
+                self.merge_values(metric, value, value, value, 1)
+
+    def merge(self, other):
+        self.count += other.count
+        for metric in METRICS:
+            self.merge_values(metric, *(getattr(other, f'{metric}_{value}')
+                                        for value in ('min', 'max', 'sum', 'count')))
+
+    class Meta:
+        db_table = 'device_rollups'
+        verbose_name = 'Device rollup'
+        verbose_name_plural = 'Device rollups'
+        unique_together = ['device', 'resolution', 'bucket']
+
+
+class DeviceRule(models.Model):
+    """
+    Rule of the devices of a team which is active while a metric is above (or below) the threshold.
+    Threshold rules check each value, average rules the average and rate rules the change per minute
+    over the last `window` seconds. An active rule is cleared once the metric is back beyond the threshold
+    by `hysteresis`. The device shows the result and message of the active rule with the highest result
+    """
+    THRESHOLD, AVERAGE, RATE = 'threshold', 'average', 'rate'
+    KINDS = [(THRESHOLD, 'Threshold'), (AVERAGE, 'Average over the window'), (RATE, 'Change per minute')]
+
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='device_rules')
+    metric = models.CharField(max_length=16, choices=[(metric, metric) for metric in METRICS])
+    kind = models.CharField(max_length=16, choices=KINDS, default=THRESHOLD)
+    above = models.BooleanField('Active above the threshold, below otherwise', default=True)
+    threshold = models.FloatField()
+    hysteresis = models.FloatField(default=0)
+    window = models.PositiveIntegerField('Seconds of the average or the rate of change', default=60)
+    result = models.SmallIntegerField(default=1)
+    message = models.CharField(max_length=255, blank=True, default='')
+    is_active = models.BooleanField(default=True)
+
+    class Meta:
+        db_table = 'device_rules'
+        verbose_name = 'Device rule'
+        verbose_name_plural = 'Device rules'
@@ -1,32 +1,27 @@
 from rest_framework import permissions
 
-from profiles.models import Membership
+from profiles.roles import get_roles
 
 
-class IsTeamOrGroupCreator(permissions.BasePermission):
-    def has_object_permission(self, request, view, obj):
-        try:
-            if request.user == obj.team_creator:
-                return True
+class TeamPermission(permissions.BasePermission):
+    """
+    Base class for the checks of the request user role in the team of the object
+    """
+
+    def get_team_id(self, obj):
+        return obj.pk
 
-            return Membership.objects.get(team=obj, user=request.user).is_manager_creator
-        except Membership.DoesNotExist:
-            return False
+
+class IsTeamOrGroupCreator(TeamPermission):
+    def has_object_permission(self, request, view, obj):
+        return get_roles(request).is_creator(self.get_team_id(obj))
 
 
-class IsTeamOrGroupManager(permissions.BasePermission):
+class IsTeamOrGroupManager(TeamPermission):
     def has_object_permission(self, request, view, obj):
-        try:
-            if request.user == obj.team_creator:
-                return True
-            member = Membership.objects.get(team=obj, user=request.user)
-            return member.is_manager
-        except Membership.DoesNotExist:
-            return False
+        return get_roles(request).is_manager(self.get_team_id(obj))
 
 
-class IsTeamOrGroupMember(permissions.BasePermission):
+class IsTeamOrGroupMember(TeamPermission):
     def has_object_permission(self, request, view, obj):
-        if request.user == obj.team_creator:
-            return True
-        return obj.is_member(request.user)
+        return get_roles(request).is_member(self.get_team_id(obj))
@@ -0,0 +1,89 @@
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from profiles.models import Membership, Team
+
+Role = namedtuple('Role', ['is_manager', 'is_creator'])
+
+
+class TeamRoles:
+    """
+    Roles of one user in all of their teams and groups.
+    Loaded with two queries and kept in the shared cache for TEAM_ROLES_CACHE_TIMEOUT seconds
+    """
+
+    def __init__(self, memberships, created_teams):
+        self.memberships = memberships
+        self.created_teams = created_teams
+
+    @staticmethod
+    def cache_key(user_id):
+        return f'team_roles:{user_id}'
+
+    @classmethod
+    def load(cls, user):
+        memberships = {team_id: Role(is_manager, is_creator) for team_id, is_manager, is_creator in
+                       Membership.objects.filter(user=user).order_by().values_list('team', 'is_manager',
+                                                                                   'is_creator')}
+        created_teams = frozenset(Team.objects.filter(team_creator=user).order_by().values_list('pk', flat=True))
+        return cls(memberships, created_teams)
+
+    @classmethod
+    def for_user(cls, user):
+        timeout = settings.TEAM_ROLES_CACHE_TIMEOUT
+        if not timeout:
+            return cls.load(user)
+        key = cls.cache_key(user.pk)
+        roles = cache.get(key)
+        if roles is None:
+            roles = cls.load(user)
+            cache.set(key, roles, timeout)
+        return roles
+
+    @classmethod
+    def invalidate(cls, user_id):
+        if user_id is not None:
+            cache.delete(cls.cache_key(user_id))
+
+    def membership(self, team_id):
+        return self.memberships.get(team_id)
+
+    def is_team_creator(self, team_id):
+        """user created the main team of the team or group"""
+        return team_id in self.created_teams
+
+    def is_creator(self, team_id):
+        role = self.membership(team_id)
+        return self.is_team_creator(team_id) or role is not None and role.is_manager and role.is_creator
+
+    def is_manager(self, team_id):
+        role = self.membership(team_id)
+        return self.is_team_creator(team_id) or role is not None and role.is_manager
+
+    def is_member(self, team_id):
+        return self.is_team_creator(team_id) or team_id in self.memberships
+
+
+def get_roles(request):
+    """roles of the request user, resolved once per request"""
+    roles = getattr(request, '_team_roles', None)
+    if roles is None:
+        roles = TeamRoles.for_user(request.user)
+        request._team_roles = roles
+    return roles
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def invalidate_member_roles(sender, instance, **kwargs):
+    TeamRoles.invalidate(instance.user_id)
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def invalidate_creator_roles(sender, instance, **kwargs):
+    TeamRoles.invalidate(instance.team_creator_id)
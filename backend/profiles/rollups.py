@@ -0,0 +1,120 @@
+"""
+Telemetry series of a device and retention of old telemetry.
+Rollups are merged as readings arrive (DeviceManager.append), so raw readings and fine rollups
+can be deleted when they get old without losing the coarser series.
+A series is read at the finest resolution which is still kept for the whole window
+and gives at most MAX_POINTS points, raw readings are only used for short windows.
+Raw series of more than MAX_RAW_POINTS readings are refused rather than cut
+"""
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from profiles.exceptions import TelemetryException
+from profiles.models import Device, DeviceReading, DeviceRollup, METRICS
+
+MAX_POINTS = 1000
+MAX_RAW_POINTS = 10000
+RAW_WINDOW = timedelta(hours=1)
+RESOLUTIONS = ('auto', 'raw', *DeviceRollup.RESOLUTIONS)
+
+
+def retention():
+    """how long readings ('raw') and rollups of each resolution are kept, None is forever"""
+    return OrderedDict([
+        ('raw', timedelta(days=settings.TELEMETRY_RAW_RETENTION_DAYS)),
+        ('minute', timedelta(days=settings.TELEMETRY_MINUTE_RETENTION_DAYS)),
+        ('hour', timedelta(days=settings.TELEMETRY_HOUR_RETENTION_DAYS)),
+        ('day', None),
+    ])
+
+
+def choose_resolution(since, until, now):
+    kept = retention()
+
+    def covers(name):
+        return kept[name] is None or since >= now - kept[name]
+
+    if until - since <= RAW_WINDOW and covers('raw'):
+        return 'raw'
+    for name, seconds in DeviceRollup.RESOLUTIONS.items():
+        if (until - since).total_seconds() / seconds <= MAX_POINTS and covers(name):
+            return name
+    return 'day'
+
+
+def aggregate(minimum, maximum, total, count):
+    return {'min': minimum, 'max': maximum, 'avg': total / count} if count else None
+
+
+def raw_points(device_id, since, until):
+    readings = DeviceReading.objects.filter(device_id=device_id, timestamp__gte=since, timestamp__lt=until) \
+        .order_by('timestamp').values_list('timestamp', *METRICS)[:MAX_RAW_POINTS + 1]
+    if len(readings) > MAX_RAW_POINTS:
+        raise TelemetryException(f'The window has more than {MAX_RAW_POINTS} readings, '
+                                 f'choose a shorter window or a coarser resolution')
+    return [OrderedDict([('time', timestamp), ('count', 1),
+                         *((metric, aggregate(value, value, value, 1) if value is not None else None)
+                           for metric, value in zip(METRICS, values))])
+            for timestamp, *values in readings]
+
+
+def rollup_points(device_id, seconds, since, until):
+    rollups = DeviceRollup.objects.filter(device_id=device_id, resolution=seconds,
+                                          bucket__gte=DeviceRollup.bucket_of(since, seconds), bucket__lt=until) \
+        .order_by('bucket').values_list('bucket', *DeviceRollup.VALUE_FIELDS)
+    return [OrderedDict([('time', bucket), ('count', count),
+                         *((metric, aggregate(*values[index * 4:index * 4 + 4]))
+                           for index, metric in enumerate(METRICS))])
+            for bucket, count, *values in rollups]
+
+
+def series(device_id, since, until, resolution='auto', now=None):
+    """
+    points of the device between since and until at the resolution, 'auto' chooses it by the window
+    and falls back to minutes for too many readings
+    """
+    auto = resolution == 'auto'
+    if auto:
+        resolution = choose_resolution(since, until, now or timezone.now())
+    points = None
+    if resolution == 'raw':
+        try:
+            points = raw_points(device_id, since, until)
+        except TelemetryException:
+            if not auto:
+                raise
+            resolution = 'minute'
+    if points is None:
+        points = rollup_points(device_id, DeviceRollup.RESOLUTIONS[resolution], since, until)
+    return OrderedDict([('device', device_id), ('resolution', resolution), ('since', since), ('until', until),
+                        ('points', points)])
+
+
+def delete_in_batches(queryset, batch_size):
+    """deletes rows of the queryset in short transactions, returns the number of deleted rows"""
+    deleted = 0
+    while True:
+        pks = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not pks:
+            return deleted
+        deleted += queryset.model.objects.filter(pk__in=pks).delete()[1].get(queryset.model._meta.label, 0)
+
+
+def apply_retention(now=None, batch_size=10000):
+    """
+    Deletes raw readings and rollups which are older than their retention,
+    the latest reading of each device is kept
+    """
+    now = now or timezone.now()
+    kept = retention()
+    latest = Device.objects.exclude(latest_reading=None).values('latest_reading')
+    deleted = OrderedDict([('raw', delete_in_batches(
+        DeviceReading.objects.filter(timestamp__lt=now - kept['raw']).exclude(pk__in=latest), batch_size))])
+    for name, seconds in DeviceRollup.RESOLUTIONS.items():
+        if kept[name] is not None:
+            deleted[name] = delete_in_batches(
+                DeviceRollup.objects.filter(resolution=seconds, bucket__lt=now - kept[name]), batch_size)
+    return deleted
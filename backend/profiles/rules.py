@@ -0,0 +1,205 @@
+"""
+Streaming evaluation of device rules.
+Readings are evaluated after their transaction commits, in timestamp order per device.
+The state of each device (active rules and the values in their windows) is written to Device.rule_state
+after each batch. A batch locks the rows of its devices and reads their checkpoints and rules,
+so processes evaluate readings of a device one at a time and always continue from the latest state.
+The states of the last DEVICE_RULES_CACHE_SIZE devices are kept in process and reused
+while their checkpoint and rules are unchanged.
+Device.result and message are only written when the outcome of the rules changes.
+Readings which are not newer than the last evaluated reading of their device arrive late and are skipped.
+Errors of an evaluation are logged, the readings are already stored and the next batch of the device
+continues from its checkpoint
+"""
+import json
+import logging
+import threading
+from collections import deque, OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.dispatch import receiver
+
+from profiles.models import Device, DeviceReading, DeviceRule, readings_added
+
+CLEAR = (0, '')
+
+logger = logging.getLogger(__name__)
+
+
+class CompiledRule:
+    __slots__ = ('pk', 'metric', 'kind', 'above', 'threshold', 'clear', 'window', 'outcome')
+
+    def __init__(self, rule):
+        self.pk = rule.pk
+        self.metric = rule.metric
+        self.kind = rule.kind
+        self.above = rule.above
+        self.threshold = rule.threshold
+        self.clear = rule.threshold - rule.hysteresis if rule.above else rule.threshold + rule.hysteresis
+        self.window = max(rule.window, 1)
+        self.outcome = (rule.result, rule.message)
+
+    def key(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+
+class RuleState:
+    __slots__ = ('active', 'values', 'total')
+
+    def __init__(self, active=False, values=()):
+        self.active = active
+        self.values = deque(tuple(value) for value in values)
+        self.total = sum(value for t, value in self.values)
+
+
+class DeviceState:
+    __slots__ = ('team_id', 'rules', 'states', 'last', 'outcome', 'saved')
+
+    def __init__(self, team_id, rules, checkpoint, outcome):
+        # the checkpoint in the database which this state continues
+        self.saved = checkpoint
+        checkpoint = json.loads(checkpoint) if checkpoint else {}
+        states = checkpoint.get('rules', {})
+        self.team_id = team_id
+        self.rules = rules
+        self.states = [RuleState(*states.get(str(rule.pk), ())) for rule in rules]
+        self.last = checkpoint.get('last', float('-inf'))
+        self.outcome = outcome
+
+    def checkpoint(self):
+        return json.dumps({'last': self.last, 'rules': {str(rule.pk): [state.active, list(state.values)]
+                                                        for rule, state in zip(self.rules, self.states)}})
+
+    def evaluate(self, timestamp, reading):
+        """applies a reading, returns the outcome of the rules, readings older than the last one are skipped"""
+        if timestamp <= self.last:
+            return self.outcome
+        self.last = timestamp
+        for rule, state in zip(self.rules, self.states):
+            value = getattr(reading, rule.metric)
+            if value is None:
+                continue
+            if rule.kind != DeviceRule.THRESHOLD:
+                values = state.values
+                values.append((timestamp, value))
+                state.total += value
+                while values[0][0] <= timestamp - rule.window:
+                    state.total -= values.popleft()[1]
+                if rule.kind == DeviceRule.AVERAGE:
+                    value = state.total / len(values)
+                elif timestamp == values[0][0]:
+                    continue
+                else:
+                    value = (value - values[0][1]) / (timestamp - values[0][0]) * 60
+            if state.active:
+                state.active = value >= rule.clear if rule.above else value <= rule.clear
+            else:
+                state.active = value > rule.threshold if rule.above else value < rule.threshold
+        outcome = CLEAR
+        for rule, state in zip(self.rules, self.states):
+            if state.active and rule.outcome[0] > outcome[0]:
+                outcome = rule.outcome
+        return outcome
+
+
+class RuleEngine:
+    """
+    Device states of the process, the least recently used ones are dropped beyond max_size devices
+    """
+
+    def __init__(self, max_size=None):
+        self.max_size = max_size
+        self.devices = OrderedDict()
+        self.lock = threading.Lock()
+
+    @property
+    def size(self):
+        if self.max_size is None:
+            return settings.DEVICE_RULES_CACHE_SIZE
+        return self.max_size
+
+    def add_device(self, device_id, team_id, rules, checkpoint='', outcome=CLEAR):
+        self.devices[device_id] = DeviceState(team_id, [CompiledRule(rule) for rule in rules], checkpoint, outcome)
+        self.devices.move_to_end(device_id)
+
+    def load(self, device_ids):
+        """
+        Locks the devices until the end of the transaction and restores the states which are not in process,
+        were evaluated by another process since or whose rules changed, with two queries
+        """
+        devices = list(Device.objects.select_for_update().filter(pk__in=device_ids).order_by('pk').values_list(
+            'pk', 'team_id', 'rule_state', 'result', 'message'))
+        rules = {}
+        for rule in DeviceRule.objects.filter(team_id__in={device[1] for device in devices},
+                                              is_active=True).order_by('pk'):
+            rules.setdefault(rule.team_id, []).append(CompiledRule(rule))
+        for pk, team_id, checkpoint, result, message in devices:
+            team_rules = rules.get(team_id, [])
+            device = self.devices.get(pk)
+            if device is None or device.saved != checkpoint or \
+                    [rule.key() for rule in device.rules] != [rule.key() for rule in team_rules]:
+                self.devices[pk] = DeviceState(team_id, team_rules, checkpoint, (result or 0, message))
+            self.devices.move_to_end(pk)
+
+    def evaluate(self, readings):
+        """
+        Applies readings to the states of their devices,
+        returns the outcomes which changed and the devices whose state changed
+        """
+        changed, due = {}, set()
+        for reading in sorted(readings, key=lambda reading: reading.timestamp):
+            device = self.devices.get(reading.device_id)
+            if device is None:
+                continue
+            outcome = device.evaluate(reading.timestamp.timestamp(), reading)
+            if outcome != device.outcome:
+                device.outcome = changed[reading.device_id] = outcome
+            if device.rules or reading.device_id in changed:
+                due.add(reading.device_id)
+        return changed, due
+
+    def save(self, changed, due):
+        for device_id in due:
+            device = self.devices[device_id]
+            device.saved = device.checkpoint()
+            fields = {'rule_state': device.saved}
+            if device_id in changed:
+                fields['result'], fields['message'] = changed[device_id]
+            Device.objects.filter(pk=device_id).update(**fields)
+
+    def process(self, readings):
+        device_ids = {reading.device_id for reading in readings}
+        with self.lock:
+            try:
+                with transaction.atomic():
+                    self.load(device_ids)
+                    changed, due = self.evaluate(readings)
+                    self.save(changed, due)
+            except BaseException:
+                # the states may be ahead of the rolled back checkpoints
+                for pk in device_ids:
+                    self.devices.pop(pk, None)
+                raise
+            while len(self.devices) > self.size:
+                self.devices.popitem(last=False)
+        return changed
+
+    def clear(self):
+        with self.lock:
+            self.devices.clear()
+
+
+rule_engine = RuleEngine()
+
+
+@receiver(readings_added, sender=DeviceReading)
+def evaluate_readings(sender, readings, **kwargs):
+    def process():
+        # an error would fail the request which committed the readings, and the device would send them again
+        try:
+            rule_engine.process(readings)
+        except Exception:
+            logger.exception('Device rules of %d readings were not evaluated', len(readings))
+
+    transaction.on_commit(process)
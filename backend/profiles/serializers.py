@@ -1,10 +1,11 @@
 from rest_framework import serializers
 
-from profiles.models import User, Team, Membership, Device
+from profiles.models import User, Team, Membership, Device, DeviceReading, DeviceRule
+from projects.fieldsets import DynamicFieldsMixin
 from projects.models import List, Item
 
 
-class UserAssignedItemsSerializer(serializers.ModelSerializer):
+class UserAssignedItemsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     User model w/o password
     """
@@ -15,7 +16,7 @@ class UserAssignedItemsSerializer(serializers.ModelSerializer):
         read_only_fields = ('email', 'date_joined')
 
 
-class DeviceSerializer(serializers.ModelSerializer):
+class DeviceSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Device model serializer
     """
@@ -26,7 +27,46 @@ class DeviceSerializer(serializers.ModelSerializer):
         fields = ('team', 'temperature', 'humidity', 'dosimeter', 'message', 'result')
 
 
-class MemberSerializer(serializers.ModelSerializer):
+class DeviceReadingSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Reading of a device, the timestamp is the time of the request if it is not given
+    """
+
+    class Meta:
+        model = DeviceReading
+        fields = ('pk', 'timestamp', 'temperature', 'humidity', 'dosimeter', 'message', 'result')
+
+
+class DeviceRuleSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    """
+    Rule of the devices of a team
+    """
+
+    class Meta:
+        model = DeviceRule
+        fields = ('pk', 'metric', 'kind', 'above', 'threshold', 'hysteresis', 'window', 'result', 'message',
+                  'is_active')
+
+
+class NoneIfEmptyListSerializer(serializers.ListSerializer):
+    """
+    Renders an empty list as None
+    """
+
+    def to_representation(self, data):
+        return super().to_representation(data) or None
+
+
+class TeamDeviceSerializer(DeviceSerializer):
+    """
+    Devices of a team, None if there are no devices
+    """
+
+    class Meta(DeviceSerializer.Meta):
+        list_serializer_class = NoneIfEmptyListSerializer
+
+
+class MemberSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     user = UserAssignedItemsSerializer(read_only=True)
 
     class Meta:
@@ -35,18 +75,21 @@ class MemberSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_creator', 'date_started')
 
 
-class GroupSerializer(serializers.ModelSerializer):
+class SyncMemberSerializer(MemberSerializer):
+    """
+    Membership with its primary key for delta sync
+    """
+
+    class Meta(MemberSerializer.Meta):
+        fields = ('pk', 'user', 'is_manager', 'is_creator', 'date_started')
+
+
+class GroupSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Group serializer
     """
     members = MemberSerializer(many=True, read_only=True)
-    device = serializers.SerializerMethodField(read_only=True)
-
-    def get_device(self, instance):
-        if instance.device.all():
-            return DeviceSerializer(instance.device.all(), many=True).data
-        else:
-            return None
+    device = TeamDeviceSerializer(many=True, read_only=True)
 
     class Meta:
         model = Team
@@ -54,25 +97,15 @@ class GroupSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_group', 'date_created')
 
 
-class TeamSerializer(serializers.ModelSerializer):
+class TeamSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Team serializer
     """
     members = MemberSerializer(many=True, read_only=True)
     team = serializers.PrimaryKeyRelatedField(read_only=True)
     groups = GroupSerializer(many=True, read_only=True)
-    creator = serializers.SerializerMethodField()
-    device = serializers.SerializerMethodField(read_only=True)
-
-    def get_creator(self, instance):
-        return UserAssignedItemsSerializer(instance.team_creator).data
-
-    def get_device(self, instance):
-        if instance.device.all():
-            return DeviceSerializer(instance.device.all(), many=True).data
-        else:
-            return None
-
+    creator = UserAssignedItemsSerializer(source='team_creator', read_only=True)
+    device = TeamDeviceSerializer(many=True, read_only=True)
 
     class Meta:
         model = Team
@@ -81,7 +114,7 @@ class TeamSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_group', 'date_created', 'creator')
 
 
-class UserDetailsSerializer(serializers.ModelSerializer):
+class UserDetailsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     User model w/o password and with assigned tasks
     """
@@ -89,8 +122,8 @@ class UserDetailsSerializer(serializers.ModelSerializer):
     TODO rewrite serializer (it is the same as projects.serializer.ItemSerializer)
     """
 
-    class ItemSerializer(serializers.ModelSerializer):
-        class ListSerializer(serializers.ModelSerializer):
+    class ItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+        class ListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
             class Meta:
                 model = List
                 fields = ('pk', 'name')
@@ -0,0 +1,138 @@
+"""
+Batched ingest of device readings.
+A request is a list of batches {"key": device key, "readings": [...]} as JSON or MessagePack,
+readings are objects or compact arrays in the order of READING_FIELDS,
+timestamps are ISO 8601 strings or unix times in seconds and the time of the request if they are missing.
+All keys of a request are checked with one query, readings are validated column by column
+without serializers and all valid readings are inserted together
+"""
+import math
+from datetime import datetime, timezone as dt_timezone
+
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError, AuthenticationFailed
+
+from profiles.models import Device, DeviceReading, hash_key
+
+READING_FIELDS = ('timestamp', 'temperature', 'humidity', 'dosimeter', 'message', 'result')
+MAX_READINGS = 10000
+MAX_ERRORS = 100
+
+
+def to_timestamp(value, now):
+    if value is None:
+        return now
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        try:
+            return datetime.fromtimestamp(value, tz=dt_timezone.utc)
+        except (OverflowError, OSError, ValueError):
+            raise ValueError('Unix time is out of range')
+    if isinstance(value, str):
+        parsed = parse_datetime(value)
+        if parsed is not None:
+            return parsed if timezone.is_aware(parsed) else timezone.make_aware(parsed)
+    raise ValueError('Expected an ISO 8601 datetime or a unix time')
+
+
+def to_number(value, now):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError('Expected a number')
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError('Expected a number')
+    if not math.isfinite(number):
+        raise ValueError('Expected a finite number')
+    return number
+
+
+def to_message(value, now):
+    if value is None:
+        return ''
+    if not isinstance(value, str) or len(value) > 255:
+        raise ValueError('Expected a string of at most 255 characters')
+    return value
+
+
+def to_result(value, now):
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int) or not -32768 <= value <= 32767:
+        raise ValueError('Expected a small integer')
+    return value
+
+
+CONVERTERS = (to_timestamp, to_number, to_number, to_number, to_message, to_result)
+
+
+def to_columns(rows):
+    """readings as columns of READING_FIELDS, compact arrays may leave out trailing fields"""
+    columns = [[] for _ in READING_FIELDS]
+    for row in rows:
+        if isinstance(row, dict):
+            for column, name in zip(columns, READING_FIELDS):
+                column.append(row.get(name))
+        elif isinstance(row, (list, tuple)) and len(row) <= len(READING_FIELDS):
+            for column, value in zip(columns, (*row, *(None,) * (len(READING_FIELDS) - len(row)))):
+                column.append(value)
+        else:
+            raise ValidationError('Readings must be objects or arrays of at most '
+                                  f'{len(READING_FIELDS)} values')
+    return columns
+
+
+def validate_readings(device_id, rows, now):
+    """valid readings of a device and {reading index: {field: [error]}} of the invalid ones"""
+    columns = to_columns(rows)
+    errors = {}
+    values = []
+    for name, convert, column in zip(READING_FIELDS, CONVERTERS, columns):
+        converted = []
+        for index, value in enumerate(column):
+            try:
+                converted.append(convert(value, now))
+            except ValueError as exc:
+                converted.append(None)
+                errors.setdefault(index, {})[name] = [str(exc)]
+        values.append(converted)
+    readings = [DeviceReading(device_id=device_id, **dict(zip(READING_FIELDS, row)))
+                for index, row in enumerate(zip(*values)) if index not in errors]
+    return readings, errors
+
+
+def ingest(data):
+    """
+    Stores the readings of all batches with a valid key, returns the summary.
+    Raises ValidationError if the request is malformed and AuthenticationFailed if no key is valid
+    """
+    if not isinstance(data, list) or not all(isinstance(batch, dict) and isinstance(batch.get('key'), str) and
+                                             isinstance(batch.get('readings'), list) for batch in data):
+        raise ValidationError('Expected a list of {"key": device key, "readings": [readings]}')
+    if sum(len(batch['readings']) for batch in data) > MAX_READINGS:
+        raise ValidationError(f'No more than {MAX_READINGS} readings can be sent at once')
+    hashes = [hash_key(batch['key']) for batch in data]
+    devices = dict(Device.objects.filter(key_hash__in=set(hashes)).values_list('key_hash', 'pk'))
+    now = timezone.now()
+    readings, errors = [], []
+    authenticated = 0
+    for index, (batch, key_hash) in enumerate(zip(data, hashes)):
+        device_id = devices.get(key_hash)
+        if device_id is None:
+            errors.append({'batch': index, 'errors': ['Invalid device key']})
+            continue
+        authenticated += 1
+        batch_readings, reading_errors = validate_readings(device_id, batch['readings'], now)
+        readings += batch_readings
+        errors += [{'batch': index, 'reading': reading, 'errors': reading_errors[reading]}
+                   for reading in sorted(reading_errors)]
+    if data and not authenticated:
+        raise AuthenticationFailed('Invalid device key')
+    Device.objects.append(readings)
+    return {
+        'created': len(readings),
+        'error_count': len(errors),
+        'errors': errors[:MAX_ERRORS],
+    }
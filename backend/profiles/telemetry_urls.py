@@ -0,0 +1,7 @@
+from django.conf.urls import url
+
+from profiles.views import TelemetryIngestView
+
+urlpatterns = [
+    url(r'^ingest/$', TelemetryIngestView.as_view(), name='telemetry_ingest'),
+]
@@ -1,3 +1,389 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock, skipIf
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from profiles.models import User, Team, Membership, Device, DeviceReading, DeviceRollup, DeviceRule
+from profiles.rollups import apply_retention
+from profiles.rules import RuleEngine, rule_engine
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class TeamQueriesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner', password='password')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_team(self, groups=0, members=0):
+        team = Team.objects.create(name='team')
+        Membership.objects.create(team=team, user=self.user, is_manager=True, is_creator=True)
+        Device.objects.create(team=team, temperature='20', humidity='40', dosimeter='0.1')
+        users = [User.objects.create_user(username=f'user{team.pk}-{i}') for i in range(members)]
+        for user in users:
+            Membership.objects.create(team=team, user=user)
+        for i in range(groups):
+            group = Team.objects.create(name=f'group{i}', team=team, is_group=True)
+            Membership.objects.create(team=group, user=self.user, is_manager=True, is_creator=True)
+            Device.objects.create(team=group, temperature='20', humidity='40', dosimeter='0.1')
+            for user in users:
+                Membership.objects.create(team=group, user=user)
+        return team
+
+    def test_list_query_count_is_constant(self):
+        self.create_team(groups=1, members=1)
+        with self.assertNumQueries(6):
+            response = self.client.get('/teams/')
+        self.assertEqual(len(response.data), 1)
+
+        for _ in range(9):
+            self.create_team(groups=5, members=3)
+        with self.assertNumQueries(6):
+            response = self.client.get('/teams/')
+        self.assertEqual(len(response.data), 10)
+        self.assertEqual(response.data[0]['creator']['username'], 'owner')
+        self.assertEqual(len(response.data[0]['groups']), 5)
+        self.assertEqual(len(response.data[0]['groups'][0]['members']), 4)
+
+    def test_retrieve_query_count_is_constant(self):
+        team = self.create_team(groups=1, members=1)
+        # two more queries load the roles of the request user
+        with self.assertNumQueries(8):
+            self.client.get(f'/teams/{team.pk}/')
+        with self.assertNumQueries(6):
+            self.client.get(f'/teams/{team.pk}/')
+
+        team = self.create_team(groups=5, members=5)
+        with self.assertNumQueries(8):
+            response = self.client.get(f'/teams/{team.pk}/')
+        self.assertEqual(len(response.data['members']), 6)
+        self.assertIsNotNone(response.data['device'])
+
+    def test_retrieve_group(self):
+        team = self.create_team(groups=1)
+        group = team.groups.get()
+        response = self.client.get(f'/teams/{group.pk}/')
+        self.assertEqual(response.data['creator']['username'], 'owner')
+        self.assertEqual(response.data['team'], team.pk)
+
+
+class TeamCreatorTestCase(TestCase):
+    def test_creator_follows_memberships(self):
+        user = User.objects.create_user(username='owner')
+        team = Team.objects.create(name='team')
+        group = Team.objects.create(name='group', team=team, is_group=True)
+        membership = Membership.objects.create(team=team, user=user, is_creator=True)
+        self.assertEqual(Team.objects.get(pk=team.pk).team_creator, user)
+        self.assertEqual(Team.objects.get(pk=group.pk).team_creator, user)
+        self.assertEqual(Team.objects.create(name='new', team=team, is_group=True).team_creator_id, user.pk)
+
+        membership.delete()
+        self.assertIsNone(Team.objects.get(pk=team.pk).team_creator)
+        self.assertIsNone(Team.objects.get(pk=group.pk).team_creator)
+
+
+class TeamRolesTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user(username='owner')
+        self.user = User.objects.create_user(username='user')
+        self.team = Team.objects.create(name='team', team_creator=self.owner)
+        self.group = Team.objects.create(name='group', team=self.team, is_group=True)
+        Membership.objects.create(team=self.team, user=self.owner, is_manager=True, is_creator=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_roles_follow_membership_changes(self):
+        self.assertEqual(self.client.get(f'/teams/{self.team.pk}/').status_code, 403)
+        membership = Membership.objects.create(team=self.team, user=self.user)
+        self.assertEqual(self.client.get(f'/teams/{self.team.pk}/').status_code, 200)
+        self.assertEqual(self.client.put(f'/teams/{self.team.pk}/', {'name': 'new'}).status_code, 403)
+
+        membership.is_manager = True
+        membership.save()
+        self.assertEqual(self.client.post(f'/teams/{self.team.pk}/add_group/', {'name': 'new'}).status_code, 200)
+        membership.delete()
+        self.assertEqual(self.client.get(f'/teams/{self.team.pk}/').status_code, 403)
+
+    def test_roles_follow_creator_changes(self):
+        self.client.force_authenticate(self.owner)
+        # roles of the creator are cached by the request
+        self.assertEqual(self.client.get(f'/teams/{self.group.pk}/').status_code, 200)
+        Membership.objects.filter(team=self.team, user=self.owner).update(is_creator=False)
+        Membership.objects.create(team=self.team, user=self.user, is_manager=True, is_creator=True)
+        # the previous creator lost the team, the new one got it and its groups
+        self.assertEqual(self.client.get(f'/teams/{self.group.pk}/').status_code, 403)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(f'/teams/{self.group.pk}/').status_code, 204)
+
+    def test_team_creator_is_member_of_groups(self):
+        self.client.force_authenticate(self.owner)
+        self.assertEqual(self.client.get(f'/teams/{self.group.pk}/').status_code, 200)
+        self.assertEqual(self.client.delete(f'/teams/{self.group.pk}/').status_code, 204)
+
+    def test_can_manage_team_member(self):
+        manager = User.objects.create_user(username='manager')
+        Membership.objects.create(team=self.team, user=manager, is_manager=True)
+        Membership.objects.create(team=self.team, user=self.user)
+        self.assertTrue(self.owner.can_manage_team_member(self.team, manager))
+        self.assertTrue(manager.can_manage_team_member(self.team, self.user))
+        self.assertFalse(self.user.can_manage_team_member(self.team, manager))
+        self.assertFalse(manager.can_manage_team_member(self.team, manager))
+
+
+class DeviceReadingsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner')
+        self.team = Team.objects.create(name='team', team_creator=self.user)
+        Membership.objects.create(team=self.team, user=self.user, is_manager=True, is_creator=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_reading(self, **data):
+        return self.client.put(f'/teams/{self.team.pk}/add_device/', data, format='json')
+
+    def test_readings_are_appended(self):
+        response = self.add_reading(temperature=20, humidity='40.5', dosimeter=0.1)
+        self.assertEqual((response.data['temperature'], response.data['humidity']), ('20', '40.5'))
+        response = self.add_reading(temperature=21, humidity=41, dosimeter=0.2, message='ok', result=1)
+        # message and result of readings are kept with the readings, the device shows the outcome of its rules
+        self.assertEqual((response.data['temperature'], response.data['message']), ('21', ''))
+        device = Device.objects.get(team=self.team)
+        self.assertEqual(device.readings.count(), 2)
+        self.assertEqual(device.latest_reading.temperature, 21)
+        self.assertEqual(self.add_reading(temperature='warm').status_code, 400)
+
+    def test_partial_readings_keep_other_metrics(self):
+        self.add_reading(temperature=20, humidity=40, dosimeter=0.1)
+        response = self.add_reading(humidity=41)
+        self.assertEqual((response.data['temperature'], response.data['humidity'], response.data['dosimeter']),
+                         ('20', '41', '0.1'))
+        now = timezone.now()
+        Device.objects.record(self.team.pk, [DeviceReading(timestamp=now, temperature=21),
+                                             DeviceReading(timestamp=now + timedelta(seconds=1), dosimeter=0.2)])
+        device = Device.objects.get(team=self.team)
+        self.assertEqual((device.temperature, device.humidity, device.dosimeter), ('21', '41', '0.2'))
+        Device.objects.record(self.team.pk, [DeviceReading(timestamp=now - timedelta(hours=1), temperature=5),
+                                             DeviceReading(timestamp=now + timedelta(seconds=2), humidity=42)])
+        device = Device.objects.get(team=self.team)
+        self.assertEqual((device.temperature, device.humidity, device.dosimeter), ('21', '42', '0.2'))
+
+    def test_older_readings_keep_the_latest(self):
+        self.add_reading(temperature=20)
+        older = timezone.now() - timedelta(hours=1)
+        Device.objects.record(self.team.pk, [DeviceReading(timestamp=older, temperature=10 + i) for i in range(3)])
+        device = Device.objects.get(team=self.team)
+        self.assertEqual((device.temperature, device.readings.count()), ('20', 4))
+        self.assertEqual(self.client.get(f'/teams/{self.team.pk}/').data['device'][0]['temperature'], '20')
+
+    @skipIf(msgpack is None, 'msgpack is not installed')
+    def test_ingest(self):
+        key = self.client.post(f'/teams/{self.team.pk}/device_key/').data['key']
+        other = Team.objects.create(name='other')
+        other_device = Device.objects.create(team=other)
+        other_key = other_device.set_key()
+        other_device.save()
+        data = [
+            {'key': key, 'readings': [{'temperature': 20, 'timestamp': '2030-01-01T00:00:00Z'},
+                                      [1893456060, 21, 40, 0.1, 'ok', 1], [None, 'warm'], [None, 1, 2, 3, 4]]},
+            {'key': other_key, 'readings': [[None, 5]]},
+            {'key': 'wrong', 'readings': [[None, 1]]},
+        ]
+        client = APIClient()
+        response = client.post('/telemetry/ingest/', msgpack.packb(data), content_type='application/msgpack')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['error_count']), (3, 3))
+        self.assertEqual([(error['batch'], error.get('reading')) for error in response.data['errors']],
+                         [(0, 2), (0, 3), (2, None)])
+        device = Device.objects.get(team=self.team)
+        self.assertEqual((device.temperature, device.readings.count()), ('21', 2))
+        self.assertEqual(device.readings.latest('timestamp').message, 'ok')
+        self.assertEqual(Device.objects.get(pk=other_device.pk).temperature, '5')
+
+        self.assertEqual(client.post('/telemetry/ingest/', [{'key': 'wrong', 'readings': []}],
+                                     format='json').status_code, 403)
+        self.assertEqual(client.post('/telemetry/ingest/', {'key': key}, format='json').status_code, 400)
+        self.client.post(f'/teams/{self.team.pk}/device_key/')
+        self.assertEqual(client.post('/telemetry/ingest/', [{'key': key, 'readings': []}],
+                                     format='json').status_code, 403)
+
+
+class DeviceRollupsTestCase(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='owner')
+        self.team = Team.objects.create(name='team', team_creator=self.user)
+        Membership.objects.create(team=self.team, user=self.user, is_manager=True, is_creator=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.now = timezone.now().replace(minute=30, second=0, microsecond=0)
+
+    def record(self, *readings):
+        return Device.objects.record(self.team.pk, [DeviceReading(timestamp=self.now + timedelta(seconds=seconds),
+                                                                  temperature=temperature)
+                                                    for seconds, temperature in readings])
+
+    def telemetry(self, **params):
+        return self.client.get(f'/teams/{self.team.pk}/telemetry/', params)
+
+    def test_rollups_are_merged(self):
+        self.record((0, 20), (10, 24))
+        device_id = self.record((20, 22), (70, None), (-3600, 10))
+        minute = DeviceRollup.objects.get(device_id=device_id, resolution=60, bucket=self.now)
+        self.assertEqual((minute.count, minute.temperature_count, minute.temperature_min, minute.temperature_max,
+                          minute.temperature_sum), (3, 3, 20, 24, 66))
+        hour = DeviceRollup.objects.get(device_id=device_id, resolution=3600, bucket=self.now.replace(minute=0))
+        self.assertEqual((hour.count, hour.temperature_count), (4, 3))
+        self.assertEqual(DeviceRollup.objects.filter(device_id=device_id, resolution=86400).count(),
+                         len({(self.now + timedelta(seconds=s)).date() for s in (0, -3600)}))
+
+    def test_series_resolution(self):
+        self.record((0, 20), (10, 24), (70, 30))
+        since = (self.now - timedelta(minutes=30)).isoformat()
+        response = self.telemetry(since=since, until=(self.now + timedelta(minutes=30)).isoformat())
+        self.assertEqual(response.data['resolution'], 'raw')
+        self.assertEqual(len(response.data['points']), 3)
+
+        response = self.telemetry(since=since, until=(self.now + timedelta(hours=5)).isoformat())
+        self.assertEqual(response.data['resolution'], 'minute')
+        self.assertEqual([point['temperature'] for point in response.data['points']],
+                         [{'min': 20, 'max': 24, 'avg': 22}, {'min': 30, 'max': 30, 'avg': 30}])
+        self.assertEqual(self.telemetry(since=(self.now - timedelta(days=20)).isoformat()).data['resolution'],
+                         'hour')
+        self.assertEqual(self.telemetry(since=(self.now - timedelta(days=400)).isoformat()).data['resolution'],
+                         'day')
+        self.assertEqual(self.telemetry(resolution='week').status_code, 400)
+        self.assertEqual(self.telemetry(since='yesterday').status_code, 400)
+        self.assertEqual(self.telemetry(since='2020-13-01T00:00:00').status_code, 400)
+        # naive datetimes are in the current time zone
+        self.assertEqual(self.telemetry(since='2020-01-01T00:00:00').data['resolution'], 'day')
+        self.assertEqual(self.telemetry(until='2099-01-01T00:00:00').status_code, 200)
+
+    def test_raw_series_are_not_cut(self):
+        self.record((0, 20), (10, 24), (70, 30))
+        params = {'since': (self.now - timedelta(minutes=30)).isoformat(),
+                  'until': (self.now + timedelta(minutes=30)).isoformat()}
+        with mock.patch('profiles.rollups.MAX_RAW_POINTS', 2):
+            self.assertEqual(self.telemetry(resolution='raw', **params).status_code, 400)
+            response = self.telemetry(**params)
+        self.assertEqual((response.data['resolution'], len(response.data['points'])), ('minute', 2))
+
+    def test_retention(self):
+        device_id = self.record((-86400 * 40, 10), (-86400 * 10, 15), (0, 20))
+        deleted = apply_retention(now=self.now)
+        self.assertEqual((deleted['raw'], deleted['minute'], deleted['hour']), (2, 1, 0))
+        self.assertEqual(DeviceReading.objects.filter(device_id=device_id).count(), 1)
+        self.assertEqual(DeviceRollup.objects.filter(device_id=device_id, resolution=3600).count(), 3)
+
+
+class DeviceRulesTestCase(TestCase):
+    def setUp(self):
+        self.team = Team.objects.create(name='team')
+        self.start = timezone.now()
+        self.engine = RuleEngine()
+
+    def outcomes(self, rule, values, step=10):
+        self.engine.add_device(1, self.team.pk, [DeviceRule(pk=1, team=self.team, result=2, message='alarm', **rule)])
+        outcomes = []
+        for i, value in enumerate(values):
+            reading = DeviceReading(device_id=1, timestamp=self.start + timedelta(seconds=step * i), temperature=value)
+            changed, due = self.engine.evaluate([reading])
+            outcomes.append(changed.get(1, (None, None))[0])
+        return outcomes
+
+    def test_threshold_with_hysteresis(self):
+        self.assertEqual(self.outcomes(dict(metric='temperature', threshold=30, hysteresis=2),
+                                       [29, 31, 29, 28.5, 27, 31]),
+                         [None, 2, None, None, 0, 2])
+
+    def test_average_and_rate(self):
+        self.assertEqual(self.outcomes(dict(metric='temperature', kind=DeviceRule.AVERAGE, threshold=25, window=30),
+                                       [20, 30, 30, 30, 20, 20, 20]),
+                         [None, None, 2, None, None, 0, None])
+        self.engine.devices.clear()
+        # change per minute over the window: 3, 6, 4, 3, 2.4, 1.8
+        self.assertEqual(self.outcomes(dict(metric='temperature', kind=DeviceRule.RATE, threshold=5, hysteresis=2,
+                                            window=60), [20, 20.5, 22, 22, 22, 22, 22]),
+                         [None, None, 2, None, None, 0, None])
+
+    def test_checkpoint_restores_state(self):
+        self.outcomes(dict(metric='temperature', kind=DeviceRule.AVERAGE, threshold=25, window=60), [30, 30])
+        checkpoint = self.engine.devices[1].checkpoint()
+        engine = RuleEngine()
+        engine.add_device(1, self.team.pk, [DeviceRule(pk=1, metric='temperature', kind=DeviceRule.AVERAGE,
+                                                       threshold=25, window=60, result=2, message='alarm')],
+                          checkpoint, (2, 'alarm'))
+        # the average of the restored window (30, 30, 15) keeps the rule active
+        reading = DeviceReading(device_id=1, timestamp=self.start + timedelta(seconds=20), temperature=15)
+        self.assertEqual(engine.evaluate([reading]), ({}, {1}))
+
+    def test_processes_continue_from_the_latest_state(self):
+        device = Device.objects.create(team=self.team)
+        other = Device.objects.create(team=Team.objects.create(name='other'))
+        DeviceRule.objects.create(team=self.team, metric='temperature', kind=DeviceRule.AVERAGE, threshold=20,
+                                  window=60, result=2, message='alarm')
+        engines = [RuleEngine(max_size=1), RuleEngine(max_size=1)]
+        for i, (engine, value) in enumerate(zip(engines * 2, [40, 10, 10, 10])):
+            engine.process([
+                DeviceReading(device=device, timestamp=self.start + timedelta(seconds=i), temperature=value),
+                DeviceReading(device=other, timestamp=self.start, temperature=value)])
+        # the average of all four readings is 17.5, each engine saw an average of 25 or 20
+        self.assertEqual(Device.objects.values_list('result', 'message').get(pk=device.pk), (0, ''))
+        self.assertEqual([len(engine.devices) for engine in engines], [1, 1])
+
+
+class DeviceRulesIngestTestCase(TransactionTestCase):
+    # rules are evaluated after commit, so the test transactions must really commit
+
+    def setUp(self):
+        cache.clear()
+        rule_engine.clear()
+        self.user = User.objects.create_user(username='owner')
+        self.team = Team.objects.create(name='team', team_creator=self.user)
+        Membership.objects.create(team=self.team, user=self.user, is_manager=True, is_creator=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_reading(self, temperature):
+        return self.client.put(f'/teams/{self.team.pk}/add_device/', {'temperature': temperature}, format='json')
+
+    def test_results_change_on_transitions(self):
+        url = f'/teams/{self.team.pk}/device_rules/'
+        response = self.client.post(url, {'metric': 'temperature', 'threshold': 30, 'hysteresis': 1,
+                                          'result': 2, 'message': 'hot'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.add_reading(25)
+        device = Device.objects.get(team=self.team)
+        self.assertIsNone(device.result)
+        self.add_reading(31)
+        self.assertEqual(Device.objects.values_list('result', 'message').get(pk=device.pk), (2, 'hot'))
+        # the rule is still active inside the hysteresis, only the state of the device is written
+        with CaptureQueriesContext(connection) as queries:
+            self.add_reading(29.5)
+        self.assertFalse([query for query in queries if '"result"' in query['sql'] and 'UPDATE' in query['sql']])
+        self.add_reading(28)
+        self.assertEqual(Device.objects.values_list('result', 'message').get(pk=device.pk), (0, ''))
+
+        self.add_reading(31)
+        rule_id = self.client.get(url).data[0]['pk']
+        self.assertEqual(self.client.delete(f'/teams/{self.team.pk}/del_device_rule/{rule_id}/').status_code, 204)
+        self.add_reading(40)
+        self.assertEqual(Device.objects.get(pk=device.pk).result, 0)
+
+    def test_errors_are_logged(self):
+        with mock.patch.object(rule_engine, 'load', side_effect=OperationalError('lock timeout')), \
+                self.assertLogs('profiles.rules', 'ERROR'):
+            self.assertEqual(self.add_reading(25).status_code, 200)
+        self.assertEqual(Device.objects.get(team=self.team).readings.count(), 1)
+        self.assertEqual(self.add_reading(26).status_code, 200)
@@ -1,16 +1,35 @@
+from datetime import timedelta
+
 from allauth.account.models import EmailConfirmationHMAC
-from django.http import HttpResponseRedirect
+from rest_auth.views import UserDetailsView as BaseUserDetailsView
+from django.http import HttpResponseRedirect, StreamingHttpResponse
 from django.urls import reverse_lazy
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.serializers import Serializer
 
-from profiles.exceptions import MemberException
-from profiles.models import Team, Membership, User, Device
+from profiles.exceptions import MemberException, TelemetryException
+from profiles.models import Team, Membership, User, Device, DeviceReading, DeviceRule
 from profiles.permissions import IsTeamOrGroupCreator, IsTeamOrGroupManager, IsTeamOrGroupMember
-from profiles.serializers import TeamSerializer, GroupSerializer, DeviceSerializer
-from projects.models import Item, Collection
+from profiles.roles import get_roles
+from profiles.rollups import series, RESOLUTIONS as TELEMETRY_RESOLUTIONS
+from profiles.serializers import TeamSerializer, GroupSerializer, DeviceSerializer, DeviceReadingSerializer, \
+    DeviceRuleSerializer
+from profiles.telemetry import ingest
+from projects.changes import changes_since, MAX_CHANGES
+from projects.compiled import compiled_data
+from projects.export import export_items, FORMATS as EXPORT_FORMATS
+from projects.fieldsets import get_selection, normalized
+from projects.importer import import_items, FORMATS as IMPORT_FORMATS
+from projects.filters import filter_backlog_items
+from projects.models import Backlog, Item, Collection
+from projects.pagination import BacklogCursorPagination
+from projects.tree_cache import versioned_tree
+from projects.search import search, search_supported
 from projects.serializers import BacklogSerializer, ItemSerializer, CollectionSerializer, TeamCollectionsSerializer
 
 
@@ -21,6 +40,33 @@ def confirm_email(request, key):
     return HttpResponseRedirect(reverse_lazy('api'))
 
 
+class TelemetryIngestView(APIView):
+    """
+    Stores batches of device readings [{"key": device key, "readings": [...]}], authenticated by device keys
+    """
+    authentication_classes = []
+    permission_classes = [permissions.AllowAny]
+
+    def post(self, request):
+        return Response(ingest(request.data))
+
+
+class UserDetailsView(BaseUserDetailsView):
+    """
+    Current user with assigned items, supports sparse fieldsets and the normalized shape
+    """
+
+    def get_object(self):
+        selection = get_selection(self.request)
+        queryset = self.get_serializer_class().setup_eager_loading(User.objects.filter(pk=self.request.user.pk),
+                                                                   selection)
+        return queryset.get()
+
+    def retrieve(self, request, *args, **kwargs):
+        selection = get_selection(request)
+        return Response(normalized(selection, self.get_serializer(self.get_object(), selection=selection).data))
+
+
 class TeamViewSet(viewsets.ModelViewSet):
     """
     ViewSet to manage teams
@@ -29,13 +75,21 @@ class TeamViewSet(viewsets.ModelViewSet):
     serializer_class = TeamSerializer
     http_method_names = ['get', 'post', 'put', 'delete']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ['list', 'retrieve']:
+            queryset = TeamSerializer.setup_eager_loading(queryset, get_selection(self.request))
+        return queryset
+
     def get_permissions(self):
         permission_classes = [permissions.IsAuthenticated]
         if self.action in ['update', 'destroy', 'member_to_manager', 'manager_to_member']:
             permission_classes += [IsTeamOrGroupCreator]
-        if self.action in ['retrieve', 'get_backlog', 'collections', 'add_device']:
+        if self.action in ['retrieve', 'get_backlog', 'backlog_items', 'collections', 'add_device', 'search',
+                           'export', 'telemetry', 'device_rules', 'sync']:
             permission_classes += [IsTeamOrGroupMember]
-        if self.action in ['add_group', 'del_member', 'add_member', 'add_item', 'add_collection']:
+        if self.action in ['add_group', 'del_member', 'add_member', 'add_item', 'add_items', 'add_collection',
+                           'import_items', 'device_key', 'del_device_rule']:
             permission_classes += [IsTeamOrGroupManager]
         return [permission() for permission in permission_classes]
 
@@ -43,7 +97,7 @@ class TeamViewSet(viewsets.ModelViewSet):
         serializer = self.get_serializer_class()
         team = serializer(data=request.data)
         if team.is_valid():
-            obj = Team(**team.validated_data)
+            obj = Team(**team.validated_data, team_creator=request.user)
             obj.save()
             Membership.objects.create(team=obj, user=request.user, is_manager=True, is_creator=True).save()
             return Response(serializer(obj).data)
@@ -58,13 +112,22 @@ class TeamViewSet(viewsets.ModelViewSet):
         :return:
         """
         serializer = self.get_serializer_class()
-        queryset = Team.objects.filter(id__in=request.user.memberships.values_list('team__id'), is_group=False)
-        page = self.paginate_queryset(queryset)
-        if page is not None and request.GET.get('page') is not None:
-            chats = serializer(page, many=True)
-            return self.get_paginated_response(chats.data)
-        chats = serializer(queryset, many=True)
-        return Response(chats.data)
+        queryset = self.get_queryset().filter(id__in=request.user.memberships.values_list('team__id'),
+                                              is_group=False)
+        selection = get_selection(request)
+        page = self.paginate_queryset(queryset) if request.GET.get('page') is not None else None
+        if page is not None:
+            chats = serializer(page, many=True, selection=selection)
+            response = self.get_paginated_response(chats.data)
+            if selection.included is not None:
+                response.data['included'] = selection.included.resolve()
+            return response
+        chats = serializer(queryset, many=True, selection=selection)
+        return Response(normalized(selection, chats.data))
+
+    def retrieve(self, request, *args, **kwargs):
+        selection = get_selection(request)
+        return Response(normalized(selection, self.get_serializer(self.get_object(), selection=selection).data))
 
     @action(detail=True, methods=['post'], url_path='add_group', url_name='add_group', serializer_class=GroupSerializer)
     def add_group(self, request, pk=None):
@@ -77,28 +140,118 @@ class TeamViewSet(viewsets.ModelViewSet):
             obj = Team(**group.validated_data)
             obj.is_group = True
             obj.team = team
+            obj.team_creator_id = team.team_creator_id
             obj.save()
             Membership.objects.create(team=obj, user=request.user, is_manager=True, is_creator=True).save()
             return Response(serializer(obj).data)
         return Response(team.errors, status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=['put'], url_path='add_device', url_name='add_device',
-            serializer_class=DeviceSerializer)
+            serializer_class=DeviceReadingSerializer)
     def add_device(self, request, pk=None):
+        """
+        Appends a reading to the device of the team, the device shows the latest value of each metric
+        """
         team = self.get_object()
-        serializer = self.get_serializer_class()
-        device = serializer(data=request.data)
-        if device.is_valid():
-            if len(team.device.all()):
-                obj = team.device.all()[0]
-            else:
-                obj = Device()
-            obj.team = team
-            for key, value in device.validated_data.items():
-                setattr(obj, key, value)
-            obj.save()
-            return Response(serializer(obj).data)
-        return Response(device.errors, status=status.HTTP_400_BAD_REQUEST)
+        reading = DeviceReadingSerializer(data=request.data)
+        if reading.is_valid():
+            device_id = Device.objects.record(team.pk, [DeviceReading(**reading.validated_data)])
+            return Response(DeviceSerializer(Device.objects.get(pk=device_id)).data)
+        return Response(reading.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['post'], url_path='device_key', url_name='device_key', serializer_class=Serializer)
+    def device_key(self, request, pk=None):
+        """
+        Generates a new telemetry ingest key of the team device, the previous key stops working.
+        The key is only shown in this response
+        """
+        team = self.get_object()
+        device = Device.objects.filter(team=team).first() or Device(team=team)
+        key = device.set_key()
+        device.save()
+        return Response({'device': device.pk, 'key': key})
+
+    @action(detail=True, methods=['get'], url_path='telemetry', url_name='telemetry', serializer_class=Serializer)
+    def telemetry(self, request, pk=None):
+        """
+        Readings of the team device as points with min, max and avg of each metric.
+        Params: since and until (ISO 8601, the last day by default),
+        resolution (auto, raw, minute, hour or day, auto chooses it by the window),
+        raw windows with too many readings are refused
+        """
+        team = self.get_object()
+        device_id = Device.objects.filter(team=team).values_list('pk', flat=True).first()
+        if device_id is None:
+            return Response(data={'errors': ['Team has no device']}, status=status.HTTP_404_NOT_FOUND)
+        params = request.query_params
+        now = timezone.now()
+        since, until = params.get('since'), params.get('until')
+        try:
+            # parse_datetime raises ValueError for well formed but invalid datetimes, e.g. month 13
+            since = parse_datetime(since) if since else now - timedelta(days=1)
+            until = parse_datetime(until) if until else now
+        except ValueError:
+            since = until = None
+        if since is not None and timezone.is_naive(since):
+            since = timezone.make_aware(since)
+        if until is not None and timezone.is_naive(until):
+            until = timezone.make_aware(until)
+        resolution = params.get('resolution', 'auto')
+        if since is None or until is None or since >= until:
+            return Response(data={'errors': ['since and until must be ISO 8601 datetimes, since before until']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if resolution not in TELEMETRY_RESOLUTIONS:
+            return Response(data={'errors': [f'resolution must be one of {", ".join(TELEMETRY_RESOLUTIONS)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        try:
+            return Response(series(device_id, since, until, resolution, now))
+        except TelemetryException as e:
+            return Response(data={'errors': [str(e)]}, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['get'], url_path='sync', url_name='sync', serializer_class=Serializer)
+    def sync(self, request, pk=None):
+        """
+        Items, lists, collections and memberships of the team changed after the cursor and ids of deleted ones.
+        Params: since (cursor of the previous sync, 0 for everything), limit (changes per response).
+        Next sync starts from the returned cursor, has_more means there are more changes after it
+        """
+        team = self.get_object()
+        try:
+            since = int(request.query_params.get('since', 0))
+            limit = int(request.query_params.get('limit', MAX_CHANGES))
+        except ValueError:
+            return Response(data={'errors': ['since and limit must be integers']}, status=status.HTTP_400_BAD_REQUEST)
+        if since < 0 or not 0 < limit <= MAX_CHANGES:
+            return Response(data={'errors': [f'since must not be negative, limit must be from 1 to {MAX_CHANGES}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(changes_since(team.pk, since, limit))
+
+    @action(detail=True, methods=['get', 'post'], url_path='device_rules', url_name='device_rules',
+            serializer_class=DeviceRuleSerializer)
+    def device_rules(self, request, pk=None):
+        """
+        Rules which set the result and message of the team device, managers add rules with POST
+        """
+        team = self.get_object()
+        if request.method == 'GET':
+            return Response(DeviceRuleSerializer(team.device_rules.order_by('pk'), many=True).data)
+        if not get_roles(request).is_manager(team.pk):
+            return Response(status=status.HTTP_403_FORBIDDEN)
+        rule = DeviceRuleSerializer(data=request.data)
+        if rule.is_valid():
+            rule.save(team=team)
+            return Response(rule.data)
+        return Response(rule.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['delete'], url_path='del_device_rule/(?P<rule_id>[^/.]+)',
+            url_name='del_device_rule', serializer_class=Serializer)
+    def del_device_rule(self, request, rule_id, pk=None):
+        team = self.get_object()
+        try:
+            team.device_rules.get(pk=rule_id).delete()
+        except (DeviceRule.DoesNotExist, ValueError):
+            return Response(data={'errors': ['Rule is not found']}, status=status.HTTP_404_NOT_FOUND)
+        return Response(status=status.HTTP_204_NO_CONTENT)
 
     @action(detail=True, methods=['post'], url_path='add_member/(?P<username>[^/.]+)',
             url_name='add_member', serializer_class=Serializer)
@@ -182,10 +335,91 @@ class TeamViewSet(viewsets.ModelViewSet):
     def get_backlog(self, request, pk=None):
         try:
             team = self.get_object()
-            return Response(BacklogSerializer(team.backlog).data)
+            selection = get_selection(request)
+            if selection.included is None:
+                return Response(compiled_data(BacklogSerializer, Backlog.objects.filter(pk=team.pk), request)[0])
+            backlog = BacklogSerializer.prefetch(team.backlog, selection)
+            return Response(normalized(selection, BacklogSerializer(backlog, selection=selection).data))
         except Team.DoesNotExist:
             return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['get'], url_path='backlog/items', url_name='backlog_items',
+            serializer_class=ItemSerializer, pagination_class=BacklogCursorPagination)
+    def backlog_items(self, request, pk=None):
+        """
+        Backlog items ordered by start date, paginated with a cursor.
+        Filters: assigned_user, list (id, "none" or "any"), end_date_after, end_date_before
+        """
+        team = self.get_object()
+        selection = get_selection(request)
+        queryset = ItemSerializer.setup_eager_loading(Item.objects.filter(backlog_id=team.pk), selection)
+        queryset = filter_backlog_items(queryset, request.query_params)
+        page = self.paginate_queryset(queryset)
+        response = self.get_paginated_response(ItemSerializer(page, many=True, selection=selection).data)
+        if selection.included is not None:
+            response.data['included'] = selection.included.resolve()
+        return response
+
+    @action(detail=True, methods=['get'], url_path='export', url_name='export', serializer_class=Serializer)
+    def export(self, request, pk=None):
+        """
+        Streams all items of the team with their lists, collections and users.
+        Params: type (ndjson or csv), gzip (1 to compress)
+        """
+        team = self.get_object()
+        export_type = request.query_params.get('type', 'ndjson')
+        if export_type not in EXPORT_FORMATS:
+            return Response(data={'errors': [f'type must be one of {", ".join(EXPORT_FORMATS)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        gzip = request.query_params.get('gzip') in ('1', 'true')
+        content_type, chunks = export_items(team.pk, export_type, gzip)
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        filename = f'team-{team.pk}.{export_type}' + ('.gz' if gzip else '')
+        response['Content-Disposition'] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=True, methods=['post'], url_path='import', url_name='import', serializer_class=Serializer)
+    def import_items(self, request, pk=None):
+        """
+        Creates backlog items from the rows of an uploaded file (multipart field "file").
+        Params: type (ndjson or csv, by default the extension of the file).
+        Columns: name, description, units, end_date, assigned_user, list_name, collection_name.
+        Invalid rows are skipped and reported in the summary
+        """
+        team = self.get_object()
+        file = request.FILES.get('file')
+        if file is None:
+            return Response(data={'errors': ['File is required']}, status=status.HTTP_400_BAD_REQUEST)
+        import_type = request.query_params.get('type') or ('csv' if file.name.lower().endswith('.csv') else 'ndjson')
+        if import_type not in IMPORT_FORMATS:
+            return Response(data={'errors': [f'type must be one of {", ".join(IMPORT_FORMATS)}']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        return Response(import_items(team, request.user, file, import_type))
+
+    @action(detail=True, methods=['get'], url_path='search', url_name='search', serializer_class=Serializer)
+    def search(self, request, pk=None):
+        """
+        Full text search over items, lists and collections of the team.
+        Params: q, type (comma separated item, list, collection), offset, page_size
+        """
+        team = self.get_object()
+        if not search_supported():
+            return Response(data={'errors': ['Full text search is not supported by the database']},
+                            status=status.HTTP_501_NOT_IMPLEMENTED)
+        try:
+            offset = max(int(request.query_params.get('offset', 0)), 0)
+            page_size = min(max(int(request.query_params.get('page_size', 20)), 1), 100)
+        except ValueError:
+            return Response(data={'errors': ['offset and page_size must be numbers']},
+                            status=status.HTTP_400_BAD_REQUEST)
+        kinds = [kind for kind in request.query_params.get('type', '').split(',') if kind]
+        hits = search(team.pk, request.query_params.get('q', ''), kinds, limit=page_size + 1, offset=offset)
+        return Response({
+            'next_offset': offset + page_size if len(hits) > page_size else None,
+            'results': [{'type': kind, 'pk': pk, 'name': name, 'rank': rank}
+                        for kind, pk, name, rank in hits[:page_size]],
+        })
+
     @action(detail=True, methods=['post'], url_path='add_item', url_name='add_item',
             serializer_class=ItemSerializer)
     def add_item(self, request, pk=None):
@@ -194,19 +428,32 @@ class TeamViewSet(viewsets.ModelViewSet):
             user = request.user
             item = ItemSerializer(data=request.data)
             if item.is_valid():
-                item = Item(**item.validated_data, creator=request.user, backlog=team.backlog)
+                item = Item(**item.validated_data, creator=request.user, backlog_id=team.pk)
                 item.save()
                 return Response(ItemSerializer(item).data)
             return Response(item.errors, status=status.HTTP_400_BAD_REQUEST)
         except Team.DoesNotExist:
             return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['post'], url_path='add_items', url_name='add_items',
+            serializer_class=ItemSerializer)
+    def add_items(self, request, pk=None):
+        """
+        Creates a list of backlog items in one transaction, errors are reported per item
+        """
+        team = self.get_object()
+        items = ItemSerializer(data=request.data, many=True)
+        if items.is_valid():
+            items.save(creator=request.user, backlog_id=team.pk)
+            return Response(items.data)
+        return Response(items.errors, status=status.HTTP_400_BAD_REQUEST)
+
     @action(detail=True, methods=['get'], url_path='collections', url_name='collections',
             serializer_class=Serializer)
     def collections(self, request, pk=None):
         try:
             team = self.get_object()
-            return Response(TeamCollectionsSerializer(team).data)
+            return versioned_tree(request, 'collections', team, team.pk, TeamCollectionsSerializer)
         except Team.DoesNotExist:
             return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)
 
@@ -3,3 +3,9 @@ from django.apps import AppConfig
 
 class ProjectsConfig(AppConfig):
     name = 'projects'
+
+    def ready(self):
+        import projects.revisions  # noqa: F401 connects revision signals
+        import projects.tree_cache  # noqa: F401 connects tree eviction signals
+        import projects.changes  # noqa: F401 connects change log signals
+        import projects.push  # noqa: F401 connects push event signals
@@ -0,0 +1,54 @@
+"""
+Helpers for the bench_* management commands.
+Benchmarks run inside a transaction which is rolled back, so they can be used against a dev database
+"""
+import time
+from contextlib import contextmanager
+
+from django.db import transaction
+from django.utils import timezone
+
+from profiles.models import User, Team, Membership
+from projects.models import Collection, List, Item
+
+
+@contextmanager
+def rollback():
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+@contextmanager
+def timer(results, name, clock=time.perf_counter):
+    """measures wall time, or CPU time of the process with clock=time.process_time"""
+    start = clock()
+    yield
+    results[name] = clock() - start
+
+
+def seed_team(items=0, lists=1, users=1, prefix='bench'):
+    """
+    Creates a team with a board of `lists` lists and `items` items spread over the lists and users
+    """
+    users = [User(username=f'{prefix}-{i}-{time.time_ns()}') for i in range(users)]
+    for user in users:
+        user.save()
+    team = Team.objects.create(name=prefix, team_creator=users[0])
+    Membership.objects.bulk_create([Membership(team=team, user=user, is_manager=True, is_creator=not i)
+                                    for i, user in enumerate(users)])
+    collection = Collection.objects.create(team=team, name=prefix)
+    lists = [List.objects.create(collection=collection, name=f'{prefix}-{i}') for i in range(lists)]
+    now = timezone.now()
+    Item.objects.bulk_create((Item(name=f'{prefix} item {i}', description='x' * 100, backlog_id=team.pk,
+                                   list=lists[i % len(lists)], creator=users[0], assigned_user=users[i % len(users)],
+                                   start_date=now, end_date=now) for i in range(items)), batch_size=500)
+    return users, team, collection, lists
+
+
+def report(stdout, results, count=None, unit='items'):
+    for name, seconds in results.items():
+        line = f'{name:<32} {seconds * 1000:10.1f} ms'
+        if count:
+            line += f' {count / seconds:12.0f} {unit}/s'
+        stdout.write(line)
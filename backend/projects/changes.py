@@ -0,0 +1,197 @@
+"""
+Change log of teams for delta sync.
+Saved and deleted items, lists, collections and memberships get the next numbers of the change sequence
+of their team (Team.change_seq), one Change row per object keeps its last number and deletions are kept
+as tombstones. The sequence is incremented in the transaction of the change, which locks the team row
+until commit, so changes of a team commit in the order of their numbers and a cursor never skips a change.
+The increment returns the new number (UPDATE ... RETURNING) and the Change rows are upserted,
+so a change costs two statements per team. Positions rewritten by rebalance are changes too.
+A sync reads the changes after the cursor with one range scan of the (team, seq) index
+"""
+import sqlite3
+import threading
+from collections import OrderedDict
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete, pre_delete
+from django.dispatch import receiver
+
+from profiles.models import Team, Membership
+from profiles.serializers import SyncMemberSerializer
+from projects.compiled import compile_serializer
+from projects.models import Collection, List, Item, Change, items_changed
+from projects.ranks import rebalanced
+from projects.serializers import ItemSerializer, ListSerializer, CollectionSerializer
+
+# objects of a sync response: model, serializer and its fields (nested trees are left out)
+SYNC = OrderedDict([
+    ('collections', (Change.COLLECTION, Collection, CollectionSerializer, 'pk,name,description,date_created')),
+    ('lists', (Change.LIST, List, ListSerializer, 'pk,name,collection,date_created,position')),
+    ('items', (Change.ITEM, Item, ItemSerializer, None)),
+    ('memberships', (Change.MEMBERSHIP, Membership, SyncMemberSerializer, None)),
+])
+MAX_CHANGES = 5000
+
+NEXT_SEQ = 'UPDATE {teams} SET change_seq = change_seq + %s WHERE id = %s RETURNING change_seq'
+UPSERT_CHANGES = ('INSERT INTO {changes} (team_id, model, object_id, deleted, seq) VALUES {values} '
+                  'ON CONFLICT (team_id, model, object_id) DO UPDATE '
+                  'SET seq = excluded.seq, deleted = excluded.deleted')
+
+_deleting = threading.local()
+
+
+def returns_from_writes():
+    """the database supports UPDATE ... RETURNING and INSERT ... ON CONFLICT DO UPDATE"""
+    return connection.vendor == 'postgresql' or connection.vendor == 'sqlite' and sqlite3.sqlite_version_info >= (
+        3, 35)
+
+
+def next_seq(team_id, count):
+    """adds count to the change sequence of the team and returns its new value, None if the team is gone"""
+    if returns_from_writes():
+        with connection.cursor() as cursor:
+            cursor.execute(NEXT_SEQ.format(teams=connection.ops.quote_name(Team._meta.db_table)), [count, team_id])
+            row = cursor.fetchone()
+        return row[0] if row else None
+    teams = Team.objects.filter(pk=team_id)
+    if not teams.update(change_seq=F('change_seq') + count):
+        return None
+    return teams.values_list('change_seq', flat=True).get()
+
+
+def save_changes(team_id, numbered, batch_size=500):
+    """writes the last change [(model, object id, deleted, seq)] of objects of the team"""
+    if returns_from_writes():
+        with connection.cursor() as cursor:
+            for start in range(0, len(numbered), batch_size):
+                batch = numbered[start:start + batch_size]
+                cursor.execute(UPSERT_CHANGES.format(changes=connection.ops.quote_name(Change._meta.db_table),
+                                                     values=', '.join(['(%s, %s, %s, %s, %s)'] * len(batch))),
+                               [value for model, object_id, deleted, seq in batch
+                                for value in (team_id, model, object_id, deleted, seq)])
+        return
+    if len(numbered) == 1:
+        model, object_id, deleted, seq = numbered[0]
+        if not Change.objects.filter(team_id=team_id, model=model, object_id=object_id).update(
+                seq=seq, deleted=deleted):
+            Change.objects.create(team_id=team_id, model=model, object_id=object_id, seq=seq, deleted=deleted)
+        return
+    existing = {(change.model, change.object_id): change for change in Change.objects.filter(
+        team_id=team_id, model__in={change[0] for change in numbered},
+        object_id__in={change[1] for change in numbered})}
+    updated, created = [], []
+    for model, object_id, deleted, seq in numbered:
+        change = existing.get((model, object_id))
+        if change is None:
+            created.append(Change(team_id=team_id, model=model, object_id=object_id, seq=seq, deleted=deleted))
+        else:
+            change.seq, change.deleted = seq, deleted
+            updated.append(change)
+    Change.objects.bulk_update(updated, ['seq', 'deleted'], batch_size=batch_size)
+    Change.objects.bulk_create(created, batch_size=batch_size)
+
+
+def record(changes):
+    """
+    Numbers changes [(team id, model, object id, deleted)], the last change of an object wins.
+    Teams are locked in the order of their ids, a team takes two queries where the database
+    returns values from writes
+    """
+    skip = getattr(_deleting, 'teams', set())
+    by_team = {}
+    for team_id, model, object_id, deleted in changes:
+        if team_id is not None and team_id not in skip:
+            by_team.setdefault(team_id, OrderedDict())[(model, object_id)] = deleted
+    if not by_team:
+        return
+    with transaction.atomic(savepoint=False):
+        for team_id in sorted(by_team):
+            objects = by_team[team_id]
+            last = next_seq(team_id, len(objects))
+            if last is None:
+                continue
+            save_changes(team_id, [(model, object_id, deleted, seq) for ((model, object_id), deleted), seq in
+                                   zip(objects.items(), range(last - len(objects) + 1, last + 1))])
+
+
+def changes_since(team_id, since, limit=MAX_CHANGES):
+    """
+    Objects of the team changed after the cursor `since` grouped by type, ids of deleted objects
+    and the cursor of the next sync
+    """
+    changes = list(Change.objects.filter(team_id=team_id, seq__gt=since).order_by('seq')
+                   .values_list('seq', 'model', 'object_id', 'deleted')[:limit + 1])
+    has_more = len(changes) > limit
+    changes = changes[:limit]
+    data = OrderedDict([('cursor', changes[-1][0] if changes else since), ('has_more', has_more)])
+    deleted = OrderedDict()
+    for name, (model_name, model, serializer_class, fields) in SYNC.items():
+        ids = [object_id for seq, model, object_id, is_deleted in changes if model == model_name and not is_deleted]
+        objects = compile_serializer(serializer_class, fields).render(model.objects.filter(pk__in=ids)) if ids else []
+        # objects which are gone without a change (bulk deletes) are reported as deleted
+        missing = set(ids) - {obj['pk'] for obj in objects}
+        data[name] = objects
+        deleted[name] = [object_id for seq, model, object_id, is_deleted in changes
+                         if model == model_name and (is_deleted or object_id in missing)]
+    data['deleted'] = deleted
+    return data
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_changed(sender, instance, **kwargs):
+    team_id = getattr(instance, 'loaded_parents', (None, None))[1]
+    deleted = 'created' not in kwargs
+    changes = [(instance.backlog_id, Change.ITEM, instance.pk, deleted)]
+    if team_id is not None and team_id != instance.backlog_id:
+        changes.append((team_id, Change.ITEM, instance.pk, True))
+    record(changes)
+
+
+@receiver(items_changed, sender=Item)
+def items_bulk_changed(sender, items, teams, **kwargs):
+    current = dict(Item.objects.filter(pk__in=items).values_list('pk', 'backlog_id'))
+    # items are saved in their current team even when the update didn't change it
+    teams = set(teams) | set(current.values())
+    record((team_id, Change.ITEM, pk, current.get(pk) != team_id) for team_id in teams for pk in items)
+
+
+@receiver(post_save, sender=List)
+@receiver(post_delete, sender=List)
+def list_changed(sender, instance, **kwargs):
+    team_id = Collection.objects.filter(pk=instance.collection_id).values_list('team', flat=True).first()
+    record([(team_id, Change.LIST, instance.pk, 'created' not in kwargs)])
+
+
+@receiver(rebalanced, sender=Item)
+@receiver(rebalanced, sender=List)
+def positions_rebalanced(sender, objects, **kwargs):
+    if sender is Item:
+        team_of = {obj.pk: obj.backlog_id for obj in objects}
+    else:
+        teams = dict(Collection.objects.filter(pk__in={obj.collection_id for obj in objects}).values_list(
+            'pk', 'team'))
+        team_of = {obj.pk: teams.get(obj.collection_id) for obj in objects}
+    record((team_id, sender._meta.model_name, pk, False) for pk, team_id in team_of.items())
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def team_object_changed(sender, instance, **kwargs):
+    record([(instance.team_id, sender._meta.model_name, instance.pk, 'created' not in kwargs)])
+
+
+@receiver(pre_delete, sender=Team)
+def team_deleting(sender, instance, **kwargs):
+    # objects deleted with the team don't get changes, their rows would reference the deleted team
+    if not hasattr(_deleting, 'teams'):
+        _deleting.teams = set()
+    _deleting.teams.add(instance.pk)
+
+
+@receiver(post_delete, sender=Team)
+def team_deleted(sender, instance, **kwargs):
+    getattr(_deleting, 'teams', set()).discard(instance.pk)
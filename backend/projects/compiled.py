@@ -0,0 +1,119 @@
+"""
+Read-only serializers compiled from the fields of DRF serializers.
+Rows are fetched with .values(), nested objects with joins and nested lists with one query per level,
+and rendered to the same data as the DRF serializer without instantiating models or serializers
+"""
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
+
+from rest_framework import serializers
+from rest_framework.relations import ManyRelatedField
+
+from profiles.serializers import NoneIfEmptyListSerializer
+from projects.fieldsets import Selection, get_relation, parse_paths
+
+# fields which render values of their model fields as they are
+PLAIN_FIELDS = (serializers.ReadOnlyField, serializers.CharField, serializers.IntegerField,
+                serializers.BooleanField, serializers.PrimaryKeyRelatedField)
+
+VALUE, NESTED, MANY = range(3)
+
+
+class CompileError(Exception):
+    pass
+
+
+class CompiledSerializer:
+    """
+    Renders querysets with the fields of a serializer instance.
+    Supports model fields, primary keys of relations, nested serializers of forward relations
+    and nested lists of reverse foreign keys
+    """
+
+    def __init__(self, serializer, prefix=''):
+        self.model = serializer.Meta.model
+        self.pk = f'{prefix}pk'
+        self.columns = [self.pk]
+        self.steps = []
+        self.many = []
+        for name, field in serializer.fields.items():
+            source = field.source
+            if not source or source == '*' or '.' in source or isinstance(field, serializers.SerializerMethodField):
+                raise CompileError(f'{type(serializer).__name__}.{name} can not be compiled')
+            many = isinstance(field, serializers.ListSerializer)
+            child = field.child if many else field
+            if many or isinstance(field, ManyRelatedField):
+                relation = get_relation(self.model, source)
+                if relation is None or not relation.one_to_many:
+                    raise CompileError(f'{type(serializer).__name__}.{name} is not a reverse foreign key')
+                nested = CompiledSerializer(child) if many else None
+                empty = None if isinstance(field, NoneIfEmptyListSerializer) else []
+                self.many.append((name, nested, relation.related_model, relation.field.name, empty))
+                self.steps.append((name, MANY, len(self.many) - 1))
+            elif isinstance(child, serializers.BaseSerializer):
+                nested = CompiledSerializer(child, f'{prefix}{source}__')
+                self.columns += nested.columns
+                self.steps.append((name, NESTED, nested))
+            else:
+                column = f'{prefix}{source}'
+                self.columns.append(column)
+                convert = None if type(field) in PLAIN_FIELDS else field.to_representation
+                self.steps.append((name, VALUE, (column, convert)))
+
+    def render(self, queryset):
+        """list of rendered objects of the queryset"""
+        rows = list(queryset.values(*dict.fromkeys(self.columns)))
+        return self.render_rows(rows)
+
+    def render_rows(self, rows):
+        lists = {}
+        self.fetch_lists(rows, lists)
+        return [self.render_row(row, lists) for row in rows]
+
+    def fetch_lists(self, rows, lists):
+        """loads nested lists of all rows, one query for each nested list"""
+        for name, kind, arg in self.steps:
+            if kind == NESTED:
+                arg.fetch_lists(rows, lists)
+        if not self.many:
+            return
+        parents = {row[self.pk] for row in rows} - {None}
+        for index, (name, nested, model, link, empty) in enumerate(self.many):
+            grouped = defaultdict(list)
+            queryset = model._default_manager.filter(**{f'{link}__in': parents})
+            if nested is None:
+                for parent, pk in queryset.values_list(link, 'pk'):
+                    grouped[parent].append(pk)
+            else:
+                rows = list(queryset.values(*dict.fromkeys([link, *nested.columns])))
+                for row, obj in zip(rows, nested.render_rows(rows)):
+                    grouped[row[link]].append(obj)
+            lists[(self, index)] = grouped
+
+    def render_row(self, row, lists):
+        obj = OrderedDict()
+        for name, kind, arg in self.steps:
+            if kind == VALUE:
+                column, convert = arg
+                value = row[column]
+                obj[name] = value if value is None or convert is None else convert(value)
+            elif kind == NESTED:
+                obj[name] = None if row[arg.pk] is None else arg.render_row(row, lists)
+            else:
+                obj[name] = lists[(self, arg)].get(row[self.pk]) or self.many[arg][4]
+        return obj
+
+
+@lru_cache(maxsize=256)
+def compile_serializer(serializer_class, fields=None, expand=None):
+    """compiled serializer for the ?fields= and ?expand= parameters"""
+    return CompiledSerializer(serializer_class(selection=Selection(parse_paths(fields), parse_paths(expand), None)))
+
+
+def compiled_data(serializer_class, queryset, request=None):
+    """
+    Data of the serializer for all objects of the queryset and the fields of the GET request.
+    The normalized shape is not supported
+    """
+    params = request.query_params if request is not None and request.method == 'GET' else {}
+    return compile_serializer(serializer_class, params.get('fields'), params.get('expand')).render(queryset)
@@ -0,0 +1,9 @@
+from rest_framework import status
+
+
+class BulkItemsException(Exception):
+    """raised if a batch of items can't be changed together"""
+
+    def __init__(self, message, status_code=status.HTTP_400_BAD_REQUEST):
+        super().__init__(message)
+        self.status_code = status_code
@@ -0,0 +1,98 @@
+"""
+Streaming export of the items of a team with their lists, collections and users.
+Rows are read with a server-side cursor (on PostgreSQL) and written in chunks,
+so memory use doesn't depend on the number of items
+"""
+import csv
+import zlib
+
+from rest_framework.utils.encoders import JSONEncoder
+
+from backend.renderers import JSONRenderer
+from projects.models import Item
+
+COLUMNS = (
+    ('pk', 'pk'),
+    ('name', 'name'),
+    ('description', 'description'),
+    ('units', 'units'),
+    ('start_date', 'start_date'),
+    ('end_date', 'end_date'),
+    ('last_change', 'last_change'),
+    ('position', 'position'),
+    ('list', 'list_id'),
+    ('list_name', 'list__name'),
+    ('collection', 'list__collection_id'),
+    ('collection_name', 'list__collection__name'),
+    ('creator', 'creator__username'),
+    ('assigned_user', 'assigned_user__username'),
+)
+FIELDS = tuple(name for name, lookup in COLUMNS)
+
+CHUNK_SIZE = 2000
+BUFFER_SIZE = 64 * 1024
+
+
+def export_rows(team_id, chunk_size=CHUNK_SIZE):
+    """value tuples of COLUMNS for all items of the team, in the order of the backlog"""
+    return Item.objects.filter(backlog_id=team_id).order_by('start_date', 'pk').values_list(
+        *(lookup for name, lookup in COLUMNS)).iterator(chunk_size=chunk_size)
+
+
+def buffered(lines, size=BUFFER_SIZE):
+    """joins small byte strings into chunks of about `size` bytes"""
+    buffer, length = [], 0
+    for line in lines:
+        buffer.append(line)
+        length += len(line)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer, length = [], 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def ndjson_lines(rows):
+    renderer = JSONRenderer()
+    for row in rows:
+        yield renderer.render(dict(zip(FIELDS, row))) + b'\n'
+
+
+class _Line:
+    """file-like object which returns what the csv writer writes"""
+
+    def write(self, value):
+        return value
+
+
+def csv_lines(rows):
+    writer = csv.writer(_Line())
+    encoder = JSONEncoder()
+    yield writer.writerow(FIELDS).encode()
+    for row in rows:
+        yield writer.writerow([encoder.default(value) if hasattr(value, 'isoformat') else value
+                               for value in row]).encode()
+
+
+def gzipped(chunks):
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+    'csv': ('text/csv', csv_lines),
+}
+
+
+def export_items(team_id, export_type='ndjson', gzip=False):
+    """returns the content type and the chunks of the export"""
+    content_type, lines = FORMATS[export_type]
+    chunks = buffered(lines(export_rows(team_id)))
+    if gzip:
+        return 'application/gzip', gzipped(chunks)
+    return content_type, chunks
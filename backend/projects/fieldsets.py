@@ -0,0 +1,224 @@
+"""
+Sparse fieldsets for GET requests.
+?fields=pk,name,lists.name keeps only the listed fields, dotted names select fields of nested objects.
+?expand=lists,lists.items renders the listed nested objects in full and all other nested objects as primary keys,
+without expand nested objects are rendered in full.
+?shape=normalized renders nested objects as primary keys and sideloads each referenced object once
+into an "included" map, loaded with one IN query per type.
+Joins and prefetches are derived from the fields which are rendered
+"""
+from collections import OrderedDict, namedtuple
+
+from django.db.models import Prefetch, prefetch_related_objects
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.relations import ManyRelatedField
+
+Selection = namedtuple('Selection', ['fields', 'expand', 'included'])
+
+ALL = Selection(None, None, None)
+
+
+def parse_paths(value):
+    """'a,b.c' -> {'a': {}, 'b': {'c': {}}}, None if the parameter is not given"""
+    if value is None:
+        return None
+    tree = {}
+    for path in value.split(','):
+        node = tree
+        for name in filter(None, (name.strip() for name in path.split('.'))):
+            node = node.setdefault(name, {})
+    return tree
+
+
+def get_selection(request):
+    if request is None or request.method not in SAFE_METHODS:
+        return ALL
+    params = request.query_params
+    included = Included() if params.get('shape') == 'normalized' else None
+    return Selection(parse_paths(params.get('fields')), parse_paths(params.get('expand')), included)
+
+
+def selection_key(request):
+    """part of cache keys which differs for different selections"""
+    if request is None:
+        return ''
+    params = request.query_params
+    return f'{params.get("fields", "")}|{params.get("expand", "")}|{params.get("shape", "")}'
+
+
+def normalized(selection, data):
+    """wraps data of a normalized selection with the objects it references"""
+    if selection.included is None:
+        return data
+    return {'data': data, 'included': selection.included.resolve()}
+
+
+def merge_fields(a, b):
+    """union of two trees of fields, None or an empty tree of a nested object selects all fields"""
+    if a is None or b is None:
+        return None
+    if not a or not b:
+        return {}
+    return {name: merge_fields(a[name], b[name]) if name in a and name in b else a.get(name, b.get(name))
+            for name in {*a, *b}}
+
+
+def merge_expand(a, b):
+    """union of two trees of expanded objects, None expands all"""
+    if a is None or b is None:
+        return None
+    return {name: merge_expand(a.get(name, {}), b.get(name, {})) for name in {*a, *b}}
+
+
+def _nested(selection, name):
+    fields = selection.fields.get(name) or None if selection.fields is not None else None
+    expand = selection.expand.get(name, {}) if selection.expand is not None else None
+    return Selection(fields, expand, selection.included)
+
+
+def get_relation(model, name):
+    for field in model._meta.get_fields():
+        accessor = field.get_accessor_name() if field.auto_created and not field.concrete else field.name
+        if accessor == name:
+            return field if field.is_relation else None
+    return None
+
+
+class Included:
+    """
+    Objects referenced by a normalized representation, {type: {pk: object}}.
+    Objects of a type are rendered with the union of the selections they are referenced with,
+    objects rendered before a wider selection is added are rendered again.
+    Referenced objects may reference more objects, they are resolved until nothing is left
+    """
+
+    def __init__(self):
+        self.pending = OrderedDict()
+        self.objects = {}
+        self.selections = {}
+        self.rendered = {}
+
+    def add(self, serializer, selection, pk):
+        type_name = f'{serializer.Meta.model._meta.model_name}s'
+        current = self.selections.get(type_name)
+        if current is not None:
+            selection = Selection(merge_fields(current.fields, selection.fields),
+                                  merge_expand(current.expand, selection.expand), selection.included)
+        self.selections[type_name] = selection
+        if selection == self.rendered.get(type_name) and pk in self.objects.get(type_name, ()):
+            return
+        self.pending.setdefault(type_name, (type(serializer), set()))[1].add(pk)
+
+    def resolve(self):
+        while self.pending:
+            type_name, (serializer_class, pks) = self.pending.popitem(last=False)
+            objects = self.objects.setdefault(type_name, {})
+            selection = self.selections[type_name]
+            if selection == self.rendered.get(type_name):
+                pks -= objects.keys()
+            else:
+                pks |= objects.keys()
+            if not pks:
+                continue
+            self.rendered[type_name] = selection
+            queryset = serializer_class.Meta.model._default_manager.filter(pk__in=pks)
+            instances = list(serializer_class.setup_eager_loading(queryset, selection))
+            objects.update(zip((instance.pk for instance in instances),
+                               serializer_class(instances, many=True, selection=selection).data))
+        return self.objects
+
+
+class ReferenceField(serializers.PrimaryKeyRelatedField):
+    """primary key of a nested object which is added to the included objects"""
+
+    def __init__(self, serializer, selection, **kwargs):
+        self.serializer = serializer
+        self.selection = selection
+        super().__init__(read_only=True, **kwargs)
+
+    def to_representation(self, value):
+        self.selection.included.add(self.serializer, self.selection, value.pk)
+        return value.pk
+
+
+class DynamicFieldsMixin:
+    """
+    Serializer which renders the selection of the request (or the `selection` argument)
+    and builds eager loading lookups for it
+    """
+
+    def __init__(self, *args, selection=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.selection = selection
+
+    def get_selection(self):
+        if self.selection is None:
+            self.selection = get_selection(self.context.get('request'))
+        return self.selection
+
+    def get_fields(self):
+        fields = super().get_fields()
+        selection = self.get_selection()
+        if selection.fields is not None:
+            fields = OrderedDict((name, field) for name, field in fields.items() if name in selection.fields)
+        for name, field in fields.items():
+            many = isinstance(field, serializers.ListSerializer)
+            child = field.child if many else field
+            if not isinstance(child, serializers.BaseSerializer):
+                continue
+            source = {'source': field.source} if field.source and field.source != name else {}
+            if selection.expand is not None and name not in selection.expand:
+                fields[name] = serializers.PrimaryKeyRelatedField(read_only=True, many=many, **source)
+            elif isinstance(child, DynamicFieldsMixin):
+                if selection.included is not None and not many:
+                    fields[name] = ReferenceField(child, _nested(selection, name), **source)
+                else:
+                    child.selection = _nested(selection, name)
+        return fields
+
+    def eager_lookups(self):
+        """
+        Returns lookups for select_related and prefetch_related of the rendered relations,
+        relations rendered under a prefetched relation are loaded by the queryset of its Prefetch
+        """
+        model = self.Meta.model
+        select, prefetch = [], []
+        for name, field in self.fields.items():
+            child = field.child if isinstance(field, serializers.ListSerializer) else field
+            if not isinstance(child, serializers.BaseSerializer) and not isinstance(field, ManyRelatedField):
+                continue
+            source = field.source
+            relation = get_relation(model, source)
+            if relation is None:
+                continue
+            nested_select, nested_prefetch = [], []
+            if isinstance(child, DynamicFieldsMixin):
+                nested_select, nested_prefetch = child.eager_lookups()
+            if relation.one_to_many or relation.many_to_many:
+                queryset = relation.related_model._default_manager.prefetch_related(*nested_prefetch)
+                if nested_select:
+                    queryset = queryset.select_related(*nested_select)
+                prefetch.append(Prefetch(source, queryset=queryset))
+            else:
+                select += [source] + [f'{source}__{lookup}' for lookup in nested_select]
+                prefetch += [Prefetch(f'{source}__{lookup.prefetch_through}', queryset=lookup.queryset)
+                             for lookup in nested_prefetch]
+        return select, prefetch
+
+    @classmethod
+    def setup_eager_loading(cls, queryset, selection=ALL):
+        """
+        Loads everything the serializer renders for the selection with a constant number of queries
+        """
+        select, prefetch = cls(selection=selection).eager_lookups()
+        if select:
+            queryset = queryset.select_related(*select)
+        return queryset.prefetch_related(*prefetch)
+
+    @classmethod
+    def prefetch(cls, obj, selection=ALL):
+        """eager loading for an object which is already fetched"""
+        select, prefetch = cls(selection=selection).eager_lookups()
+        prefetch_related_objects([obj], *select, *prefetch)
+        return obj
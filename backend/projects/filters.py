@@ -0,0 +1,47 @@
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import ValidationError
+
+
+def _parse_id(params, name):
+    value = params.get(name)
+    if value in (None, '', 'any'):
+        return None, False
+    if value == 'none':
+        return None, True
+    try:
+        return int(value), True
+    except ValueError:
+        raise ValidationError({name: ['Expected an id, "none" or "any"']})
+
+
+def _parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        date = parse_datetime(value)
+    except ValueError:
+        # well formed but invalid, e.g. month 13
+        date = None
+    if date is None:
+        raise ValidationError({name: ['Expected an ISO 8601 datetime']})
+    return date
+
+
+def filter_backlog_items(queryset, params):
+    """
+    Filters backlog items by query params:
+    assigned_user and list take an id, "none" or "any",
+    end_date_after and end_date_before take ISO 8601 datetimes
+    """
+    for name in ('assigned_user', 'list'):
+        pk, is_set = _parse_id(params, name)
+        if is_set:
+            queryset = queryset.filter(**{f'{name}_id': pk})
+    end_date_after = _parse_date(params, 'end_date_after')
+    if end_date_after is not None:
+        queryset = queryset.filter(end_date__gte=end_date_after)
+    end_date_before = _parse_date(params, 'end_date_before')
+    if end_date_before is not None:
+        queryset = queryset.filter(end_date__lte=end_date_before)
+    return queryset
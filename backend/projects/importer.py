@@ -0,0 +1,176 @@
+"""
+Streaming import of items into the backlog of a team from CSV or NDJSON files.
+Rows are parsed one at a time and collected into chunks, assignees and lists of a chunk are resolved
+with one query each and its items are inserted with create_many, so memory use depends on the chunk size
+and not on the size of the file.
+Columns are the ones of the export: name, description, units, end_date, assigned_user (username),
+list_name and collection_name (only needed for lists with the same name), other columns are ignored.
+Invalid rows are skipped and reported with their number, chunks are inserted in separate transactions
+"""
+import codecs
+import csv
+import json
+
+from django.db.models import Q
+from rest_framework.exceptions import ValidationError
+
+from profiles.models import User
+from projects.models import Item, List
+from projects.serializers import ItemSerializer
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+CHUNK_SIZE = 500
+MAX_ERRORS = 100
+
+ITEM_FIELDS = ('name', 'description', 'units', 'end_date')
+EMPTY_VALUES = (None, '')
+
+loads = orjson.loads if orjson is not None else json.loads
+
+
+def csv_rows(file):
+    """(data, error) pairs of the rows of a CSV file with a header"""
+    for row in csv.DictReader(codecs.iterdecode(file, 'utf-8-sig')):
+        yield {key: value for key, value in row.items() if key is not None}, None
+
+
+def ndjson_rows(file):
+    """(data, error) pairs of the JSON objects of a file with one object per line"""
+    for line in file:
+        if not line.strip():
+            continue
+        try:
+            data = loads(line)
+        except ValueError:
+            yield None, 'Invalid JSON'
+            continue
+        if isinstance(data, dict):
+            yield data, None
+        else:
+            yield None, 'Row is not an object'
+
+
+FORMATS = {
+    'ndjson': ndjson_rows,
+    'csv': csv_rows,
+}
+
+
+class ItemImport:
+    """
+    Imports rows into the backlog of the team as items created by creator.
+    Assignees must be members of the team, lists must belong to its collections
+    """
+
+    def __init__(self, team, creator, chunk_size=CHUNK_SIZE, max_errors=MAX_ERRORS):
+        self.team = team
+        self.creator = creator
+        self.chunk_size = chunk_size
+        self.max_errors = max_errors
+        self.serializer = ItemSerializer()
+        self.users = {}
+        self.lists = {}
+        self.list_names = {}
+        self.rows = self.created = self.error_count = 0
+        self.errors = []
+
+    def add_error(self, row, errors):
+        self.error_count += 1
+        if len(self.errors) < self.max_errors:
+            self.errors.append({'row': row, 'errors': errors})
+
+    def run(self, rows):
+        """imports (data, error) pairs and returns the summary"""
+        rows = iter(rows)
+        chunk = []
+        while True:
+            try:
+                data, error = next(rows)
+            except StopIteration:
+                break
+            except (UnicodeDecodeError, csv.Error) as exc:
+                self.add_error(self.rows + 1, {'non_field_errors': [f'File can\'t be read further: {exc}']})
+                break
+            self.rows += 1
+            if error is not None:
+                self.add_error(self.rows, {'non_field_errors': [error]})
+                continue
+            data = {key: value for key, value in data.items() if value not in EMPTY_VALUES}
+            chunk.append((self.rows, data))
+            if len(chunk) >= self.chunk_size:
+                self.insert(chunk)
+                chunk = []
+        if chunk:
+            self.insert(chunk)
+        return self.summary()
+
+    def resolve(self, chunk):
+        """loads assignees and lists of the chunk which weren't seen yet"""
+        usernames = {str(data['assigned_user']) for row, data in chunk if 'assigned_user' in data}
+        usernames -= self.users.keys()
+        if usernames:
+            self.users.update(dict.fromkeys(usernames))
+            self.users.update(User.objects.filter(username__in=usernames).filter(
+                Q(memberships__team_id=self.team.pk) | Q(pk=self.team.team_creator_id)
+            ).order_by().distinct().values_list('username', 'pk'))
+        names = {str(data['list_name']) for row, data in chunk if 'list_name' in data}
+        names -= self.list_names.keys()
+        if names:
+            self.list_names.update(dict.fromkeys(names))
+            for pk, name, collection in List.objects.filter(collection__team_id=self.team.pk, name__in=names) \
+                    .order_by('pk').values_list('pk', 'name', 'collection__name'):
+                self.lists.setdefault((name, collection), pk)
+                # lists which share a name are only found with the name of their collection
+                self.list_names[name] = pk if self.list_names[name] is None else False
+
+    def build(self, row, data):
+        """unsaved item of the row or None if the row is reported as invalid"""
+        try:
+            attrs = self.serializer.run_validation({key: data[key] for key in ITEM_FIELDS if key in data})
+        except ValidationError as exc:
+            self.add_error(row, exc.detail)
+            return None
+        errors = {}
+        item = Item(**attrs, creator=self.creator, backlog_id=self.team.pk)
+        if 'assigned_user' in data:
+            item.assigned_user_id = self.users[str(data['assigned_user'])]
+            if item.assigned_user_id is None:
+                errors['assigned_user'] = [f'User "{data["assigned_user"]}" is not a member of the team']
+        if 'list_name' in data:
+            name = str(data['list_name'])
+            if 'collection_name' in data:
+                item.list_id = self.lists.get((name, str(data['collection_name'])))
+            else:
+                item.list_id = self.list_names[name]
+            if item.list_id is False:
+                errors['list_name'] = [f'There are several lists "{data["list_name"]}", set collection_name']
+            elif item.list_id is None:
+                errors['list_name'] = [f'List "{data["list_name"]}" is not found']
+        if errors:
+            self.add_error(row, errors)
+            return None
+        return item
+
+    def insert(self, chunk):
+        self.resolve(chunk)
+        items = [item for item in (self.build(row, data) for row, data in chunk) if item is not None]
+        if items:
+            Item.objects.create_many(items)
+            self.created += len(items)
+
+    def summary(self):
+        return {
+            'rows': self.rows,
+            'created': self.created,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+def import_items(team, creator, file, import_type='ndjson', chunk_size=CHUNK_SIZE):
+    """imports items from a binary file object, returns the summary"""
+    return ItemImport(team, creator, chunk_size).run(FORMATS[import_type](file))
@@ -0,0 +1,92 @@
+import re
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from profiles.models import Team
+from projects.benchmarks import rollback, seed_team
+from projects.models import Item
+
+SEQUENTIAL_SCANS = {
+    # "Seq Scan on items" or "Parallel Seq Scan on items"
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    # "SCAN TABLE items" (SQLite < 3.36) or "SCAN items", index scans are followed by "USING"
+    'sqlite': re.compile(r'SCAN (?:TABLE )?"?(\w+)"?(?! USING)\s*$'),
+}
+EXPLAIN = {
+    'postgresql': 'EXPLAIN {}',
+    'sqlite': 'EXPLAIN QUERY PLAN {}',
+}
+
+
+class Command(BaseCommand):
+    help = 'Runs EXPLAIN for queries of the API endpoints and reports sequential scans of the project tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--team', type=int, help='team to query, the team with most items by default')
+        parser.add_argument('--seed', type=int, default=0, metavar='ITEMS',
+                            help='seed a team with ITEMS items instead of using existing data')
+        parser.add_argument('--fail', action='store_true', help='exit with an error if scans are found')
+
+    def endpoints(self, team):
+        collection = team.collections.first()
+        list = collection.lists.first() if collection else None
+        item = Item.objects.filter(backlog_id=team.pk).first()
+        urls = ['/teams/', f'/teams/{team.pk}/', f'/teams/{team.pk}/backlog/', f'/teams/{team.pk}/backlog/items/',
+                f'/teams/{team.pk}/backlog/items/?list=none', f'/teams/{team.pk}/backlog/items/?assigned_user=none',
+                f'/teams/{team.pk}/backlog/items/?end_date_after=2020-01-01T00:00:00Z',
+                f'/teams/{team.pk}/collections/']
+        if collection:
+            urls += [f'/collections/{collection.pk}/', f'/collections/{collection.pk}/lists/']
+        if list:
+            urls += [f'/lists/{list.pk}/', f'/lists/{list.pk}/items/']
+        if item:
+            urls += [f'/items/{item.pk}/']
+        return urls
+
+    def explain(self, sql):
+        with connection.cursor() as cursor:
+            cursor.execute(EXPLAIN[connection.vendor].format(sql))
+            return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+    def handle(self, *args, **options):
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(f'{connection.vendor} is not supported')
+        project_tables = {model._meta.db_table for model in Team._meta.apps.get_models()
+                          if model._meta.app_label in ('profiles', 'projects')}
+        pattern = SEQUENTIAL_SCANS[connection.vendor]
+        found = 0
+        with rollback():
+            if connection.vendor == 'postgresql':
+                # small seeded tables are cheaper to scan, make the planner use an index whenever it has one
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+            if options['seed']:
+                team = seed_team(items=options['seed'], lists=5, users=5)[1]
+            elif options['team']:
+                team = Team.objects.get(pk=options['team'])
+            else:
+                team = Team.objects.filter(pk__in=Item.objects.order_by().values('backlog').annotate(
+                    count=Count('pk')).order_by('-count').values('backlog')[:1]).first()
+                if team is None:
+                    raise CommandError('No items found, use --seed')
+            client = APIClient()
+            client.force_authenticate(team.team_creator)
+            for url in self.endpoints(team):
+                with CaptureQueriesContext(connection) as queries:
+                    status_code = client.get(url).status_code
+                selects = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+                self.stdout.write(f'{url} {status_code}: {len(selects)} queries')
+                for sql in selects:
+                    tables = {match.group(1) for line in self.explain(sql) for match in [pattern.search(line)]
+                              if match and match.group(1) in project_tables}
+                    if tables:
+                        found += 1
+                        self.stdout.write(self.style.WARNING(f'  sequential scan of {", ".join(sorted(tables))}: '
+                                                             f'{sql[:300]}'))
+        if found and options['fail']:
+            raise CommandError(f'{found} queries scan tables sequentially')
+        self.stdout.write(f'{found} queries scan tables sequentially')
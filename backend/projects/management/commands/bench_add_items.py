@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from projects.benchmarks import rollback, seed_team, timer, report
+
+
+class Command(BaseCommand):
+    help = 'Compares creating items one per request with the add_items batch endpoint'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=500)
+
+    def handle(self, *args, **options):
+        count = options['items']
+        payload = [{'name': f'task {i}', 'description': 'imported', 'units': i % 8,
+                    'end_date': '2020-01-01T00:00:00Z'} for i in range(count)]
+        results = {}
+        with rollback():
+            users, team, collection, lists = seed_team()
+            client = APIClient()
+            client.force_authenticate(users[0])
+            url = f'/lists/{lists[0].pk}/'
+            with timer(results, 'add_item x %d' % count):
+                for item in payload:
+                    client.post(url + 'add_item/', item, format='json')
+            with timer(results, 'add_items'):
+                response = client.post(url + 'add_items/', payload, format='json')
+            assert response.status_code == 200, response.data
+        report(self.stdout, results, count)
@@ -0,0 +1,39 @@
+import time
+import tracemalloc
+
+from django.core.management.base import BaseCommand
+from rest_framework.test import APIClient
+
+from projects.benchmarks import rollback, seed_team
+
+
+class Command(BaseCommand):
+    help = 'Measures time to first byte, total time and peak memory of the export and backlog endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=100000)
+
+    def measure(self, client, url, streaming):
+        tracemalloc.start()
+        start = time.perf_counter()
+        response = client.get(url)
+        size, first_byte = 0, None
+        chunks = response.streaming_content if streaming else [response.content]
+        for chunk in chunks:
+            if first_byte is None:
+                first_byte = time.perf_counter() - start
+            size += len(chunk)
+        total = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        self.stdout.write(f'{url:<40} first byte {first_byte * 1000:8.1f} ms, total {total * 1000:8.1f} ms, '
+                          f'{size / 2 ** 20:7.1f} MiB, peak memory {peak / 2 ** 20:7.1f} MiB')
+
+    def handle(self, *args, **options):
+        with rollback():
+            users, team, collection, lists = seed_team(items=options['items'], lists=10, users=8)
+            client = APIClient()
+            client.force_authenticate(users[0])
+            self.measure(client, f'/teams/{team.pk}/backlog/', streaming=False)
+            for params in ('type=ndjson', 'type=csv', 'type=ndjson&gzip=1'):
+                self.measure(client, f'/teams/{team.pk}/export/?{params}', streaming=True)
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from projects.benchmarks import timer, report
+from projects.push import LocalBroker, Subscriber
+
+
+class Command(BaseCommand):
+    help = ('Measures fan-out of push events: a thread publishes events to a team and its lists '
+            'while subscribers of the team or one of the lists consume them on the event loop')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--subscribers', type=int, default=1000)
+        parser.add_argument('--events', type=int, default=1000)
+        parser.add_argument('--lists', type=int, default=10, help='lists of the team, events go to one of them')
+        parser.add_argument('--queue-size', type=int, default=10000, help='events queued per subscriber')
+
+    async def run(self, options):
+        broker = LocalBroker()
+        lists = options['lists']
+        subscribers = []
+        for i in range(options['subscribers']):
+            subscriber = Subscriber(max_size=options['queue_size'])
+            # every other subscriber follows the whole team, others one list
+            broker.subscribe(subscriber, ['team:1' if i % 2 else f'list:{i % lists}'])
+            subscribers.append(subscriber)
+        expected = [options['events'] if i % 2 else len(range(i % lists, options['events'], lists))
+                    for i in range(len(subscribers))]
+
+        done = object()
+        loop = asyncio.get_event_loop()
+
+        async def consume(subscriber):
+            while await subscriber.get() is not done:
+                pass
+
+        def publish():
+            for i in range(options['events']):
+                broker.publish(['team:1', f'list:{i % lists}'],
+                               {'type': 'item', 'op': 'save', 'id': i, 'name': f'item {i}', 'team': 1,
+                                'list': i % lists, 'position': 'a', 'assigned_user': None})
+            for subscriber in subscribers:
+                loop.call_soon_threadsafe(finish, subscriber)
+
+        def finish(subscriber):
+            subscriber.queue.append(done)
+            subscriber.ready.set()
+
+        results = {}
+        with timer(results, 'fan-out'):
+            consumers = asyncio.gather(*(consume(subscriber) for subscriber in subscribers))
+            publisher = threading.Thread(target=timer(results, 'publish')(publish))
+            publisher.start()
+            await consumers
+            publisher.join()
+        dropped = sum(subscriber.dropped for subscriber in subscribers)
+        report(self.stdout, {'fan-out': results['fan-out']}, sum(expected) - dropped, unit='deliveries')
+        report(self.stdout, {'publish': results['publish']}, options['events'], unit='events')
+        self.stdout.write(f'{dropped} events dropped by overflowing subscribers')
+
+    def handle(self, *args, **options):
+        start = time.perf_counter()
+        asyncio.run(self.run(options))
+        self.stdout.write(f'total {time.perf_counter() - start:.2f} s')
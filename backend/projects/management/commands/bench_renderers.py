@@ -0,0 +1,46 @@
+from io import BytesIO
+
+from django.core.management.base import BaseCommand
+from rest_framework import renderers, parsers
+
+from backend.renderers import JSONRenderer, JSONParser, MessagePackRenderer, MessagePackParser
+from profiles.models import Team
+from projects.benchmarks import rollback, seed_team, timer, report
+from projects.compiled import compiled_data
+from projects.models import Backlog
+from projects.serializers import BacklogSerializer, TeamCollectionsSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares renderers and parsers on backlog and collection payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with rollback():
+            users, team, collection, lists = seed_team(items=options['items'], lists=10, users=8)
+            payloads = {
+                'backlog': compiled_data(BacklogSerializer, Backlog.objects.filter(pk=team.pk))[0],
+                'collections': compiled_data(TeamCollectionsSerializer, Team.objects.filter(pk=team.pk))[0],
+            }
+        codecs = [
+            ('drf json', renderers.JSONRenderer(), parsers.JSONParser()),
+            ('orjson', JSONRenderer(), JSONParser()),
+            ('msgpack', MessagePackRenderer(), MessagePackParser()),
+        ]
+        for payload_name, data in payloads.items():
+            results, sizes = {}, {}
+            for name, renderer, parser in codecs:
+                with timer(results, f'{payload_name} {name} render'):
+                    for _ in range(options['repeat']):
+                        content = renderer.render(data)
+                with timer(results, f'{payload_name} {name} parse'):
+                    for _ in range(options['repeat']):
+                        parser.parse(BytesIO(content), parser_context={'encoding': 'utf-8'})
+                sizes[name] = len(content)
+            assert codecs[0][1].render(data) == codecs[1][1].render(data), 'orjson output differs'
+            self.stdout.write(f'{payload_name}: ' + ', '.join(f'{name} {size / 1024:.0f} KiB'
+                                                              for name, size in sizes.items()))
+            report(self.stdout, {name: seconds / options['repeat'] for name, seconds in results.items()})
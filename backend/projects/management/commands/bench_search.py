@@ -0,0 +1,52 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from projects.benchmarks import rollback, seed_team
+from projects.models import Item
+from projects.search import REBUILD, search
+
+
+class Command(BaseCommand):
+    help = 'Measures search latency on a team seeded with random items'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=1000000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--target-ms', type=float, default=50, help='p95 latency target')
+        parser.add_argument('--seed', type=int, default=0, help='random seed')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        words = [''.join(rng.choice(letters) for _ in range(rng.randint(3, 9))) for _ in range(20000)]
+        with rollback():
+            users, team, collection, lists = seed_team()
+            now = timezone.now()
+            start = time.perf_counter()
+            for offset in range(0, options['items'], 5000):
+                Item.objects.bulk_create([
+                    Item(name=' '.join(rng.choices(words, k=4)), description=' '.join(rng.choices(words, k=12)),
+                         backlog_id=team.pk, creator=users[0], start_date=now, end_date=now)
+                    for _ in range(min(5000, options['items'] - offset))])
+            with connection.cursor() as cursor:
+                cursor.execute(REBUILD[0] + ' WHERE backlog_id = %s', [team.pk])
+            self.stdout.write(f'seeded {options["items"]} items in {time.perf_counter() - start:.1f} s')
+
+            timings = []
+            for _ in range(options['queries']):
+                query = ' '.join(rng.choice(words)[:rng.randint(3, 5)] for _ in range(rng.randint(1, 2)))
+                start = time.perf_counter()
+                search(team.pk, query, limit=21)
+                timings.append((time.perf_counter() - start) * 1000)
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f'p50 {statistics.median(timings):.1f} ms, p95 {p95:.1f} ms, max {timings[-1]:.1f} ms')
+        if p95 > options['target_ms']:
+            self.stdout.write(self.style.ERROR(f'p95 is above the {options["target_ms"]} ms target'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'p95 is within the {options["target_ms"]} ms target'))
@@ -0,0 +1,36 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from profiles.models import Team
+from projects.benchmarks import rollback, seed_team, timer, report
+from projects.compiled import compiled_data
+from projects.models import Backlog, List
+from projects.serializers import ListSerializer, BacklogSerializer, TeamCollectionsSerializer
+
+
+class Command(BaseCommand):
+    help = 'Compares CPU time of DRF serializers and compiled serializers on the tree endpoints'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=10000)
+        parser.add_argument('--lists', type=int, default=1)
+
+    def handle(self, *args, **options):
+        count = options['items']
+        results = {}
+        with rollback():
+            users, team, collection, lists = seed_team(items=count, lists=options['lists'], users=8)
+            cases = [
+                ('list items', ListSerializer, List.objects.filter(pk=lists[0].pk)),
+                ('backlog', BacklogSerializer, Backlog.objects.filter(pk=team.pk)),
+                ('team collections', TeamCollectionsSerializer, Team.objects.filter(pk=team.pk)),
+            ]
+            for name, serializer_class, queryset in cases:
+                with timer(results, f'{name} serializer', time.process_time):
+                    expected = serializer_class(serializer_class.setup_eager_loading(queryset), many=True).data
+                with timer(results, f'{name} compiled', time.process_time):
+                    data = compiled_data(serializer_class, queryset)
+                assert data == expected, f'{name}: compiled data differs'
+        self.stdout.write(f'CPU time for {count} items')
+        report(self.stdout, results, count)
@@ -0,0 +1,134 @@
+import http.client
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from importlib.util import find_spec
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from rest_framework.authtoken.models import Token
+
+from projects.benchmarks import seed_team, report
+from projects.models import Item
+
+
+class Command(BaseCommand):
+    help = ('Starts the development server and the production servers (gunicorn.conf.py) one after another, '
+            'measures the time to the first response and requests/s of ItemViewSet.retrieve')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--servers', default='runserver,gunicorn,gunicorn-asgi')
+        parser.add_argument('--port', type=int, default=8765)
+        parser.add_argument('--requests', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--workers', type=int, default=1,
+                            help='gunicorn workers, more than one need a shared CACHE_BACKEND')
+        parser.add_argument('--threads', type=int, default=4, help='threads of gunicorn WSGI workers')
+
+    def servers(self, options):
+        bind = f'127.0.0.1:{options["port"]}'
+        gunicorn = [sys.executable, '-m', 'gunicorn.app.wsgiapp', '-c', 'gunicorn.conf.py', '--bind', bind,
+                    '--workers', str(options['workers']), '--threads', str(options['threads'])]
+        # the default uvicorn worker needs uvloop and httptools
+        worker_class = 'uvicorn.workers.UvicornWorker' if find_spec('uvloop') and find_spec('httptools') else \
+            'uvicorn.workers.UvicornH11Worker'
+        return OrderedDict([
+            ('runserver', ([sys.executable, 'manage.py', 'runserver', bind, '--noreload'], ())),
+            ('gunicorn', (gunicorn + ['backend.wsgi:application'], ('gunicorn',))),
+            ('gunicorn-asgi', (gunicorn + ['--worker-class', worker_class, 'backend.asgi:application'],
+                               ('gunicorn', 'uvicorn', 'asgiref'))),
+        ])
+
+    @staticmethod
+    def get(connection, path, headers):
+        connection.request('GET', path, headers=headers)
+        response = connection.getresponse()
+        response.read()
+        return response.status
+
+    def wait_started(self, process, port, path, headers, limit=60):
+        """seconds until the server answers the first request"""
+        start = time.perf_counter()
+        while time.perf_counter() - start < limit:
+            if process.poll() is not None:
+                return None
+            try:
+                if self.get(http.client.HTTPConnection('127.0.0.1', port, timeout=limit), path, headers) == 200:
+                    return time.perf_counter() - start
+            except OSError:
+                time.sleep(0.02)
+        return None
+
+    def load(self, port, path, headers, count, concurrency):
+        """requests/s and latencies of `count` requests sent by `concurrency` keep-alive clients"""
+        latencies, errors = [], []
+        lock = threading.Lock()
+
+        def client(requests):
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+            times = []
+            for _ in range(requests):
+                start = time.perf_counter()
+                try:
+                    status = self.get(connection, path, headers)
+                except (OSError, http.client.HTTPException):
+                    connection.close()
+                    connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+                    status = self.get(connection, path, headers)
+                times.append(time.perf_counter() - start)
+                if status != 200:
+                    with lock:
+                        errors.append(status)
+            with lock:
+                latencies.extend(times)
+
+        threads = [threading.Thread(target=client, args=(count // concurrency + (i < count % concurrency),))
+                   for i in range(concurrency)]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start, sorted(latencies), errors
+
+    def run(self, name, command, path, headers, options):
+        with tempfile.TemporaryFile() as log:
+            process = subprocess.Popen(command, cwd=settings.BASE_DIR, stdout=log, stderr=subprocess.STDOUT,
+                                       env={**os.environ, 'GUNICORN_ACCESS_LOG': ''})
+            try:
+                startup = self.wait_started(process, options['port'], path, headers)
+                if startup is None:
+                    log.seek(0)
+                    self.stderr.write(f'{name} did not start:\n{log.read().decode(errors="replace")[-2000:]}')
+                    return
+                elapsed, latencies, errors = self.load(options['port'], path, headers, options['requests'],
+                                                       options['concurrency'])
+            finally:
+                process.terminate()
+                process.wait(30)
+        report(self.stdout, {f'{name} startup': startup})
+        report(self.stdout, {f'{name} requests': elapsed}, len(latencies), unit='requests')
+        self.stdout.write(f'{"":<32} p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, '
+                          f'p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms, {len(errors)} errors')
+
+    def handle(self, *args, **options):
+        users, team, collection, lists = seed_team(items=1)
+        try:
+            path = f'/items/{Item.objects.filter(backlog_id=team.pk).values_list("pk", flat=True).get()}/'
+            headers = {'Authorization': f'Token {Token.objects.create(user=users[0]).key}'}
+            servers = self.servers(options)
+            for name in options['servers'].split(','):
+                command, modules = servers[name]
+                missing = [module for module in modules if find_spec(module) is None]
+                if missing:
+                    self.stdout.write(f'{name} skipped, {", ".join(missing)} is not installed')
+                    continue
+                self.run(name, command, path, headers, options)
+        finally:
+            team.delete()
+            for user in users:
+                user.delete()
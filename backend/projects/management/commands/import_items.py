@@ -0,0 +1,33 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from profiles.models import Team, User
+from projects.importer import import_items, CHUNK_SIZE, FORMATS
+
+
+class Command(BaseCommand):
+    help = 'Creates backlog items of a team from the rows of a CSV or NDJSON file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('team', type=int, help='id of the team')
+        parser.add_argument('path', help='file to import')
+        parser.add_argument('--creator', required=True, help='username of the creator of the items')
+        parser.add_argument('--type', choices=list(FORMATS), help='format of the file, by default its extension')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            team = Team.objects.get(pk=options['team'])
+            creator = User.objects.get(username=options['creator'])
+        except Team.DoesNotExist:
+            raise CommandError('Team is not found')
+        except User.DoesNotExist:
+            raise CommandError('User is not found')
+        import_type = options['type'] or ('csv' if options['path'].lower().endswith('.csv') else 'ndjson')
+        with open(options['path'], 'rb') as file:
+            summary = import_items(team, creator, file, import_type, options['chunk_size'])
+        self.stdout.write(f'{summary["rows"]} rows, {summary["created"]} items created, '
+                          f'{summary["error_count"]} errors')
+        for error in summary['errors']:
+            self.stdout.write(f'row {error["row"]}: {json.dumps(error["errors"])}')
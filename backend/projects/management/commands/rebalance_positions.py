@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Max
+from django.db.models.functions import Length
+
+from projects.models import List, Item
+from projects.ranks import rebalance
+
+
+class Command(BaseCommand):
+    help = 'Rewrites positions of lists and items which became too long after many moves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--max-length', type=int, default=12,
+                            help='rebalance lists and collections with longer positions')
+
+    def handle(self, *args, **options):
+        max_length = options['max_length']
+        for model, parent in ((List, 'collection'), (Item, 'list')):
+            parents = model.objects.exclude(**{f'{parent}_id': None}).order_by().values(parent).annotate(
+                longest=Max(Length('position'))).filter(longest__gt=max_length).values_list(parent, flat=True)
+            for parent_id in parents:
+                with transaction.atomic():
+                    rebalance(model.objects.filter(**{f'{parent}_id': parent_id}).select_for_update())
+            self.stdout.write(f'{model._meta.verbose_name_plural}: rebalanced {len(parents)} {parent}s')
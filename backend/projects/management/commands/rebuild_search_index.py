@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from projects.search import rebuild
+
+
+class Command(BaseCommand):
+    help = 'Recreates search entries of all items, lists and collections'
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild()
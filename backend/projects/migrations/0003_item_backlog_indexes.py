@@ -0,0 +1,29 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0002_add_logic'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['backlog', 'start_date', 'id'], name='items_backlog_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['backlog', 'assigned_user', 'start_date', 'id'], name='items_backlog_assigned_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['backlog', 'list', 'start_date', 'id'], name='items_backlog_list_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['backlog', 'end_date'], name='items_backlog_end_date_idx'),
+        ),
+    ]
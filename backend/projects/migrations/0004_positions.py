@@ -0,0 +1,55 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:24
+
+from django.db import migrations, models
+
+from projects.ranks import ranks_between
+
+
+def fill_positions(apps, schema_editor):
+    """keeps the current order: newest lists first, items by id"""
+    List = apps.get_model('projects', 'List')
+    Item = apps.get_model('projects', 'Item')
+    for model, parent, order in ((List, 'collection', ('-date_created', 'pk')), (Item, 'list', ('pk',))):
+        parents = model.objects.exclude(**{parent: None}).order_by().values_list(parent, flat=True).distinct()
+        for parent_id in parents:
+            objs = list(model.objects.filter(**{parent: parent_id}).only('pk').order_by(*order))
+            for obj, rank in zip(objs, ranks_between('', '', len(objs))):
+                obj.position = rank
+            model.objects.bulk_update(objs, ['position'], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_item_backlog_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='item',
+            options={'ordering': ['position', 'pk'], 'verbose_name': 'Item', 'verbose_name_plural': 'Items'},
+        ),
+        migrations.AlterModelOptions(
+            name='list',
+            options={'ordering': ['position', '-date_created'], 'verbose_name': 'List', 'verbose_name_plural': 'Lists'},
+        ),
+        migrations.AddField(
+            model_name='item',
+            name='position',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Position in the list'),
+        ),
+        migrations.AddField(
+            model_name='list',
+            name='position',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='Position in the collection'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['list', 'position'], name='items_list_position_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='list',
+            index=models.Index(fields=['collection', 'position'], name='lists_collection_position_idx'),
+        ),
+        migrations.RunPython(fill_positions, migrations.RunPython.noop),
+    ]
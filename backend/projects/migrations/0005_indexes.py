@@ -0,0 +1,21 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_positions'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='collection',
+            index=models.Index(fields=['team', '-date_created'], name='collections_team_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='item',
+            index=models.Index(fields=['assigned_user', 'end_date'], name='items_assigned_end_date_idx'),
+        ),
+    ]
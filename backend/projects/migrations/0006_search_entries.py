@@ -0,0 +1,90 @@
+# Generated by Django 2.2.28 on 2026-10-18 19:26
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+FULL_TEXT_INDEX = {
+    'postgresql': [
+        'ALTER TABLE search_entries ADD COLUMN document tsvector',
+        'CREATE INDEX search_entries_document_idx ON search_entries USING GIN (document)',
+        """CREATE FUNCTION search_entries_document() RETURNS trigger AS $$
+           BEGIN
+               NEW.document := setweight(to_tsvector('simple', NEW.name), 'A') ||
+                               setweight(to_tsvector('simple', NEW.text), 'B');
+               RETURN NEW;
+           END
+           $$ LANGUAGE plpgsql""",
+        """CREATE TRIGGER search_entries_document BEFORE INSERT OR UPDATE OF name, text ON search_entries
+           FOR EACH ROW EXECUTE PROCEDURE search_entries_document()""",
+    ],
+    'sqlite': [
+        "CREATE VIRTUAL TABLE search_entries_fts USING fts5(name, text, content='search_entries', content_rowid='id')",
+        """CREATE TRIGGER search_entries_insert AFTER INSERT ON search_entries BEGIN
+               INSERT INTO search_entries_fts(rowid, name, text) VALUES (new.id, new.name, new.text);
+           END""",
+        """CREATE TRIGGER search_entries_delete AFTER DELETE ON search_entries BEGIN
+               INSERT INTO search_entries_fts(search_entries_fts, rowid, name, text)
+               VALUES ('delete', old.id, old.name, old.text);
+           END""",
+        """CREATE TRIGGER search_entries_update AFTER UPDATE ON search_entries BEGIN
+               INSERT INTO search_entries_fts(search_entries_fts, rowid, name, text)
+               VALUES ('delete', old.id, old.name, old.text);
+               INSERT INTO search_entries_fts(rowid, name, text) VALUES (new.id, new.name, new.text);
+           END""",
+    ],
+}
+
+DROP_FULL_TEXT_INDEX = {
+    'postgresql': ['DROP FUNCTION search_entries_document() CASCADE'],
+    'sqlite': ['DROP TABLE search_entries_fts'],
+}
+
+FILL_ENTRIES = [
+    """INSERT INTO search_entries (kind, team_id, item_id, name, text)
+       SELECT 'item', backlog_id, id, name, description FROM items""",
+    """INSERT INTO search_entries (kind, team_id, list_id, name, text)
+       SELECT 'list', collections.team_id, lists.id, lists.name, '' FROM lists
+       JOIN collections ON collections.id = lists.collection_id""",
+    """INSERT INTO search_entries (kind, team_id, collection_id, name, text)
+       SELECT 'collection', team_id, id, name, description FROM collections""",
+]
+
+
+def create_full_text_index(apps, schema_editor):
+    for sql in FULL_TEXT_INDEX.get(schema_editor.connection.vendor, []) + FILL_ENTRIES:
+        schema_editor.execute(sql)
+
+
+def drop_full_text_index(apps, schema_editor):
+    for sql in DROP_FULL_TEXT_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('profiles', '0009_indexes'),
+        ('projects', '0005_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('item', 'Item'), ('list', 'List'), ('collection', 'Collection')], max_length=16)),
+                ('name', models.CharField(max_length=255)),
+                ('text', models.TextField(blank=True, default='')),
+                ('collection', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='projects.Collection')),
+                ('item', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='projects.Item')),
+                ('list', models.OneToOneField(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='search_entry', to='projects.List')),
+                ('team', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_entries', to='profiles.Team')),
+            ],
+            options={
+                'verbose_name': 'Search entry',
+                'verbose_name_plural': 'Search entries',
+                'db_table': 'search_entries',
+            },
+        ),
+        migrations.RunPython(create_full_text_index, drop_full_text_index),
+    ]
@@ -1,10 +1,17 @@
 from django.core.exceptions import ValidationError
-from django.db import models
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db import models, connections, transaction
+from django.db.models import Max, Min
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver, Signal
 from django.utils import timezone
 
-from profiles.models import Team, User
+from profiles.models import Team, User, CountersMixin
+from projects.ranks import rank_between, ranks_between
+
+
+# sent by bulk inserts and updates of items which skip post_save,
+# teams and lists are the ids of backlogs and lists the items were moved from or to
+items_changed = Signal(providing_args=['items', 'teams', 'lists'])
 
 
 class Backlog(models.Model):
@@ -25,11 +32,15 @@ def create_favorites(sender, instance, created, **kwargs):
         Backlog.objects.create(team=instance)
 
 
-class Collection(models.Model):
+class Collection(CountersMixin, models.Model):
     team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='collections')
     name = models.CharField(max_length=255)
     description = models.CharField(max_length=1023, blank=True, default='')
     date_created = models.DateTimeField(default=timezone.now)
+    revision = models.PositiveIntegerField(default=0)
+    date_modified = models.DateTimeField(default=timezone.now)
+
+    counter_fields = ('revision', 'date_modified')
 
     def __str__(self):
         return f'{self.team.name}:{self.name}'
@@ -39,12 +50,20 @@ class Collection(models.Model):
         verbose_name = 'Collection'
         verbose_name_plural = 'Collections'
         ordering = ['-date_created']
+        indexes = [
+            models.Index(fields=['team', '-date_created'], name='collections_team_date_idx'),
+        ]
 
 
-class List(models.Model):
+class List(CountersMixin, models.Model):
     name = models.CharField(max_length=255)
     collection = models.ForeignKey(Collection, on_delete=models.CASCADE, related_name='lists')
     date_created = models.DateTimeField(default=timezone.now)
+    position = models.CharField('Position in the collection', max_length=255, blank=True, default='')
+    revision = models.PositiveIntegerField(default=0)
+    date_modified = models.DateTimeField(default=timezone.now)
+
+    counter_fields = ('revision', 'date_modified')
 
     def __str__(self):
         return self.name
@@ -53,7 +72,56 @@ class List(models.Model):
         db_table = 'lists'
         verbose_name = 'List'
         verbose_name_plural = 'Lists'
-        ordering = ['-date_created']
+        ordering = ['position', '-date_created']
+        indexes = [
+            models.Index(fields=['collection', 'position'], name='lists_collection_position_idx'),
+        ]
+
+
+@receiver(pre_save, sender=List)
+def set_list_position(sender, instance, **kwargs):
+    """new lists are placed first"""
+    if not instance.position:
+        first = List.objects.filter(collection_id=instance.collection_id).exclude(pk=instance.pk).aggregate(
+            first=Min('position'))['first']
+        instance.position = rank_between('', first or '')
+
+
+class ItemQuerySet(models.QuerySet):
+    def create_many(self, items, batch_size=500):
+        """
+        Inserts items in one transaction with a multi-row insert per batch.
+        Databases that can't return ids of inserted rows (SQLite) save items one by one
+        """
+        self.set_positions(items)
+        if connections[self.db].features.can_return_ids_from_bulk_insert:
+            with transaction.atomic(using=self.db):
+                self.bulk_create(items, batch_size=batch_size)
+                SearchEntry.objects.using(self.db).bulk_create([SearchEntry.for_item(item) for item in items],
+                                                               batch_size=batch_size)
+                items_changed.send(sender=Item, items=[item.pk for item in items],
+                                   teams={item.backlog_id for item in items}, lists={item.list_id for item in items})
+            return items
+        with transaction.atomic(using=self.db):
+            for item in items:
+                item.save(force_insert=True, using=self.db)
+        return items
+
+    def last_positions(self, list_ids):
+        return dict(self.filter(list_id__in=list_ids).order_by().values('list').annotate(
+            last=Max('position')).values_list('list', 'last'))
+
+    def set_positions(self, items):
+        """places listed items without a position at the end of their lists"""
+        new_items = {}
+        for item in items:
+            if item.list_id and not item.position:
+                new_items.setdefault(item.list_id, []).append(item)
+        last_positions = self.last_positions(new_items) if new_items else {}
+        for list_id, list_items in new_items.items():
+            ranks = ranks_between(last_positions.get(list_id) or '', '', len(list_items))
+            for item, rank in zip(list_items, ranks):
+                item.position = rank
 
 
 class Item(models.Model):
@@ -71,10 +139,25 @@ class Item(models.Model):
 
     backlog = models.ForeignKey(Backlog, on_delete=models.CASCADE, related_name='items')
     list = models.ForeignKey(List, on_delete=models.CASCADE, related_name='items', null=True)
+    position = models.CharField('Position in the list', max_length=255, blank=True, default='')
+
+    objects = ItemQuerySet.as_manager()
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        item = super().from_db(db, field_names, values)
+        # the saved list and team, to track moves between them
+        item.loaded_parents = (item.__dict__.get('list_id'), item.__dict__.get('backlog_id'))
+        return item
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # after post_save receivers have seen the previous parents
+        self.loaded_parents = (self.list_id, self.backlog_id)
+
     def clean(self):
         if self.list and self.list.collection.team != self.backlog.team:
             raise ValidationError('Items can be added only from the team backlog')
@@ -83,3 +166,100 @@ class Item(models.Model):
         db_table = 'items'
         verbose_name = 'Item'
         verbose_name_plural = 'Items'
+        ordering = ['position', 'pk']
+        indexes = [
+            models.Index(fields=['list', 'position'], name='items_list_position_idx'),
+            models.Index(fields=['backlog', 'start_date', 'id'], name='items_backlog_start_idx'),
+            models.Index(fields=['backlog', 'assigned_user', 'start_date', 'id'], name='items_backlog_assigned_idx'),
+            models.Index(fields=['backlog', 'list', 'start_date', 'id'], name='items_backlog_list_idx'),
+            models.Index(fields=['backlog', 'end_date'], name='items_backlog_end_date_idx'),
+            models.Index(fields=['assigned_user', 'end_date'], name='items_assigned_end_date_idx'),
+        ]
+
+
+@receiver(pre_save, sender=Item)
+def set_item_position(sender, instance, **kwargs):
+    if instance.list_id is None:
+        instance.position = ''
+    elif not instance.position:
+        last = Item.objects.filter(list_id=instance.list_id).exclude(pk=instance.pk).aggregate(
+            last=Max('position'))['last']
+        instance.position = rank_between(last or '', '')
+
+
+class SearchEntry(models.Model):
+    """
+    Searchable text of an item, list or collection.
+    The full text index is created by the migration: a tsvector column with a GIN index on PostgreSQL
+    or an FTS5 table on SQLite, both are kept up to date by database triggers
+    """
+    ITEM, LIST, COLLECTION = 'item', 'list', 'collection'
+    KINDS = ((ITEM, 'Item'), (LIST, 'List'), (COLLECTION, 'Collection'))
+
+    kind = models.CharField(max_length=16, choices=KINDS)
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='search_entries')
+    item = models.OneToOneField(Item, on_delete=models.CASCADE, related_name='search_entry', null=True)
+    list = models.OneToOneField(List, on_delete=models.CASCADE, related_name='search_entry', null=True)
+    collection = models.OneToOneField(Collection, on_delete=models.CASCADE, related_name='search_entry', null=True)
+    name = models.CharField(max_length=255)
+    text = models.TextField(blank=True, default='')
+
+    @classmethod
+    def for_item(cls, item):
+        return cls(kind=cls.ITEM, item=item, team_id=item.backlog_id, name=item.name, text=item.description)
+
+    @classmethod
+    def for_list(cls, list):
+        return cls(kind=cls.LIST, list=list, team_id=list.collection.team_id, name=list.name)
+
+    @classmethod
+    def for_collection(cls, collection):
+        return cls(kind=cls.COLLECTION, collection=collection, team_id=collection.team_id, name=collection.name,
+                   text=collection.description)
+
+    class Meta:
+        db_table = 'search_entries'
+        verbose_name = 'Search entry'
+        verbose_name_plural = 'Search entries'
+
+
+class Change(models.Model):
+    """
+    Last change of an item, list, collection or membership of a team, numbered by the team change sequence.
+    Deleted objects are kept as tombstones
+    """
+    ITEM, LIST, COLLECTION, MEMBERSHIP = 'item', 'list', 'collection', 'membership'
+    MODELS = ((ITEM, 'Item'), (LIST, 'List'), (COLLECTION, 'Collection'), (MEMBERSHIP, 'Membership'))
+
+    # the unique (team, model, object_id) index serves lookups by team
+    team = models.ForeignKey(Team, on_delete=models.CASCADE, related_name='changes', db_index=False)
+    seq = models.BigIntegerField()
+    model = models.CharField(max_length=16, choices=MODELS)
+    object_id = models.IntegerField()
+    deleted = models.BooleanField(default=False)
+
+    class Meta:
+        db_table = 'changes'
+        verbose_name = 'Change'
+        verbose_name_plural = 'Changes'
+        unique_together = ['team', 'model', 'object_id']
+        indexes = [
+            models.Index(fields=['team', 'seq'], name='changes_team_seq_idx'),
+        ]
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_save, sender=List)
+@receiver(post_save, sender=Collection)
+def update_search_entry(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not {'name', 'description', 'backlog', 'collection', 'team'} & set(update_fields):
+        return
+    kind = sender._meta.model_name
+    entry = getattr(SearchEntry, f'for_{kind}')(instance)
+    if not SearchEntry.objects.filter(**{kind: instance}).update(team_id=entry.team_id, name=entry.name,
+                                                                 text=entry.text):
+        entry.save()
+    if sender is Collection:
+        # lists are searched in the team of their collection
+        SearchEntry.objects.filter(list__collection=instance).exclude(team_id=instance.team_id).update(
+            team_id=instance.team_id)
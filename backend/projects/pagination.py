@@ -0,0 +1,70 @@
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination
+
+
+class BacklogCursorPagination(CursorPagination):
+    """
+    Keyset pagination of backlog items by (start_date, pk), stable while items are added.
+    Cursors hold both values, so pages seek past items with equal start dates instead of
+    counting them with an offset like CursorPagination, which keys cursors on start_date only
+    """
+    ordering = ('start_date', 'pk')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+
+    def _get_position_from_instance(self, instance, ordering):
+        if isinstance(instance, dict):
+            start_date, pk = instance['start_date'], instance['pk']
+        else:
+            start_date, pk = instance.start_date, instance.pk
+        return f'{start_date.isoformat()}_{pk}'
+
+    def decode_position(self, position):
+        try:
+            start_date, pk = position.rsplit('_', 1)
+            start_date, pk = parse_datetime(start_date), int(pk)
+        except ValueError:
+            raise NotFound(self.invalid_cursor_message)
+        if start_date is None:
+            raise NotFound(self.invalid_cursor_message)
+        return start_date, pk
+
+    def paginate_queryset(self, queryset, request, view=None):
+        """CursorPagination.paginate_queryset with (start_date, pk) > position and no offsets"""
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.cursor = self.decode_cursor(request)
+        reverse, current_position = (False, None) if self.cursor is None else self.cursor[1:]
+
+        if reverse:
+            queryset = queryset.order_by('-start_date', '-pk')
+        else:
+            queryset = queryset.order_by('start_date', 'pk')
+        if current_position is not None:
+            start_date, pk = self.decode_position(current_position)
+            # start_date bounds the index range, the pk only breaks ties
+            if reverse:
+                queryset = queryset.filter(Q(start_date__lt=start_date) | Q(pk__lt=pk), start_date__lte=start_date)
+            else:
+                queryset = queryset.filter(Q(start_date__gt=start_date) | Q(pk__gt=pk), start_date__gte=start_date)
+
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+        following_position = None
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        if reverse:
+            self.page.reverse()
+            self.has_next, self.has_previous = current_position is not None, following_position is not None
+            self.next_position, self.previous_position = current_position, following_position
+        else:
+            self.has_next, self.has_previous = following_position is not None, current_position is not None
+            self.next_position, self.previous_position = following_position, current_position
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+        return self.page
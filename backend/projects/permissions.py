@@ -2,45 +2,46 @@ from profiles.permissions import IsTeamOrGroupCreator, IsTeamOrGroupManager, IsT
 
 
 class IsCollectionTeamCreator(IsTeamOrGroupCreator):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupCreator.has_object_permission(self, request, view, obj.team)
+    def get_team_id(self, obj):
+        return obj.team_id
 
 
 class IsCollectionTeamManager(IsTeamOrGroupManager):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupManager.has_object_permission(self, request, view, obj.team)
+    def get_team_id(self, obj):
+        return obj.team_id
 
 
 class IsCollectionTeamMember(IsTeamOrGroupMember):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupMember.has_object_permission(self, request, view, obj.team)
+    def get_team_id(self, obj):
+        return obj.team_id
 
 
 class IsListTeamCreator(IsCollectionTeamCreator):
-    def has_object_permission(self, request, view, obj):
-        return IsCollectionTeamCreator.has_object_permission(self, request, view, obj.collection)
+    def get_team_id(self, obj):
+        return obj.collection.team_id
 
 
 class IsListTeamManager(IsCollectionTeamManager):
-    def has_object_permission(self, request, view, obj):
-        return IsCollectionTeamManager.has_object_permission(self, request, view, obj.collection)
+    def get_team_id(self, obj):
+        return obj.collection.team_id
 
 
 class IsListTeamMember(IsCollectionTeamMember):
-    def has_object_permission(self, request, view, obj):
-        return IsCollectionTeamMember.has_object_permission(self, request, view, obj.collection)
+    def get_team_id(self, obj):
+        return obj.collection.team_id
 
 
 class IsItemTeamMember(IsTeamOrGroupMember):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupMember.has_object_permission(self, request, view, obj.backlog.team)
+    def get_team_id(self, obj):
+        # backlog primary key is the team id
+        return obj.backlog_id
 
 
 class IsItemTeamCreator(IsTeamOrGroupCreator):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupCreator.has_object_permission(self, request, view, obj.backlog.team)
+    def get_team_id(self, obj):
+        return obj.backlog_id
 
 
 class IsItemTeamManager(IsTeamOrGroupManager):
-    def has_object_permission(self, request, view, obj):
-        return IsTeamOrGroupManager.has_object_permission(self, request, view, obj.backlog.team)
+    def get_team_id(self, obj):
+        return obj.backlog_id
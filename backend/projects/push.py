@@ -0,0 +1,470 @@
+"""
+Server push of board changes over WebSockets with a Server-Sent Events fallback.
+Saves and deletes of items, lists and collections are collected during a transaction and published
+after commit as compact events to the topics of their team, collection and list.
+Connections subscribe to topics (team:<id>, collection:<id>, list:<id>) of teams of their user
+and get events through a bounded queue, a connection which doesn't keep up loses its queued events
+and gets one {"type": "overflow"} event, after which it should resync with /teams/<id>/sync/.
+A deleted membership sends {"type": "revoked", "team": <id>} to the connections of its user, which drop
+the topics the user can't see anymore, topics are also checked again every PUSH_AUTHORIZE_SECONDS.
+The broker is in process (PUSH_BROKER), a shared broker with the same interface
+lets events of other processes reach the connections of this one
+"""
+import asyncio
+import json
+import threading
+from collections import deque
+from functools import partial
+from urllib.parse import parse_qs
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from backend.renderers import JSONRenderer
+from profiles.roles import TeamRoles
+from profiles.models import Membership
+from projects.models import Collection, List, Item, items_changed
+
+WEBSOCKET_PATH = '/push/'
+EVENTS_PATH = '/push/events/'
+TOPIC_TYPES = ('team', 'collection', 'list')
+MAX_TOPICS = 50
+
+_pending = threading.local()
+
+
+class Message:
+    """event encoded once for all connections"""
+    __slots__ = ('type', 'text', 'event_stream')
+
+    def __init__(self, event):
+        self.type = event.get('type')
+        data = JSONRenderer().render(event)
+        self.text = data.decode()
+        self.event_stream = b'data: ' + data + b'\n\n'
+
+
+OVERFLOW = Message({'type': 'overflow'})
+
+
+class Subscriber:
+    """
+    Queue of messages of one connection. Messages are delivered from any thread
+    and handed to the event loop of the connection
+    """
+
+    def __init__(self, max_size=None, loop=None):
+        self.max_size = max_size or settings.PUSH_QUEUE_SIZE
+        self.loop = loop or asyncio.get_event_loop()
+        self.queue = deque()
+        self.ready = asyncio.Event()
+        self.dropped = 0
+
+    def deliver(self, message):
+        self.loop.call_soon_threadsafe(self.put, message)
+
+    def put(self, message):
+        if self.queue and self.queue[0] is OVERFLOW:
+            self.dropped += 1
+            return
+        if len(self.queue) >= self.max_size:
+            self.dropped += len(self.queue) + 1
+            self.queue.clear()
+            message = OVERFLOW
+        self.queue.append(message)
+        self.ready.set()
+
+    async def get(self):
+        while not self.queue:
+            self.ready.clear()
+            await self.ready.wait()
+        return self.queue.popleft()
+
+
+class LocalBroker:
+    """
+    Broker of one process, messages reach connections of the process only.
+    Subscribers without an event loop (loop = None) get messages in the publishing thread
+    """
+
+    def __init__(self):
+        self.topics = {}
+        self.lock = threading.Lock()
+
+    @property
+    def active(self):
+        """false when no connection could get an event, so changes are not collected"""
+        return bool(self.topics)
+
+    def subscribe(self, subscriber, topics):
+        with self.lock:
+            for topic in topics:
+                self.topics.setdefault(topic, set()).add(subscriber)
+
+    def unsubscribe(self, subscriber, topics=None):
+        with self.lock:
+            for topic in list(self.topics) if topics is None else topics:
+                subscribers = self.topics.get(topic)
+                if subscribers is not None:
+                    subscribers.discard(subscriber)
+                    if not subscribers:
+                        del self.topics[topic]
+
+    def publish(self, topics, event):
+        """delivers the event once to each subscriber of any of the topics"""
+        with self.lock:
+            subscribers = set().union(*(self.topics.get(topic, ()) for topic in topics))
+        if not subscribers:
+            return 0
+        message = Message(event)
+        # one wakeup of each event loop for all of its subscribers
+        by_loop = {}
+        for subscriber in subscribers:
+            by_loop.setdefault(subscriber.loop, []).append(subscriber)
+        for loop, group in by_loop.items():
+            if loop is None:
+                for subscriber in group:
+                    subscriber.deliver(message)
+            else:
+                loop.call_soon_threadsafe(put_all, group, message)
+        return len(subscribers)
+
+
+def put_all(subscribers, message):
+    for subscriber in subscribers:
+        subscriber.put(message)
+
+
+_broker = None
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        _broker = import_string(settings.PUSH_BROKER)()
+    return _broker
+
+
+def collect(event, teams=(), collections=(), lists=()):
+    """Queues an event for publishing after commit, collection topics of lists are resolved then"""
+    if not get_broker().active:
+        return
+    callback = getattr(_pending, 'callback', None)
+    # the callback with its events is discarded when the transaction or savepoint which registered it rolls back
+    registered = callback is not None and any(func is callback for ids, func in
+                                              transaction.get_connection().run_on_commit)
+    if not registered:
+        callback = _pending.callback = partial(flush, [])
+    callback.args[0].append((event, {pk for pk in teams if pk is not None},
+                             {pk for pk in collections if pk is not None}, {pk for pk in lists if pk is not None}))
+    if not registered:
+        transaction.on_commit(callback)
+
+
+def flush(pending):
+    broker = get_broker()
+    bulk = [pk for event, teams, collections, lists in pending if event['type'] == 'items' for pk in event['ids']]
+    items = {item['pk']: item for item in Item.objects.filter(pk__in=bulk).values(
+        'pk', 'name', 'backlog', 'list', 'position', 'assigned_user')} if bulk else {}
+    list_ids = set().union(*(lists for event, teams, collections, lists in pending),
+                           (item['list'] for item in items.values()))
+    collection_of = dict(List.objects.filter(pk__in=list_ids).values_list('pk', 'collection')) if list_ids else {}
+    for event, teams, collections, lists in pending:
+        if event['type'] == 'items':
+            for pk in event['ids']:
+                item = items.get(pk)
+                if item is None:
+                    publish_event(broker, {'type': 'item', 'op': 'delete', 'id': pk}, teams, collections, lists,
+                                  collection_of)
+                else:
+                    publish_event(broker, item_event(pk, 'save', item['name'], item['backlog'], item['list'],
+                                                     item['position'], item['assigned_user']),
+                                  teams | {item['backlog']}, collections, lists | {item['list']}, collection_of)
+        else:
+            publish_event(broker, event, teams, collections, lists, collection_of)
+
+
+def publish_event(broker, event, teams, collections, lists, collection_of):
+    collections = collections | {collection_of[pk] for pk in lists if pk in collection_of}
+    broker.publish([f'team:{pk}' for pk in teams if pk is not None] +
+                   [f'collection:{pk}' for pk in collections if pk is not None] +
+                   [f'list:{pk}' for pk in lists if pk is not None], event)
+
+
+def item_event(pk, op, name, team, list_id, position, assigned_user):
+    return {'type': 'item', 'op': op, 'id': pk, 'name': name, 'team': team, 'list': list_id, 'position': position,
+            'assigned_user': assigned_user}
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_changed(sender, instance, **kwargs):
+    list_id, team_id = getattr(instance, 'loaded_parents', (None, None))
+    op = 'save' if 'created' in kwargs else 'delete'
+    collect(item_event(instance.pk, op, instance.name, instance.backlog_id, instance.list_id, instance.position,
+                       instance.assigned_user_id),
+            teams=[instance.backlog_id, team_id], lists=[instance.list_id, list_id])
+
+
+@receiver(items_changed, sender=Item)
+def items_bulk_changed(sender, items, teams, lists, **kwargs):
+    # items are read after commit, the event also goes to the teams and lists they left
+    collect({'type': 'items', 'ids': list(items)}, teams=teams, lists=lists)
+
+
+@receiver(post_save, sender=List)
+@receiver(post_delete, sender=List)
+def list_changed(sender, instance, **kwargs):
+    collect({'type': 'list', 'op': 'save' if 'created' in kwargs else 'delete', 'id': instance.pk,
+             'name': instance.name, 'collection': instance.collection_id, 'position': instance.position},
+            collections=[instance.collection_id], lists=[instance.pk])
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def collection_changed(sender, instance, **kwargs):
+    collect({'type': 'collection', 'op': 'save' if 'created' in kwargs else 'delete', 'id': instance.pk,
+             'name': instance.name, 'team': instance.team_id},
+            teams=[instance.team_id], collections=[instance.pk])
+
+
+@receiver(post_delete, sender=Membership)
+def membership_deleted(sender, instance, **kwargs):
+    broker = get_broker()
+    if broker.active:
+        transaction.on_commit(partial(broker.publish, [f'user:{instance.user_id}'],
+                                      {'type': 'revoked', 'team': instance.team_id}))
+
+
+def parse_topics(values):
+    """topics of comma separated values, ValueError for unknown or too many topics"""
+    topics = set()
+    for value in values:
+        for topic in value.split(','):
+            kind, _, pk = topic.strip().partition(':')
+            if kind not in TOPIC_TYPES or not pk.isdigit():
+                raise ValueError(f'Unknown topic {topic}')
+            topics.add((kind, int(pk)))
+    if len(topics) > MAX_TOPICS:
+        raise ValueError(f'At most {MAX_TOPICS} topics are allowed')
+    return topics
+
+
+def visible_topics(token, topics):
+    """
+    Id of the user of the token and the topics of teams the user is a member of, raises AuthenticationFailed
+    """
+    close_old_connections()
+    try:
+        user = TokenAuthentication().authenticate_credentials(token or '')[0]
+        roles = TeamRoles.for_user(user)
+        team_of = {('team', pk): pk for kind, pk in topics if kind == 'team'}
+        collections = {pk for kind, pk in topics if kind == 'collection'}
+        lists = {pk for kind, pk in topics if kind == 'list'}
+        if collections:
+            team_of.update((('collection', pk), team_id) for pk, team_id in
+                           Collection.objects.filter(pk__in=collections).values_list('pk', 'team'))
+        if lists:
+            team_of.update((('list', pk), team_id) for pk, team_id in
+                           List.objects.filter(pk__in=lists).values_list('pk', 'collection__team'))
+        return user.pk, {topic for topic in topics
+                         if team_of.get(topic) is not None and roles.is_member(team_of[topic])}
+    finally:
+        close_old_connections()
+
+
+def authorize(token, topics):
+    """
+    Id of the user of the token and names of the topics if the user is a member of their teams,
+    raises AuthenticationFailed or PermissionError
+    """
+    user_id, visible = visible_topics(token, topics)
+    for kind, pk in sorted(set(topics) - visible):
+        raise PermissionError(f'{kind}:{pk} is not found')
+    return user_id, [f'{kind}:{pk}' for kind, pk in topics]
+
+
+def get_token(scope):
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    for name, value in scope.get('headers', ()):
+        if name == b'authorization':
+            keyword, _, key = value.decode('latin-1').partition(' ')
+            if keyword == 'Token':
+                return key.strip()
+    return query.get('token', [''])[0]
+
+
+class PushApplication:
+    """
+    ASGI application of the push endpoints, other requests go to the fallback application.
+    WebSocket clients may send {"subscribe": [topics]} and {"unsubscribe": [topics]} messages
+    """
+
+    def __init__(self, fallback=None, broker=None):
+        self.fallback = fallback
+        self.broker = broker
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get('path')
+        if scope['type'] == 'websocket' and path == WEBSOCKET_PATH:
+            await self.websocket(scope, receive, send)
+        elif scope['type'] == 'http' and path == EVENTS_PATH:
+            await self.event_stream(scope, receive, send)
+        elif self.fallback is not None:
+            await self.fallback(scope, receive, send)
+        elif scope['type'] == 'http':
+            await self.respond(send, 404, {'errors': ['Not found']})
+        elif scope['type'] == 'websocket':
+            await send({'type': 'websocket.close', 'code': 4404})
+
+    def get_broker(self):
+        return self.broker or get_broker()
+
+    async def subscribe(self, token, values):
+        """id of the user and names of the topics, or an error message"""
+        try:
+            topics = parse_topics(values)
+            user_id, names = await asyncio.get_event_loop().run_in_executor(None, authorize, token, topics)
+            return user_id, names, None
+        except (ValueError, PermissionError, AuthenticationFailed) as e:
+            return None, None, str(getattr(e, 'detail', e))
+
+    @staticmethod
+    async def recheck(token, topics):
+        """topics of the connection its user can't see anymore, None if the token is not valid anymore"""
+        topics = {(kind, int(pk)) for kind, _, pk in (topic.partition(':') for topic in topics)}
+        try:
+            user_id, visible = await asyncio.get_event_loop().run_in_executor(None, visible_topics, token, topics)
+        except AuthenticationFailed:
+            return None
+        return {f'{kind}:{pk}' for kind, pk in topics - visible}
+
+    @staticmethod
+    async def respond(send, status, data):
+        await send({'type': 'http.response.start', 'status': status,
+                    'headers': [(b'content-type', b'application/json')]})
+        await send({'type': 'http.response.body', 'body': JSONRenderer().render(data)})
+
+    async def websocket(self, scope, receive, send):
+        if (await receive())['type'] != 'websocket.connect':
+            return
+        token = get_token(scope)
+        user_id, topics, error = await self.subscribe(token, parse_qs(scope.get('query_string', b'').decode()).get(
+            'topics', []))
+        if error is not None:
+            await send({'type': 'websocket.close', 'code': 4403})
+            return
+        await send({'type': 'websocket.accept'})
+        broker, subscriber, topics = self.get_broker(), Subscriber(), set(topics)
+        broker.subscribe(subscriber, [*topics, f'user:{user_id}'])
+        loop = asyncio.get_event_loop()
+        checked = loop.time()
+        receiving = asyncio.ensure_future(receive())
+        sending = asyncio.ensure_future(subscriber.get())
+        try:
+            while True:
+                done, _ = await asyncio.wait({receiving, sending}, return_when=asyncio.FIRST_COMPLETED,
+                                             timeout=max(checked + settings.PUSH_AUTHORIZE_SECONDS - loop.time(), 0))
+                recheck = not done
+                if sending in done:
+                    message = sending.result()
+                    await send({'type': 'websocket.send', 'text': message.text})
+                    recheck = message.type == 'revoked'
+                    sending = asyncio.ensure_future(subscriber.get())
+                if receiving in done:
+                    message = receiving.result()
+                    if message['type'] == 'websocket.disconnect':
+                        break
+                    await self.websocket_command(broker, subscriber, token, topics, message, send)
+                    receiving = asyncio.ensure_future(receive())
+                if recheck:
+                    checked = loop.time()
+                    lost = await self.recheck(token, topics)
+                    if lost is None:
+                        await send({'type': 'websocket.close', 'code': 4403})
+                        break
+                    if lost:
+                        broker.unsubscribe(subscriber, lost)
+                        topics -= lost
+                        await send({'type': 'websocket.send',
+                                    'text': Message({'type': 'unsubscribed', 'topics': sorted(lost)}).text})
+        finally:
+            receiving.cancel()
+            sending.cancel()
+            broker.unsubscribe(subscriber)
+
+    async def websocket_command(self, broker, subscriber, token, topics, message, send):
+        try:
+            command = json.loads(message.get('text') or message.get('bytes') or b'')
+            names = command.get('subscribe') or command.get('unsubscribe')
+            if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+                raise ValueError
+        except (ValueError, TypeError, AttributeError):
+            reply = {'type': 'error', 'errors': ['Expected {"subscribe": [topics]} or {"unsubscribe": [topics]}']}
+        else:
+            if 'subscribe' in command:
+                user_id, names, error = await self.subscribe(token, names)
+                if names is not None:
+                    broker.subscribe(subscriber, names)
+                    topics.update(names)
+                reply = {'type': 'subscribed', 'topics': names} if error is None else \
+                    {'type': 'error', 'errors': [error]}
+            else:
+                # the topic of the user of the connection stays subscribed
+                names = [name for name in names if name in topics]
+                broker.unsubscribe(subscriber, names)
+                topics.difference_update(names)
+                reply = {'type': 'unsubscribed', 'topics': names}
+        await send({'type': 'websocket.send', 'text': Message(reply).text})
+
+    async def event_stream(self, scope, receive, send):
+        token = get_token(scope)
+        user_id, topics, error = await self.subscribe(token, parse_qs(
+            scope.get('query_string', b'').decode()).get('topics', []))
+        if error is not None:
+            await self.respond(send, 403, {'errors': [error]})
+            return
+        broker, subscriber = self.get_broker(), Subscriber()
+        broker.subscribe(subscriber, [*topics, f'user:{user_id}'])
+        await send({'type': 'http.response.start', 'status': 200,
+                    'headers': [(b'content-type', b'text/event-stream'), (b'cache-control', b'no-cache'),
+                                (b'x-accel-buffering', b'no')]})
+        loop = asyncio.get_event_loop()
+        checked = loop.time()
+        receiving = asyncio.ensure_future(self.disconnected(receive))
+        try:
+            await send({'type': 'http.response.body', 'body': b': subscribed\n\n', 'more_body': True})
+            while not receiving.done():
+                sending = asyncio.ensure_future(subscriber.get())
+                done, _ = await asyncio.wait({receiving, sending}, timeout=settings.PUSH_HEARTBEAT_SECONDS,
+                                             return_when=asyncio.FIRST_COMPLETED)
+                recheck = loop.time() - checked >= settings.PUSH_AUTHORIZE_SECONDS
+                if sending in done:
+                    message = sending.result()
+                    body = message.event_stream
+                    recheck = recheck or message.type == 'revoked'
+                else:
+                    sending.cancel()
+                    body = b': ping\n\n'
+                if receiving.done():
+                    break
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+                if recheck:
+                    checked = loop.time()
+                    # the stream ends when a topic is lost, the client connects again with the topics it may see
+                    if await self.recheck(token, topics) != set():
+                        await send({'type': 'http.response.body', 'body': b''})
+                        break
+        finally:
+            receiving.cancel()
+            broker.unsubscribe(subscriber)
+
+    @staticmethod
+    async def disconnected(receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
@@ -0,0 +1,57 @@
+"""
+Fractional ranks used as positions of lists and items.
+A rank is a base 36 fraction written without the leading "0." and without trailing zeros,
+so ranks are compared as strings and a new rank fits between any two different ranks.
+An empty string is an open bound
+"""
+from django.dispatch import Signal
+
+DIGITS = '0123456789abcdefghijklmnopqrstuvwxyz'
+
+
+def _midpoint(low, high):
+    if high is not None:
+        common = 0
+        while common < len(high) and (low[common] if common < len(low) else '0') == high[common]:
+            common += 1
+        if common:
+            return high[:common] + _midpoint(low[common:], high[common:])
+    low_digit = DIGITS.index(low[0]) if low else 0
+    high_digit = DIGITS.index(high[0]) if high else len(DIGITS)
+    if high_digit - low_digit > 1:
+        return DIGITS[(low_digit + high_digit) // 2]
+    if high and len(high) > 1:
+        return high[:1]
+    return DIGITS[low_digit] + _midpoint(low[1:], None)
+
+
+def rank_between(before='', after=''):
+    """returns a rank greater than `before` and less than `after`"""
+    if after and before >= after:
+        raise ValueError(f'Rank {before!r} is not less than {after!r}')
+    return _midpoint(before, after or None)
+
+
+def ranks_between(before, after, count):
+    """returns `count` ascending ranks between `before` and `after`, as short as possible"""
+    if count <= 0:
+        return []
+    middle = rank_between(before, after)
+    left = (count - 1) // 2
+    return ranks_between(before, middle, left) + [middle] + ranks_between(middle, after, count - 1 - left)
+
+
+# sent by rebalance, which skips post_save, with the objects whose positions were rewritten
+rebalanced = Signal(providing_args=['objects'])
+
+
+def rebalance(queryset):
+    """rewrites positions of the ordered queryset with evenly spread short ranks"""
+    model = queryset.model
+    parents = [field.attname for field in model._meta.concrete_fields if field.is_relation]
+    objs = list(queryset.only('pk', 'position', *parents).order_by('position', 'pk'))
+    for obj, rank in zip(objs, ranks_between('', '', len(objs))):
+        obj.position = rank
+    model._default_manager.bulk_update(objs, ['position'], batch_size=500)
+    rebalanced.send(sender=model, objects=objs)
+    return objs
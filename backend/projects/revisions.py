@@ -0,0 +1,120 @@
+"""
+Revision counters of team, collection and list trees used as version tokens for conditional GET.
+Changes are collected during a transaction and written with a few UPDATE queries after commit
+"""
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+from profiles.models import Team, Membership, User
+from projects.models import Collection, List, Item, items_changed
+from projects.ranks import rebalanced
+
+_pending = threading.local()
+
+
+def bump(teams=(), collections=(), lists=(), team_trees=()):
+    """
+    Marks trees as changed: lists with their collections and teams, collections with their teams,
+    or whole team trees
+    """
+    callback = getattr(_pending, 'callback', None)
+    # the callback with its changes is discarded when the transaction or savepoint which registered it rolls back
+    if callback is None or not any(func is callback for ids, func in transaction.get_connection().run_on_commit):
+        callback = _pending.callback = partial(flush, {
+            'teams': set(), 'collections': set(), 'lists': set(), 'team_trees': set()})
+        register = True
+    else:
+        register = False
+    changes = callback.args[0]
+    for key, ids in (('teams', teams), ('collections', collections), ('lists', lists), ('team_trees', team_trees)):
+        changes[key].update(pk for pk in ids if pk is not None)
+    if register:
+        transaction.on_commit(callback)
+
+
+def flush(changes):
+    if not any(changes.values()):
+        return
+    lists, collections, teams, team_trees = (changes['lists'], changes['collections'], changes['teams'],
+                                             changes['team_trees'])
+    values = {'revision': F('revision') + 1, 'date_modified': timezone.now()}
+    if lists or team_trees:
+        List.objects.filter(Q(pk__in=lists) | Q(collection__team__in=team_trees)).update(**values)
+    if lists or collections or team_trees:
+        Collection.objects.filter(Q(pk__in=collections) | Q(lists__in=lists) | Q(team__in=team_trees)).update(
+            **values)
+    Team.objects.filter(Q(pk__in=teams | team_trees) | Q(collections__in=collections) |
+                        Q(collections__lists__in=lists)).update(**values)
+    return changes
+
+
+def versioned_response(request, obj, get_data):
+    """
+    Responds 304 if the client has the current revision of obj,
+    otherwise responds with get_data() and the revision as ETag and Last-Modified
+    """
+    etag = quote_etag(f'{obj._meta.model_name}-{obj.pk}-{obj.revision}')
+    last_modified = int(obj.date_modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = Response(get_data())
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def item_changed(sender, instance, **kwargs):
+    list_id, team_id = getattr(instance, 'loaded_parents', (None, None))
+    bump(teams=[instance.backlog_id, team_id], lists=[instance.list_id, list_id])
+
+
+@receiver(items_changed, sender=Item)
+def items_bulk_changed(sender, teams, lists, **kwargs):
+    bump(teams=teams, lists=lists)
+
+
+@receiver(post_save, sender=List)
+@receiver(post_delete, sender=List)
+def list_changed(sender, instance, **kwargs):
+    bump(lists=[instance.pk], collections=[instance.collection_id])
+
+
+@receiver(rebalanced, sender=Item)
+@receiver(rebalanced, sender=List)
+def positions_rebalanced(sender, objects, **kwargs):
+    bump(lists={obj.list_id for obj in objects} if sender is Item else [obj.pk for obj in objects])
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+def collection_changed(sender, instance, **kwargs):
+    bump(collections=[instance.pk], teams=[instance.team_id])
+
+
+@receiver(post_save, sender=Team)
+def team_changed(sender, instance, **kwargs):
+    bump(team_trees=[instance.pk])
+
+
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def membership_changed(sender, instance, **kwargs):
+    bump(team_trees=[instance.team_id])
+
+
+@receiver(post_save, sender=User)
+def user_changed(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return
+    bump(team_trees=Membership.objects.filter(user=instance).values_list('team', flat=True))
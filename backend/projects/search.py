@@ -0,0 +1,74 @@
+"""
+Ranked full text search over search entries of a team
+"""
+import re
+
+from django.db import connection
+
+from projects.models import SearchEntry
+
+WORD = re.compile(r'\w+')
+# databases with a full text index of search entries (migration 0006)
+VENDORS = ('postgresql', 'sqlite')
+
+POSTGRESQL_SEARCH = '''
+    SELECT kind, COALESCE(item_id, list_id, collection_id), name, ts_rank(document, query) AS rank
+    FROM search_entries, to_tsquery('simple', %s) query
+    WHERE team_id = %s AND document @@ query {kinds}
+    ORDER BY rank DESC, id
+    LIMIT %s OFFSET %s
+'''
+
+SQLITE_SEARCH = '''
+    SELECT entry.kind, COALESCE(entry.item_id, entry.list_id, entry.collection_id), entry.name,
+           -bm25(search_entries_fts, 10.0, 1.0) AS rank
+    FROM search_entries_fts JOIN search_entries entry ON entry.id = search_entries_fts.rowid
+    WHERE search_entries_fts MATCH %s AND entry.team_id = %s {kinds}
+    ORDER BY bm25(search_entries_fts, 10.0, 1.0), entry.id
+    LIMIT %s OFFSET %s
+'''
+
+REBUILD = [
+    '''INSERT INTO search_entries (kind, team_id, item_id, name, text)
+       SELECT 'item', backlog_id, id, name, description FROM items''',
+    '''INSERT INTO search_entries (kind, team_id, list_id, name, text)
+       SELECT 'list', collections.team_id, lists.id, lists.name, '' FROM lists
+       JOIN collections ON collections.id = lists.collection_id''',
+    '''INSERT INTO search_entries (kind, team_id, collection_id, name, text)
+       SELECT 'collection', team_id, id, name, description FROM collections''',
+]
+
+
+def search_supported():
+    return connection.vendor in VENDORS
+
+
+def search(team_id, query, kinds=None, limit=20, offset=0):
+    """
+    Returns (kind, pk, name, rank) tuples of entries matching all words of the query as prefixes,
+    the best matches first
+    """
+    words = WORD.findall(query.lower())
+    if not words:
+        return []
+    kinds = [kind for kind, name in SearchEntry.KINDS if not kinds or kind in kinds]
+    kinds_filter = 'AND kind IN ({})'.format(', '.join(['%s'] * len(kinds)))
+    if connection.vendor == 'postgresql':
+        sql = POSTGRESQL_SEARCH.format(kinds=kinds_filter)
+        match = ' & '.join(f'{word}:*' for word in words)
+    elif connection.vendor == 'sqlite':
+        sql = SQLITE_SEARCH.format(kinds=kinds_filter.replace('kind', 'entry.kind'))
+        match = ' '.join(f'"{word}"*' for word in words)
+    else:
+        raise NotImplementedError(f'Full text search is not supported on {connection.vendor}')
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, team_id, *kinds, limit, offset])
+        return cursor.fetchall()
+
+
+def rebuild():
+    """recreates search entries of all items, lists and collections"""
+    with connection.cursor() as cursor:
+        cursor.execute('DELETE FROM search_entries')
+        for sql in REBUILD:
+            cursor.execute(sql)
@@ -1,11 +1,30 @@
 from profiles.models import Team
+from projects.fieldsets import DynamicFieldsMixin
 from projects.models import Item, List, Collection, Backlog
 from rest_framework import serializers
+from rest_framework.settings import api_settings
 from profiles.serializers import UserAssignedItemsSerializer, TeamSerializer, MemberSerializer
 
 
-class ItemSerializer(serializers.ModelSerializer):
-    class ListSerializer(serializers.ModelSerializer):
+class ItemListSerializer(serializers.ListSerializer):
+    """
+    Creates many items with a bulk insert
+    """
+    max_items = 1000
+
+    def to_internal_value(self, data):
+        if isinstance(data, list) and len(data) > self.max_items:
+            raise serializers.ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: [f'No more than {self.max_items} items can be created at once']
+            })
+        return super().to_internal_value(data)
+
+    def create(self, validated_data):
+        return Item.objects.create_many([Item(**attrs) for attrs in validated_data])
+
+
+class ItemSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class ListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         class Meta:
             model = List
             fields = ('pk', 'name')
@@ -22,12 +41,13 @@ class ItemSerializer(serializers.ModelSerializer):
     class Meta:
         model = Item
         fields = ('pk', 'name', 'description', 'units', 'start_date', 'end_date', 'last_change', 'assigned_user', 'creator',
-                  'backlog', 'list')
+                  'backlog', 'list', 'position')
         read_only_fields = ('start_date', 'last_change', 'assigned_user', 'creator', 'backlog',
-                            'list')
+                            'list', 'position')
+        list_serializer_class = ItemListSerializer
 
 
-class BacklogSerializer(serializers.ModelSerializer):
+class BacklogSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     team = TeamSerializer()
     items = ItemSerializer(many=True)
 
@@ -36,27 +56,24 @@ class BacklogSerializer(serializers.ModelSerializer):
         fields = ['team', 'items']
 
 
-class ListSerializer(serializers.ModelSerializer):
+class ListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     collection = serializers.PrimaryKeyRelatedField(read_only=True)
     items = ItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = List
-        fields = ('pk', 'name', 'collection', 'date_created', 'items')
-        read_only_fields = ('collection', 'items', 'date_created')
+        fields = ('pk', 'name', 'collection', 'date_created', 'position', 'items')
+        read_only_fields = ('collection', 'items', 'date_created', 'position')
 
 
-class CollectionSerializer(serializers.ModelSerializer):
-    class TeamSerializer(serializers.ModelSerializer):
+class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
+    class TeamSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         """
         Team serializer
         """
         members = MemberSerializer(many=True, read_only=True)
         team = serializers.PrimaryKeyRelatedField(read_only=True)
-        creator = serializers.SerializerMethodField()
-
-        def get_creator(self, instance):
-            return UserAssignedItemsSerializer(instance.team_creator).data
+        creator = UserAssignedItemsSerializer(source='team_creator', read_only=True)
 
         class Meta:
             model = Team
@@ -73,12 +90,12 @@ class CollectionSerializer(serializers.ModelSerializer):
         read_only_fields = ['date_created', 'lists', 'team']
 
 
-class TeamCollectionsSerializer(serializers.ModelSerializer):
+class TeamCollectionsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Team serializer without linked information about members and groups
     """
 
-    class CollectionSerializer(serializers.ModelSerializer):
+    class CollectionSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
         lists = ListSerializer(read_only=True, many=True)
 
         class Meta:
@@ -93,17 +110,17 @@ class TeamCollectionsSerializer(serializers.ModelSerializer):
         read_only_fields = ('is_group', 'date_created', 'collections')
 
 
-class CollectionListsSerializer(serializers.ModelSerializer):
+class CollectionListsSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
     """
     Collection serializer without linked information about
     """
 
-    class ListSerializer(serializers.ModelSerializer):
+    class ListSerializer(DynamicFieldsMixin, serializers.ModelSerializer):
 
         class Meta:
             model = List
-            fields = ('pk', 'name', 'date_created')
-            read_only_fields = ('collection', 'items', 'date_created')
+            fields = ('pk', 'name', 'date_created', 'position')
+            read_only_fields = ('collection', 'items', 'date_created', 'position')
 
     lists = ListSerializer(read_only=True, many=True)
 
@@ -0,0 +1,152 @@
+"""
+Cache of serialized collection and list trees.
+Entries are keyed by the object, its revision and modification time, so a new revision never reads an old tree.
+Revisions only grow (instance saves never write them, see CountersMixin), and the modification time
+tells apart rows which reuse the id and revision of rolled back or deleted rows.
+The in-process LRU tier is evicted per team by model signals, the optional shared tier
+(TREE_CACHE_ALIAS) relies on the revision keys and TREE_CACHE_TIMEOUT only
+"""
+import threading
+from collections import OrderedDict, Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from profiles.models import Team, Membership, User
+from projects.compiled import compiled_data
+from projects.fieldsets import get_selection, selection_key, normalized
+from projects.models import Collection, List, Item, items_changed
+from projects.revisions import versioned_response
+
+
+class TreeCache:
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.stats = Counter()
+
+    @property
+    def shared(self):
+        alias = settings.TREE_CACHE_ALIAS
+        return caches[alias] if alias else None
+
+    def get(self, name, obj, team_id, build):
+        """returns the tree `name` of obj at its current revision, calling build() on a miss"""
+        if not self.max_size:
+            return build()
+        key = (name, obj._meta.model_name, obj.pk)
+        version = (obj.revision, obj.date_modified)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] == version:
+                self.entries.move_to_end(key)
+                self.stats['hits'] += 1
+                return entry[2]
+        shared = self.shared
+        shared_key = 'tree:{}:{}:{}:{}:{}'.format(*key, obj.revision, obj.date_modified.timestamp())
+        data = shared.get(shared_key) if shared else None
+        if data is None:
+            self.stats['misses'] += 1
+            data = build()
+            if shared:
+                shared.set(shared_key, data, settings.TREE_CACHE_TIMEOUT)
+        else:
+            self.stats['shared_hits'] += 1
+        with self.lock:
+            self.entries[key] = (version, team_id, data)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.stats['evictions'] += 1
+        return data
+
+    def evict(self, team_ids):
+        """drops trees of the teams"""
+        if not self.entries:
+            return
+        team_ids = {pk for pk in team_ids if pk is not None}
+        with self.lock:
+            for key in [key for key, entry in self.entries.items() if entry[1] in team_ids]:
+                del self.entries[key]
+                self.stats['invalidations'] += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.stats.clear()
+
+    def info(self):
+        with self.lock:
+            lookups = self.stats['hits'] + self.stats['shared_hits'] + self.stats['misses']
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.stats['hits'],
+                'shared_hits': self.stats['shared_hits'],
+                'misses': self.stats['misses'],
+                'evictions': self.stats['evictions'],
+                'invalidations': self.stats['invalidations'],
+                'hit_ratio': round((lookups - self.stats['misses']) / lookups, 3) if lookups else None,
+            }
+
+
+tree_cache = TreeCache(settings.TREE_CACHE_SIZE)
+
+
+def versioned_tree(request, name, obj, team_id, serializer_class):
+    """
+    Conditional response with the tree of obj serialized by serializer_class for the fields of the request,
+    cached by revision
+    """
+    selection = get_selection(request)
+
+    def build():
+        if selection.included is None:
+            return compiled_data(serializer_class, type(obj)._default_manager.filter(pk=obj.pk), request)[0]
+        return normalized(selection, serializer_class(serializer_class.prefetch(obj, selection),
+                                                      selection=selection).data)
+
+    return versioned_response(request, obj, lambda: tree_cache.get(f'{name}:{selection_key(request)}', obj,
+                                                                    team_id, build))
+
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def evict_item_trees(sender, instance, **kwargs):
+    team_id = getattr(instance, 'loaded_parents', (None, None))[1]
+    tree_cache.evict([instance.backlog_id, team_id])
+
+
+@receiver(items_changed, sender=Item)
+def evict_bulk_item_trees(sender, teams, **kwargs):
+    tree_cache.evict(teams)
+
+
+@receiver(post_save, sender=List)
+@receiver(post_delete, sender=List)
+def evict_list_trees(sender, instance, **kwargs):
+    tree_cache.evict(Collection.objects.filter(pk=instance.collection_id).values_list('team', flat=True))
+
+
+@receiver(post_save, sender=Collection)
+@receiver(post_delete, sender=Collection)
+@receiver(post_save, sender=Membership)
+@receiver(post_delete, sender=Membership)
+def evict_team_trees(sender, instance, **kwargs):
+    tree_cache.evict([instance.team_id])
+
+
+@receiver(post_save, sender=Team)
+@receiver(post_delete, sender=Team)
+def evict_own_trees(sender, instance, **kwargs):
+    tree_cache.evict([instance.pk])
+
+
+@receiver(post_save, sender=User)
+def evict_user_trees(sender, instance, created, update_fields=None, **kwargs):
+    if created or update_fields is not None and set(update_fields) <= {'last_login', 'password'}:
+        return
+    tree_cache.evict(Membership.objects.filter(user=instance).values_list('team', flat=True))
@@ -1,15 +1,49 @@
+from django.db import transaction
+from django.db.models import Count, Case, When, Value, CharField
+from django.utils import timezone
 from rest_framework import viewsets, permissions, mixins, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.serializers import Serializer
 
 from profiles.models import User, Team
-from projects.models import Collection, List, Item
+from profiles.roles import TeamRoles, get_roles
+from projects.exceptions import BulkItemsException
+from projects.fieldsets import get_selection, normalized
+from projects.models import Collection, List, Item, SearchEntry, items_changed
+from projects.ranks import rank_between, ranks_between, rebalance
+from projects.tree_cache import tree_cache, versioned_tree
 from projects.permissions import IsCollectionTeamMember, IsCollectionTeamManager, IsListTeamMember, IsListTeamManager,\
     IsItemTeamCreator, IsItemTeamManager, IsItemTeamMember
 from projects.serializers import CollectionSerializer, ListSerializer, CollectionListsSerializer, ItemSerializer
 
 
+def move_between(obj, siblings, data, update_fields=()):
+    """
+    Places obj between its siblings {"previous": id or null, "next": id or null}.
+    Only the position and update_fields of obj are written, siblings are rebalanced if there is no rank between them
+    """
+    previous_pk, next_pk = data.get('previous'), data.get('next')
+    neighbours = [pk for pk in (previous_pk, next_pk) if pk is not None]
+    if not all(isinstance(pk, int) for pk in neighbours) or obj.pk in neighbours:
+        return Response(data={'errors': ['"previous" and "next" must be ids of other objects or null']},
+                        status=status.HTTP_400_BAD_REQUEST)
+    for attempt in range(2):
+        positions = dict(siblings.filter(pk__in=neighbours).values_list('pk', 'position'))
+        if len(positions) != len(neighbours):
+            return Response(data={'errors': ['Neighbours are not found']}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            obj.position = rank_between(positions.get(previous_pk, ''), positions.get(next_pk, ''))
+            break
+        except ValueError:
+            if attempt:
+                return Response(data={'errors': ['"previous" must be placed before "next"']},
+                                status=status.HTTP_400_BAD_REQUEST)
+            rebalance(siblings)
+    obj.save(update_fields=['position', *update_fields])
+    return Response({'pk': obj.pk, 'position': obj.position})
+
+
 class CollectionsViewSet(mixins.RetrieveModelMixin,
                          mixins.UpdateModelMixin,
                          mixins.DestroyModelMixin,
@@ -27,8 +61,22 @@ class CollectionsViewSet(mixins.RetrieveModelMixin,
             permission_classes += [IsCollectionTeamMember]
         if self.action in ['destroy', 'update', 'add_list']:
             permission_classes += [IsCollectionTeamManager]
+        if self.action == 'cache_stats':
+            permission_classes += [permissions.IsAdminUser]
         return [permission_class() for permission_class in permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        collection = self.get_object()
+        return versioned_tree(request, 'collection', collection, collection.team_id, self.get_serializer_class())
+
+    @action(detail=False, methods=['get'], url_path='cache_stats', url_name='cache_stats',
+            serializer_class=Serializer)
+    def cache_stats(self, request):
+        """
+        Hit and miss counters of the tree cache of this process
+        """
+        return Response(tree_cache.info())
+
     @action(detail=True, methods=['post'], url_path='add_list', serializer_class=ListSerializer)
     def add_list(self, request, pk=None):
         try:
@@ -47,7 +95,7 @@ class CollectionsViewSet(mixins.RetrieveModelMixin,
     def lists(self, request, pk=None):
         try:
             collection = self.get_object()
-            return Response(CollectionListsSerializer(collection).data)
+            return versioned_tree(request, 'lists', collection, collection.team_id, CollectionListsSerializer)
         except Collection.DoesNotExist:
             return Response(data={'errors': ['Collection is not found']}, status=status.HTTP_404_NOT_FOUND)
 
@@ -59,7 +107,7 @@ class ListViewSet(mixins.RetrieveModelMixin,
     """
         ViewSet to manage lists
         """
-    queryset = List.objects.all()
+    queryset = List.objects.select_related('collection')
     serializer_class = ListSerializer
     http_method_names = ['get', 'post', 'put', 'delete']
 
@@ -67,10 +115,14 @@ class ListViewSet(mixins.RetrieveModelMixin,
         permission_classes = [permissions.IsAuthenticated]
         if self.action in ['retrieve', 'items']:
             permission_classes += [IsListTeamMember]
-        if self.action in ['destroy', 'update', 'add_item']:
+        if self.action in ['destroy', 'update', 'add_item', 'add_items', 'move']:
             permission_classes += [IsListTeamManager]
         return [permission_class() for permission_class in permission_classes]
 
+    def retrieve(self, request, *args, **kwargs):
+        list = self.get_object()
+        return versioned_tree(request, 'list', list, list.collection.team_id, self.get_serializer_class())
+
     @action(detail=True, methods=['post'], url_path='add_item', url_name='add_item',
             serializer_class=ItemSerializer)
     def add_item(self, request, pk=None):
@@ -80,19 +132,40 @@ class ListViewSet(mixins.RetrieveModelMixin,
             item = ItemSerializer(data=request.data)
             if item.is_valid():
                 item = Item(**item.validated_data, creator=request.user,
-                            backlog=list.collection.team.backlog, list=list)
+                            backlog_id=list.collection.team_id, list=list)
                 item.save()
                 return Response(ItemSerializer(item).data)
             return Response(item.errors, status=status.HTTP_400_BAD_REQUEST)
         except List.DoesNotExist:
             return Response(data={'errors': ['List is not found']}, status=status.HTTP_404_NOT_FOUND)
 
+    @action(detail=True, methods=['post'], url_path='add_items', url_name='add_items',
+            serializer_class=ItemSerializer)
+    def add_items(self, request, pk=None):
+        """
+        Creates a list of items in one transaction, errors are reported per item
+        """
+        list = self.get_object()
+        items = ItemSerializer(data=request.data, many=True)
+        if items.is_valid():
+            items.save(creator=request.user, backlog_id=list.collection.team_id, list=list)
+            return Response(items.data)
+        return Response(items.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    @action(detail=True, methods=['put'], url_path='move', url_name='move', serializer_class=Serializer)
+    def move(self, request, pk=None):
+        """
+        Moves the list between lists {"previous": id or null, "next": id or null} of its collection
+        """
+        list = self.get_object()
+        return move_between(list, List.objects.filter(collection_id=list.collection_id), request.data)
+
     @action(detail=True, methods=['get'], url_path='items', url_name='lists',
             serializer_class=Serializer)
     def items(self, request, pk=None):
         try:
             list = self.get_object()
-            return Response(ListSerializer(list).data)
+            return versioned_tree(request, 'items', list, list.collection.team_id, ListSerializer)
         except List.DoesNotExist:
             return Response(data={'errors': ['List is not found']}, status=status.HTTP_404_NOT_FOUND)
 
@@ -108,9 +181,19 @@ class ItemViewSet(mixins.RetrieveModelMixin,
     serializer_class = ItemSerializer
     http_method_names = ['get', 'post', 'put', 'delete']
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action == 'retrieve':
+            queryset = ItemSerializer.setup_eager_loading(queryset, get_selection(self.request))
+        return queryset
+
+    def retrieve(self, request, *args, **kwargs):
+        selection = get_selection(request)
+        return Response(normalized(selection, ItemSerializer(self.get_object(), selection=selection).data))
+
     def get_permissions(self):
         permission_classes = [permissions.IsAuthenticated]
-        if self.action in ['retrieve', 'item_to_list']:
+        if self.action in ['retrieve', 'item_to_list', 'move']:
             permission_classes += [IsItemTeamMember]
         if self.action in ['destroy', 'update', 'assign_to']:
             permission_classes += [IsItemTeamManager]
@@ -122,8 +205,7 @@ class ItemViewSet(mixins.RetrieveModelMixin,
         try:
             item = self.get_object()
             user = User.objects.get(username=username)
-            team = item.backlog.team
-            if team.is_member(user) or user == team.team_creator:
+            if TeamRoles.for_user(user).is_member(item.backlog_id):
                 item.assigned_user = user
                 item.save()
                 return Response(ItemSerializer(item).data)
@@ -140,28 +222,142 @@ class ItemViewSet(mixins.RetrieveModelMixin,
         try:
             item = self.get_object()
             to_team = Team.objects.get(id=int(team_id))
-            if item.backlog.team.team_creator == to_team.team_creator == request.user:
-                if item.backlog != to_team.backlog:
+            roles = get_roles(request)
+            if roles.is_team_creator(item.backlog_id) and roles.is_team_creator(to_team.pk):
+                if item.backlog_id != to_team.pk:
                     item.list = None
-                item.backlog = to_team.backlog
+                item.backlog_id = to_team.pk
                 item.save()
                 return Response(ItemSerializer(item).data)
             return Response(status=status.HTTP_403_FORBIDDEN)
         except Team.DoesNotExist:
-            return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)\
-
+            return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)
 
     @action(detail=True, serializer_class=Serializer, methods=['put'],
             url_path='item_to_list/(?P<list_id>[^/.]+)', url_name='item_to_list')
     def item_to_list(self, request, list_id, pk=None):
         try:
             item = self.get_object()
-            to_list = List.objects.get(id=int(list_id))
-            print(to_list)
-            if to_list.collection.team == item.backlog.team:
-                item.list = to_list
+            to_list = List.objects.select_related('collection').get(id=int(list_id))
+            if to_list.collection.team_id == item.backlog_id:
+                if item.list_id != to_list.pk:
+                    item.list = to_list
+                    item.position = ''
                 item.save()
                 return Response(ItemSerializer(item).data)
             return Response(status=status.HTTP_403_FORBIDDEN)
         except List.DoesNotExist:
-            return Response(data={'errors': ['List is not found']}, status=status.HTTP_404_NOT_FOUND)
\ No newline at end of file
+            return Response(data={'errors': ['List is not found']}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=True, methods=['put'], url_path='move', url_name='move', serializer_class=Serializer)
+    def move(self, request, pk=None):
+        """
+        Moves the item between items {"previous": id or null, "next": id or null} of its list
+        """
+        item = self.get_object()
+        if item.list_id is None:
+            return Response(data={'errors': ['Item is not in a list']}, status=status.HTTP_400_BAD_REQUEST)
+        return move_between(item, Item.objects.filter(list_id=item.list_id), request.data,
+                            update_fields=['last_change'])
+
+    max_bulk_items = 1000
+
+    def get_bulk_items(self, request):
+        """
+        Returns ids of the items from the request body and the id of their team.
+        Checks with one query that all items exist and belong to the same team,
+        items of teams which the user is not a member of are not found
+        """
+        ids = request.data.get('items') if isinstance(request.data, dict) else None
+        if not isinstance(ids, list) or not ids or \
+                not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise BulkItemsException('"items" must be a non-empty list of item ids')
+        ids = list(dict.fromkeys(ids))
+        if len(ids) > self.max_bulk_items:
+            raise BulkItemsException(f'No more than {self.max_bulk_items} items can be changed at once')
+        roles = get_roles(request)
+        teams = [team for team in Item.objects.filter(pk__in=ids).order_by().values('backlog').annotate(
+            count=Count('pk')) if roles.is_member(team['backlog'])]
+        if sum(team['count'] for team in teams) != len(ids):
+            raise BulkItemsException('Some items are not found', status.HTTP_404_NOT_FOUND)
+        if len(teams) != 1:
+            raise BulkItemsException('Items must belong to one team')
+        return ids, teams[0]['backlog']
+
+    def update_items(self, ids, **fields):
+        """single UPDATE of all items, last_change is set explicitly as update() skips auto_now"""
+        with transaction.atomic():
+            items = Item.objects.filter(pk__in=ids)
+            # revisions of the current lists and team are bumped whatever the fields are
+            teams, lists = set(), set()
+            for list_id, team_id in items.order_by().values_list('list', 'backlog').distinct():
+                lists.add(list_id)
+                teams.add(team_id)
+            updated = items.update(last_change=timezone.now(), **fields)
+            if 'backlog_id' in fields:
+                SearchEntry.objects.filter(item_id__in=ids).update(team_id=fields['backlog_id'])
+            items_changed.send(sender=Item, items=ids, teams=teams | {fields.get('backlog_id')},
+                               lists=lists | {getattr(fields.get('list'), 'pk', None)})
+        return Response({'updated': updated, 'items': ids})
+
+    @action(detail=False, methods=['put'], serializer_class=Serializer,
+            url_path='bulk_assign_to/(?P<username>[^/.]+)', url_name='bulk_assign_to')
+    def bulk_assign_to(self, request, username):
+        """
+        Assigns items {"items": [ids]} to the user
+        """
+        try:
+            ids, team_id = self.get_bulk_items(request)
+            if not get_roles(request).is_manager(team_id):
+                return Response(status=status.HTTP_403_FORBIDDEN)
+            user = User.objects.get(username=username)
+            if not TeamRoles.for_user(user).is_member(team_id):
+                return Response(data={'errors': ['User is not from the team. Task can\'t be assigned to user']},
+                                status=status.HTTP_403_FORBIDDEN)
+            return self.update_items(ids, assigned_user=user)
+        except BulkItemsException as e:
+            return Response(data={'errors': [str(e)]}, status=e.status_code)
+        except User.DoesNotExist:
+            return Response(data={'errors': ['User is not found']}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['put'], serializer_class=Serializer,
+            url_path='bulk_to_list/(?P<list_id>[^/.]+)', url_name='bulk_to_list')
+    def bulk_to_list(self, request, list_id):
+        """
+        Moves items {"items": [ids]} to the list of their team
+        """
+        try:
+            ids, team_id = self.get_bulk_items(request)
+            if not get_roles(request).is_member(team_id):
+                return Response(status=status.HTTP_403_FORBIDDEN)
+            to_list = List.objects.select_related('collection').get(id=int(list_id))
+            if to_list.collection.team_id != team_id:
+                return Response(status=status.HTTP_403_FORBIDDEN)
+            last = Item.objects.filter(list=to_list).exclude(pk__in=ids).last_positions([to_list.pk]).get(to_list.pk)
+            ranks = ranks_between(last or '', '', len(ids))
+            position = Case(*[When(pk=pk, then=Value(rank)) for pk, rank in zip(ids, ranks)], output_field=CharField())
+            return self.update_items(ids, list=to_list, position=position)
+        except BulkItemsException as e:
+            return Response(data={'errors': [str(e)]}, status=e.status_code)
+        except (List.DoesNotExist, ValueError):
+            return Response(data={'errors': ['List is not found']}, status=status.HTTP_404_NOT_FOUND)
+
+    @action(detail=False, methods=['put'], serializer_class=Serializer,
+            url_path='bulk_to_team/(?P<team_id>[^/.]+)', url_name='bulk_to_team')
+    def bulk_to_team(self, request, team_id):
+        """
+        Moves items {"items": [ids]} to the backlog of another team of the same creator
+        """
+        try:
+            ids, from_team_id = self.get_bulk_items(request)
+            to_team = Team.objects.only('pk').get(id=int(team_id))
+            roles = get_roles(request)
+            if not (roles.is_team_creator(from_team_id) and roles.is_team_creator(to_team.pk)):
+                return Response(status=status.HTTP_403_FORBIDDEN)
+            if from_team_id == to_team.pk:
+                return self.update_items(ids)
+            return self.update_items(ids, backlog_id=to_team.pk, list=None, position='')
+        except BulkItemsException as e:
+            return Response(data={'errors': [str(e)]}, status=e.status_code)
+        except (Team.DoesNotExist, ValueError):
+            return Response(data={'errors': ['Team is not found']}, status=status.HTTP_404_NOT_FOUND)